@@ -14,6 +14,7 @@ from app.models.user import User, Account
 from app.models.instrument import Instrument
 from app.models.order import Order
 from app.models.trade import Trade, Holding
+from app.models.candle import Candle
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -0,0 +1,28 @@
+"""Add instrument tick_size
+
+Revision ID: 3f1c2a9d7b64
+Revises: 00e780501a3a
+Create Date: 2026-10-18 09:12:31.402118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c2a9d7b64'
+down_revision: Union[str, Sequence[str], None] = '00e780501a3a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('instruments', sa.Column('tick_size', sa.Numeric(precision=18, scale=4), server_default='0.01', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('instruments', 'tick_size')
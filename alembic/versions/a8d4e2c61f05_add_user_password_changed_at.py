@@ -0,0 +1,28 @@
+"""Add users.password_changed_at
+
+Revision ID: a8d4e2c61f05
+Revises: 3f1c2a9d7b64
+Create Date: 2026-10-18 14:05:12.318447
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a8d4e2c61f05'
+down_revision: Union[str, Sequence[str], None] = '3f1c2a9d7b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('password_changed_at', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('users', 'password_changed_at')
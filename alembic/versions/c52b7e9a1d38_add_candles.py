@@ -0,0 +1,40 @@
+"""Add candles
+
+Revision ID: c52b7e9a1d38
+Revises: a8d4e2c61f05
+Create Date: 2026-10-18 15:41:07.902215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c52b7e9a1d38'
+down_revision: Union[str, Sequence[str], None] = 'a8d4e2c61f05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('candles',
+    sa.Column('instrument_id', sa.Integer(), nullable=False),
+    sa.Column('interval_s', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('open', sa.Numeric(precision=18, scale=4), nullable=False),
+    sa.Column('high', sa.Numeric(precision=18, scale=4), nullable=False),
+    sa.Column('low', sa.Numeric(precision=18, scale=4), nullable=False),
+    sa.Column('close', sa.Numeric(precision=18, scale=4), nullable=False),
+    sa.Column('volume', sa.BigInteger(), nullable=False),
+    sa.Column('trades', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['instrument_id'], ['instruments.id'], ),
+    sa.PrimaryKeyConstraint('instrument_id', 'interval_s', 'start_time')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('candles')
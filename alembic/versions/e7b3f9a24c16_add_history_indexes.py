@@ -0,0 +1,48 @@
+"""Add trade owners and history indexes
+
+Revision ID: e7b3f9a24c16
+Revises: c52b7e9a1d38
+Create Date: 2026-10-18 16:05:47.218390
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7b3f9a24c16'
+down_revision: Union[str, Sequence[str], None] = 'c52b7e9a1d38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('trades', sa.Column('buyer_id', sa.Integer(), nullable=True))
+    op.add_column('trades', sa.Column('seller_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('trades_buyer_id_fkey', 'trades', 'users', ['buyer_id'], ['id'])
+    op.create_foreign_key('trades_seller_id_fkey', 'trades', 'users', ['seller_id'], ['id'])
+    op.execute("""
+        UPDATE trades
+        SET buyer_id = buy_orders.user_id, seller_id = sell_orders.user_id
+        FROM orders AS buy_orders, orders AS sell_orders
+        WHERE buy_orders.id = trades.buy_order_id AND sell_orders.id = trades.sell_order_id
+    """)
+    # Built without blocking order entry on large tables
+    with op.get_context().autocommit_block():
+        op.create_index('idx_orders_user_created', 'orders', ['user_id', 'created_at', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('idx_trades_buyer_created', 'trades', ['buyer_id', 'created_at', 'id'], unique=False, postgresql_concurrently=True)
+        op.create_index('idx_trades_seller_created', 'trades', ['seller_id', 'created_at', 'id'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('idx_trades_seller_created', table_name='trades')
+    op.drop_index('idx_trades_buyer_created', table_name='trades')
+    op.drop_index('idx_orders_user_created', table_name='orders')
+    op.drop_constraint('trades_seller_id_fkey', 'trades', type_='foreignkey')
+    op.drop_constraint('trades_buyer_id_fkey', 'trades', type_='foreignkey')
+    op.drop_column('trades', 'seller_id')
+    op.drop_column('trades', 'buyer_id')
@@ -30,6 +30,96 @@ class Settings(BaseSettings):
     SECRET_KEY: str = "super_secret_key_change_me_in_production"
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    # Authenticated principals cached per token, so requests skip the user lookup
+    AUTH_CACHE_TTL_S: int = 60
+    AUTH_CACHE_MAX_ENTRIES: int = 100000
+    # Password hashing runs off the event loop in a "thread" or "process" pool of this size
+    PASSWORD_HASH_POOL: str = "thread"
+    PASSWORD_HASH_WORKERS: int = 4
+
+    # Matching Engine
+    # "price_level" (aggregated levels with FIFO queues) or "sortedlist" (one entry per order)
+    ORDERBOOK_IMPL: str = "price_level"
+    # Levels per side in the initial WebSocket snapshot; later updates are deltas
+    ORDERBOOK_SNAPSHOT_DEPTH: int = 50
+    # > 0: books live in this many worker processes (python -m app.engine.shard),
+    # reached over Unix sockets in ENGINE_SOCKET_DIR. 0 keeps the engine in-process.
+    ENGINE_SHARDS: int = 0
+    # Must be owned by this user with mode 700 (created so if missing)
+    ENGINE_SOCKET_DIR: str = "/tmp/trading-engine"
+    # Append-only journal of engine commands, replayed on startup. None disables it.
+    # Sharded workers each journal to a shard-<n> subdirectory.
+    JOURNAL_DIR: Optional[str] = None
+    JOURNAL_SEGMENT_MB: int = 64
+    # msync after this many records, and at least every JOURNAL_SYNC_INTERVAL_MS
+    JOURNAL_SYNC_EVERY: int = 1000
+    JOURNAL_SYNC_INTERVAL_MS: int = 10
+    # Snapshot all books (and drop the journal segments before it) this often; 0 disables
+    JOURNAL_SNAPSHOT_INTERVAL_S: int = 300
+    # Rebuild books from resting orders in Postgres on startup
+    WARM_START_ON_BOOT: bool = True
+    WARM_START_CONCURRENCY: int = 4
+    # Rows per server-side cursor fetch
+    WARM_START_BATCH: int = 10000
+
+    # WebSocket market data
+    # Events buffered per client before it counts as a slow consumer
+    WS_CLIENT_QUEUE_SIZE: int = 1000
+    # "drop" (discard queued book deltas, keep trades and resend a snapshot) or "disconnect"
+    WS_SLOW_CONSUMER_POLICY: str = "drop"
+    # Upper bound for a client's ?conflate_ms
+    WS_MAX_CONFLATE_MS: int = 5000
+
+    # Redis event publishing
+    # "inline" publishes each order's events before the request returns;
+    # "background" queues them for a flush task (one pipeline per wakeup)
+    EVENT_PUBLISH_MODE: str = "inline"
+    # Events queued in background mode before new ones are dropped
+    EVENT_PUBLISH_MAX_PENDING: int = 100000
+
+    # Candles
+    # Closed bars kept in memory per symbol and interval; older ones are read from the table
+    CANDLE_MEMORY_BARS: int = 120
+    CANDLE_FLUSH_INTERVAL_S: float = 1.0
+    # Closed bars held for retry while the table is unreachable
+    CANDLE_MAX_PENDING: int = 100000
+    # Fold market_simulation_task ticks into candles as well as real fills
+    CANDLE_INCLUDE_SIMULATED: bool = False
+
+    # Pre-trade risk
+    # Check and reserve cash/holdings in memory instead of with a database round trip
+    RISK_LEDGER_ENABLED: bool = False
+    # Re-read loaded balances from Postgres and correct drift this often
+    RISK_RECONCILE_INTERVAL_S: int = 30
+    # Drop users from the ledger after this long without orders
+    RISK_LEDGER_IDLE_S: int = 600
+
+    # Persistence
+    # "sync" settles each order inside its request; "write_behind" acks after
+    # matching and commits batches of orders from a background task. write_behind
+    # requires JOURNAL_DIR and ENGINE_SHARDS=0: the journal recovers acked orders
+    # that were not committed yet when the process died
+    PERSISTENCE_MODE: str = "sync"
+    PERSIST_MAX_BATCH: int = 500
+    PERSIST_MAX_DELAY_MS: int = 5
+    # Queued orders before order entry waits for the pipeline
+    PERSIST_QUEUE_MAX: int = 10000
+    # Order ids reserved from orders_id_seq per round trip
+    PERSIST_ID_BLOCK: int = 1000
+    # Writes that fail for a reason retrying cannot fix are appended here (JSON lines) for replay
+    PERSIST_DEAD_LETTER_PATH: str = "persistence_dead_letter.jsonl"
+
+    # Metrics
+    # How often the event loop lag probe wakes up; 0 disables it
+    LOOP_LAG_INTERVAL_S: float = 0.25
+
+    # Diagnostics
+    # Comma-separated emails allowed to use /admin endpoints; empty disables them
+    ADMIN_EMAILS: str = ""
+    # Order requests slower than this log their per-stage trace; 0 disables it
+    SLOW_ORDER_TRACE_MS: float = 250
+    # Longest profile POST /admin/profile will take
+    PROFILE_MAX_SECONDS: float = 60
 
     class Config:
         env_file = ".env"
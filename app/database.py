@@ -1,6 +1,7 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 from app.config import settings
+from app.metrics import Gauge
 
 engine = create_async_engine(
     settings.DATABASE_URL,
@@ -15,6 +16,17 @@ SessionLocal = async_sessionmaker(
     autoflush=False
 )
 
+# Connection pool, read at scrape time
+DB_POOL_SIZE = Gauge("db_pool_size", "Configured connections in the database pool")
+DB_POOL_CHECKED_OUT = Gauge("db_pool_checked_out", "Database connections in use")
+DB_POOL_IDLE = Gauge("db_pool_idle", "Database connections idle in the pool")
+DB_POOL_OVERFLOW = Gauge("db_pool_overflow", "Database connections opened beyond the pool size")
+_pool = engine.sync_engine.pool
+DB_POOL_SIZE.set_function(_pool.size)
+DB_POOL_CHECKED_OUT.set_function(_pool.checkedout)
+DB_POOL_IDLE.set_function(_pool.checkedin)
+DB_POOL_OVERFLOW.set_function(lambda: max(_pool.overflow(), 0))
+
 class Base(DeclarativeBase):
     pass
 
@@ -1,18 +1,29 @@
+import time
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
+from redis.exceptions import RedisError
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db
 from app.config import settings
+from app.logging_config import logger
 from app.schemas.auth import TokenData
-from app.services.auth import get_user_by_email # circular import potential? No, service imports model/repo
 from app.models.user import User
+from app.services.principal_cache import AUTH_CACHE_HITS, AUTH_CACHE_MISSES, Principal, principal_cache, token_key
 from sqlalchemy import select
-from sqlalchemy.orm import selectinload
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/login")
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+ADMIN_EMAILS = frozenset(email.strip() for email in settings.ADMIN_EMAILS.split(",") if email.strip())
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> Principal:
+    key = token_key(token)
+    principal = principal_cache.get(key)
+    if principal is not None:
+        AUTH_CACHE_HITS.inc()
+        return principal
+    AUTH_CACHE_MISSES.inc()
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -26,11 +37,38 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
         token_data = TokenData(email=email)
     except JWTError:
         raise credentials_exception
-    
-    # We can use the service or direct DB query here. Direct DB query avoids circular dependency if service uses deps.
-    result = await db.execute(select(User).options(selectinload(User.account)).where(User.email == token_data.email))
-    user = result.scalars().first()
-    
+
+    try:
+        revoked = await principal_cache.is_revoked(key)
+    except (RedisError, ConnectionError) as e:
+        # Logouts are only recorded in Redis, so fail closed: a revoked token
+        # must not get through. Cached principals are still served.
+        logger.warning("auth_revocation_check_failed", extra={"fields": {"error": str(e)}})
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Authentication is temporarily unavailable",
+            headers={"Retry-After": "1"},
+        )
+    if revoked:
+        raise credentials_exception
+
+    # Direct DB query avoids a circular dependency if the service uses deps
+    result = await db.execute(
+        select(User.id, User.email, User.password_changed_at).where(User.email == token_data.email)
+    )
+    user = result.first()
     if user is None:
         raise credentials_exception
-    return user
+    # Tokens issued before this release carry whole-second iats; <= still rejects
+    # those from the second of the change, erring on the side of a fresh login
+    if user.password_changed_at is not None and payload.get("iat", 0) <= user.password_changed_at.timestamp():
+        raise credentials_exception
+
+    principal = Principal(id=user.id, email=user.email)
+    principal_cache.put(key, principal, payload["exp"] - time.time())
+    return principal
+
+async def get_admin_user(current_user: Principal = Depends(get_current_user)) -> Principal:
+    if current_user.email not in ADMIN_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return current_user
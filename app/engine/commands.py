@@ -0,0 +1,20 @@
+from dataclasses import dataclass
+from typing import Optional
+from app.models.order import OrderSide, OrderType
+
+# Engine inputs. These are plain values (no ORM objects) so they can be
+# sent to another process or written to a journal.
+
+@dataclass(slots=True)
+class NewOrder:
+    order_id: int
+    user_id: int
+    instrument_id: int
+    side: OrderSide
+    type: OrderType
+    price_ticks: Optional[int]  # None for MARKET orders
+    quantity: int  # Open quantity to match
+
+@dataclass(slots=True)
+class CancelOrder:
+    order_id: int
@@ -0,0 +1,94 @@
+import gc
+from decimal import Decimal
+from typing import Iterable, List, Tuple, Union
+from app.engine.commands import NewOrder, CancelOrder
+from app.engine.orderbook import OrderBook, OrderBookEntry
+from app.engine.price_level_book import PriceLevelOrderBook
+from app.engine.ticks import price_to_ticks
+from app.models.order import OrderSide, OrderType
+
+# Pure, synchronous order execution shared by the in-process engine and the
+# shard worker processes.
+
+# Selectable via settings.ORDERBOOK_IMPL so the two can be benchmarked
+ORDERBOOK_IMPLEMENTATIONS = {
+    "sortedlist": OrderBook,
+    "price_level": PriceLevelOrderBook,
+}
+
+Command = Union[NewOrder, CancelOrder]
+
+def execute_new_order(book: OrderBook, command: NewOrder) -> Tuple[List[dict], int]:
+    """
+    Match a new order against the book and rest any LIMIT remainder.
+    Returns (matches, quantity filled by this call). Pure in-memory, no awaits.
+    """
+    # Sweep the opposite side; fills execute at the maker's price.
+    # The book is modified in place.
+    # Simplified for this exercise: If DB commit fails, we might have drift.
+    # In production, we'd replay from DB event log on restart.
+    limit_price = command.price_ticks if command.type == OrderType.LIMIT else None
+    fills = book.match(command.side, command.quantity, limit_price)
+
+    remaining_qty = command.quantity
+    matches = []
+    for maker_order_id, price, match_qty in fills:
+        if command.side == OrderSide.BUY:
+            buy_order_id, sell_order_id = command.order_id, maker_order_id
+        else:
+            buy_order_id, sell_order_id = maker_order_id, command.order_id
+        matches.append({
+            "buy_order_id": buy_order_id,
+            "sell_order_id": sell_order_id,
+            "instrument_id": command.instrument_id,
+            "price_ticks": price,
+            "quantity": match_qty,
+            "maker_order_id": maker_order_id
+        })
+        remaining_qty -= match_qty
+
+    # If order not fully filled, add to book
+    # Standard NASDAQ: Market orders cancel if no liquidity. Limit orders rest.
+    if remaining_qty > 0 and command.type == OrderType.LIMIT:
+        entry = OrderBookEntry(
+            order_id=command.order_id,
+            user_id=command.user_id,
+            price=command.price_ticks,
+            quantity=remaining_qty
+        )
+        book.add_order(entry, command.side)
+
+    return matches, command.quantity - remaining_qty
+
+def new_order_command(order, tick_size: Decimal) -> NewOrder:
+    """Build the engine command for an ORM Order; the only Decimal -> ticks conversion on the order path."""
+    return NewOrder(
+        order_id=order.id,
+        user_id=order.user_id,
+        instrument_id=order.instrument_id,
+        side=order.side,
+        type=order.type,
+        price_ticks=price_to_ticks(order.price, tick_size) if order.type == OrderType.LIMIT else None,
+        quantity=order.quantity - order.filled_quantity
+    )
+
+def load_sorted_rows(book: OrderBook, side: OrderSide, rows: Iterable[Tuple[int, int, int, int]]):
+    """
+    Bulk-load resting orders (see OrderBook.load_sorted) with the cyclic GC
+    paused. Allocating millions of entries otherwise triggers repeated full
+    collections that cost more than the load itself. The caller's GC state
+    is restored afterwards; freezing the loaded entries is left to warm_start,
+    once every book is in.
+    """
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        book.load_sorted(side, rows)
+    finally:
+        if was_enabled:
+            gc.enable()
+
+def execute_command(book: OrderBook, command: Command):
+    if type(command) is CancelOrder:
+        return book.remove_order(command.order_id)
+    return execute_new_order(book, command)
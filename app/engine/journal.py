@@ -0,0 +1,381 @@
+"""
+Append-only binary journal of matching engine inputs.
+
+Every NEW/CANCEL command is appended, with a global sequence number, before
+it is applied to a book. Records are written into preallocated,
+memory-mapped segment files and msync'ed in batches (every sync_every
+records and every sync interval), so appending costs a memcpy rather than a
+write syscall. Periodic snapshots capture every resting order, after which
+the segments they cover are deleted, so replay is bounded by the snapshot
+interval rather than the age of the exchange.
+
+With PERSISTENCE_MODE=write_behind the journal also tracks what Postgres
+has: PERSISTED records carry the seq up to which every NEW order has been
+committed by the persistence pipeline. Pruning then keeps the newest
+snapshot at or before that watermark, and replay starts from it, so the
+orders after the watermark are re-matched and handed back (see
+ReplayResult.unpersisted) for the pipeline to commit.
+
+Layout (little endian):
+    segment  <first_seq:020d>.journal, records back to back, zero-filled tail
+    record   u32 length | u32 crc32(payload) | payload
+    payload  u8 kind | u64 seq | body
+    NEW      i64 order_id, i64 user_id, i64 instrument_id, u8 side, u8 type,
+             i64 price_ticks (NO_PRICE for MARKET), i64 quantity,
+             i64 tick_size * 10^4, i64 applied at (epoch microseconds),
+             u8 symbol length, symbol
+    CANCEL   i64 order_id, u8 symbol length, symbol
+    PERSISTED u64 watermark seq
+    snapshot snapshot-<last_seq:020d>.snap, see write_snapshot()
+"""
+import asyncio
+import mmap
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from app.engine.commands import NewOrder, CancelOrder
+from app.engine.execution import execute_command, load_sorted_rows
+from app.engine.orderbook import OrderBook
+from app.models.order import OrderSide, OrderType
+
+RECORD_HEADER = struct.Struct("<II")
+PAYLOAD_HEADER = struct.Struct("<BQ")
+NEW_BODY = struct.Struct("<qqqBBqqqqB")
+CANCEL_BODY = struct.Struct("<qB")
+PERSISTED_BODY = struct.Struct("<Q")
+SNAPSHOT_HEADER = struct.Struct("<8sQI")
+SNAPSHOT_BOOK = struct.Struct("<qQQ")
+SNAPSHOT_ENTRY = struct.Struct("<qqqq")
+
+KIND_NEW = 1
+KIND_CANCEL = 2
+KIND_PERSISTED = 3
+NO_PRICE = -(2 ** 63)
+SNAPSHOT_MAGIC = b"TPSNAP01"
+# Numeric(18, 4): tick sizes are stored as integer ten-thousandths
+TICK_SCALE = 10 ** 4
+
+SIDE_CODES = {OrderSide.BUY: 0, OrderSide.SELL: 1}
+SIDES = (OrderSide.BUY, OrderSide.SELL)
+TYPE_CODES = {OrderType.LIMIT: 0, OrderType.MARKET: 1}
+TYPES = (OrderType.LIMIT, OrderType.MARKET)
+
+SEGMENT_SUFFIX = ".journal"
+SNAPSHOT_PREFIX = "snapshot-"
+SNAPSHOT_SUFFIX = ".snap"
+
+def _scaled_tick(tick_size: Decimal) -> int:
+    return int(tick_size * TICK_SCALE)
+
+def _unscaled_tick(scaled: int) -> Decimal:
+    return Decimal(scaled).scaleb(-4)
+
+def list_segments(journal_dir: str) -> List[Tuple[int, str]]:
+    """(first_seq, path) of every segment, oldest first."""
+    segments = []
+    for name in os.listdir(journal_dir):
+        if name.endswith(SEGMENT_SUFFIX):
+            segments.append((int(name[:-len(SEGMENT_SUFFIX)]), os.path.join(journal_dir, name)))
+    return sorted(segments)
+
+def list_snapshots(journal_dir: str) -> List[Tuple[int, str]]:
+    """(last_seq, path) of every snapshot, oldest first."""
+    snapshots = []
+    for name in os.listdir(journal_dir):
+        if name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX):
+            snapshots.append((int(name[len(SNAPSHOT_PREFIX):-len(SNAPSHOT_SUFFIX)]), os.path.join(journal_dir, name)))
+    return sorted(snapshots)
+
+def latest_snapshot(journal_dir: str) -> Optional[Tuple[int, str]]:
+    snapshots = list_snapshots(journal_dir)
+    return snapshots[-1] if snapshots else None
+
+class Journal:
+    def __init__(self, journal_dir: str, next_seq: int = 1, segment_bytes: int = 64 << 20, sync_every: int = 1000,
+                 persisted_seq: Optional[int] = None):
+        self.journal_dir = journal_dir
+        self.segment_bytes = segment_bytes
+        self.sync_every = sync_every
+        self.seq = next_seq - 1  # Last sequence number written
+        # Persisted watermark (write_behind); None when Postgres is not behind the engine
+        self.persisted_seq = persisted_seq
+        self._file = None
+        self._mm: Optional[mmap.mmap] = None
+        self._offset = 0
+        self._unsynced = 0
+        os.makedirs(journal_dir, exist_ok=True)
+        # Always start a fresh segment, so a torn tail from a crash is never appended to
+        self._open_segment()
+
+    def append(self, symbol: str, tick_size: Decimal, command) -> int:
+        symbol_bytes = symbol.encode()
+        if type(command) is CancelOrder:
+            return self._append(KIND_CANCEL, CANCEL_BODY.pack(command.order_id, len(symbol_bytes)) + symbol_bytes)
+        return self._append(KIND_NEW, NEW_BODY.pack(
+            command.order_id, command.user_id, command.instrument_id,
+            SIDE_CODES[command.side], TYPE_CODES[command.type],
+            NO_PRICE if command.price_ticks is None else command.price_ticks,
+            command.quantity, _scaled_tick(tick_size), int(time.time() * 1_000_000), len(symbol_bytes)
+        ) + symbol_bytes)
+
+    def mark_persisted(self, seq: int):
+        """Every NEW record up to `seq` is committed to Postgres (or dead-lettered)."""
+        self.persisted_seq = seq
+        self._append(KIND_PERSISTED, PERSISTED_BODY.pack(seq))
+
+    def _append(self, kind: int, body: bytes) -> int:
+        self.seq += 1
+        payload = PAYLOAD_HEADER.pack(kind, self.seq) + body
+
+        record_size = RECORD_HEADER.size + len(payload)
+        # Leave room for a zeroed header after the record, which marks the end
+        if self._offset + record_size + RECORD_HEADER.size > self.segment_bytes:
+            self._roll()
+        mm = self._mm
+        RECORD_HEADER.pack_into(mm, self._offset, len(payload), zlib.crc32(payload))
+        mm[self._offset + RECORD_HEADER.size:self._offset + record_size] = payload
+        self._offset += record_size
+
+        self._unsynced += 1
+        if self._unsynced >= self.sync_every:
+            self.sync()
+        return self.seq
+
+    def sync(self):
+        if self._unsynced and self._mm is not None:
+            self._mm.flush()
+            self._unsynced = 0
+
+    def close(self):
+        if self._mm is not None:
+            self.sync()
+            self._mm.close()
+            self._file.close()
+            self._mm = self._file = None
+
+    def write_snapshot(self, books: Dict[str, OrderBook]) -> str:
+        """
+        Write every resting order (in priority order) as of self.seq, then
+        delete the segments and older snapshots it makes redundant.
+        Must be called between commands, i.e. without awaiting in between.
+        """
+        self.sync()
+        last_seq = self.seq
+        path = os.path.join(self.journal_dir, f"{SNAPSHOT_PREFIX}{last_seq:020d}{SNAPSHOT_SUFFIX}")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, last_seq, len(books)))
+            for symbol, book in books.items():
+                symbol_bytes = symbol.encode()
+                bids = list(book.resting_orders(OrderSide.BUY))
+                asks = list(book.resting_orders(OrderSide.SELL))
+                f.write(bytes([len(symbol_bytes)]) + symbol_bytes)
+                f.write(SNAPSHOT_BOOK.pack(_scaled_tick(book.tick_size), len(bids), len(asks)))
+                pack = SNAPSHOT_ENTRY.pack
+                f.write(b"".join(pack(e.order_id, e.user_id, e.price, e.quantity) for e in bids))
+                f.write(b"".join(pack(e.order_id, e.user_id, e.price, e.quantity) for e in asks))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        self._prune(last_seq)
+        return path
+
+    async def run_background(self, sync_interval: float, snapshot_interval: float,
+                             get_books: Callable[[], Dict[str, OrderBook]]):
+        """Periodic msync, plus a snapshot every snapshot_interval seconds (0 disables)."""
+        last_snapshot = time.monotonic()
+        while True:
+            await asyncio.sleep(sync_interval)
+            self.sync()
+            if snapshot_interval and time.monotonic() - last_snapshot >= snapshot_interval:
+                self.write_snapshot(get_books())
+                last_snapshot = time.monotonic()
+
+    def _open_segment(self):
+        path = os.path.join(self.journal_dir, f"{self.seq + 1:020d}{SEGMENT_SUFFIX}")
+        self._file = open(path, "w+b")
+        self._file.truncate(self.segment_bytes)
+        self._mm = mmap.mmap(self._file.fileno(), self.segment_bytes)
+        self._offset = 0
+
+    def _roll(self):
+        self.close()
+        self._open_segment()
+
+    def _prune(self, snapshot_seq: int):
+        if self.persisted_seq is not None:
+            # Orders after the watermark must be re-matched on recovery, from a
+            # snapshot taken before them
+            kept = [seq for seq, _ in list_snapshots(self.journal_dir) if seq <= self.persisted_seq]
+            if not kept:
+                return
+            snapshot_seq = kept[-1]
+        segments = list_segments(self.journal_dir)
+        # A segment is redundant once the next one starts at or before snapshot_seq + 1
+        for (first_seq, path), (next_first, _) in zip(segments, segments[1:]):
+            if next_first <= snapshot_seq + 1:
+                os.unlink(path)
+        for seq, path in list_snapshots(self.journal_dir):
+            if seq < snapshot_seq:
+                os.unlink(path)
+
+def iter_records(path: str) -> Iterator[Tuple[int, int, bytes]]:
+    """Yield (kind, seq, body) for each intact record in a segment, stopping at the end or a torn record."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            offset = 0
+            header_size = RECORD_HEADER.size
+            payload_header_size = PAYLOAD_HEADER.size
+            while offset + header_size <= size:
+                length, crc = RECORD_HEADER.unpack_from(mm, offset)
+                start = offset + header_size
+                if length == 0 or start + length > size:
+                    break
+                payload = mm[start:start + length]
+                if zlib.crc32(payload) != crc:
+                    break
+                kind, seq = PAYLOAD_HEADER.unpack_from(payload)
+                yield kind, seq, payload[payload_header_size:]
+                offset = start + length
+
+@dataclass(slots=True)
+class ReplayedOrder:
+    """A NEW record after the persisted watermark, with what re-matching it produced."""
+    seq: int
+    symbol: str
+    tick_size: Decimal
+    command: NewOrder
+    matches: List[dict]
+    filled: int
+    applied_at: float # Epoch seconds
+
+@dataclass
+class ReplayResult:
+    books: Dict[str, OrderBook] = field(default_factory=dict)
+    last_seq: int = 0
+    snapshot_seq: int = 0
+    snapshot_orders: int = 0
+    events: int = 0
+    seconds: float = 0.0
+    # With track_persisted: the watermark, and the orders after it in journal order
+    persisted_seq: Optional[int] = None
+    unpersisted: List[ReplayedOrder] = field(default_factory=list)
+
+def load_snapshot(path: str, book_factory) -> Tuple[Dict[str, OrderBook], int, int]:
+    """Returns (books, last_seq, resting order count)."""
+    books = {}
+    count = 0
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, last_seq, n_books = SNAPSHOT_HEADER.unpack_from(data, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError(f"{path} is not an engine snapshot")
+    offset = SNAPSHOT_HEADER.size
+    for _ in range(n_books):
+        symbol_len = data[offset]
+        symbol = data[offset + 1:offset + 1 + symbol_len].decode()
+        offset += 1 + symbol_len
+        scaled_tick, n_bids, n_asks = SNAPSHOT_BOOK.unpack_from(data, offset)
+        offset += SNAPSHOT_BOOK.size
+        book = books[symbol] = book_factory(symbol, _unscaled_tick(scaled_tick))
+        for side, n in ((OrderSide.BUY, n_bids), (OrderSide.SELL, n_asks)):
+            end = offset + n * SNAPSHOT_ENTRY.size
+            load_sorted_rows(book, side, SNAPSHOT_ENTRY.iter_unpack(data[offset:end]))
+            offset = end
+            count += n
+    return books, last_seq, count
+
+def replay(journal_dir: str, book_factory, track_persisted: bool = False) -> ReplayResult:
+    """
+    Rebuild every book from the latest snapshot plus the journal records after it.
+    Each record is re-applied with execute_command, the function the engine
+    applies live commands with, so replay cannot drift from live matching.
+
+    With track_persisted, replay starts from the oldest snapshot instead (the
+    newest one at or before the watermark, see Journal._prune) and collects
+    the orders after the final watermark with their fills.
+    """
+    started = time.perf_counter()
+    result = ReplayResult()
+    if not os.path.isdir(journal_dir):
+        if track_persisted:
+            result.persisted_seq = 0
+        return result
+
+    snapshots = list_snapshots(journal_dir)
+    if snapshots:
+        snapshot = snapshots[0] if track_persisted else snapshots[-1]
+        result.books, result.snapshot_seq, result.snapshot_orders = load_snapshot(snapshot[1], book_factory)
+    books = result.books
+    after_seq = last_seq = result.snapshot_seq
+    events = 0
+    # Everything in the snapshot was persisted, or it would not have been kept
+    persisted_seq = result.snapshot_seq
+    unpersisted = deque()
+
+    new_unpack = NEW_BODY.unpack_from
+    cancel_unpack = CANCEL_BODY.unpack_from
+    new_size = NEW_BODY.size
+    cancel_size = CANCEL_BODY.size
+    for _, path in list_segments(journal_dir):
+        for kind, seq, body in iter_records(path):
+            if seq <= after_seq:
+                continue
+            if kind == KIND_NEW:
+                (order_id, user_id, instrument_id, side_code, type_code, price_ticks,
+                 quantity, scaled_tick, applied_us, symbol_len) = new_unpack(body)
+                symbol = body[new_size:new_size + symbol_len].decode()
+                book = books.get(symbol)
+                if book is None:
+                    book = books[symbol] = book_factory(symbol, _unscaled_tick(scaled_tick))
+                command = NewOrder(
+                    order_id=order_id, user_id=user_id, instrument_id=instrument_id,
+                    side=SIDES[side_code], type=TYPES[type_code],
+                    price_ticks=None if price_ticks == NO_PRICE else price_ticks, quantity=quantity
+                )
+                matches, filled = execute_command(book, command)
+                if track_persisted and seq > persisted_seq:
+                    unpersisted.append(ReplayedOrder(
+                        seq, symbol, book.tick_size, command, matches, filled, applied_us / 1_000_000
+                    ))
+            elif kind == KIND_PERSISTED:
+                # Written after the base snapshot, so possibly still below it
+                persisted_seq = max(persisted_seq, PERSISTED_BODY.unpack_from(body)[0])
+                while unpersisted and unpersisted[0].seq <= persisted_seq:
+                    unpersisted.popleft()
+                last_seq = seq
+                continue
+            else:
+                order_id, symbol_len = cancel_unpack(body)
+                symbol = body[cancel_size:cancel_size + symbol_len].decode()
+                book = books.get(symbol)
+                if book is not None:
+                    execute_command(book, CancelOrder(order_id=order_id))
+            last_seq = seq
+            events += 1
+
+    result.last_seq = last_seq
+    result.events = events
+    if track_persisted:
+        result.persisted_seq = persisted_seq
+        result.unpersisted = list(unpersisted)
+    result.seconds = time.perf_counter() - started
+    return result
+
+def recover(journal_dir: str, book_factory, segment_bytes: int = 64 << 20, sync_every: int = 1000,
+            track_persisted: bool = False) -> Tuple[Journal, ReplayResult]:
+    """Replay an existing journal (if any) and open it for appending after the last recovered record."""
+    result = replay(journal_dir, book_factory, track_persisted)
+    journal = Journal(
+        journal_dir, next_seq=result.last_seq + 1, segment_bytes=segment_bytes, sync_every=sync_every,
+        persisted_seq=result.persisted_seq
+    )
+    return journal, result
@@ -1,60 +1,267 @@
+import sys
+from abc import ABC, abstractmethod
+from decimal import Decimal
 from sortedcontainers import SortedList
-from typing import List, Optional, Tuple
-from datetime import datetime
+from typing import Iterable, Iterator, List, Optional, Tuple
 from dataclasses import dataclass, field
-from app.models.order import OrderSide, OrderType, OrderStatus
+from app.engine.ticks import DEFAULT_TICK_SIZE
+from app.models.order import OrderSide
 
-@dataclass
+# Size of an int object outside the small-int cache (order ids, large prices)
+INT_BYTES = sys.getsizeof(2 ** 40)
+
+@dataclass(slots=True, eq=False)
 class OrderBookEntry:
+    """
+    A resting order. Slotted (no per-instance __dict__) and compared by
+    identity, since an entry is only ever looked up through the book's index.
+    Only LIMIT orders rest, so the order type is not stored, and time
+    priority is the book-assigned arrival sequence rather than a float timestamp.
+    """
     order_id: int
     user_id: int
-    price: float  # Use float for in-memory speed, convert to Decimal for DB
+    price: int  # Integer ticks, converted to Decimal with the book's tick_size at the boundary
     quantity: int
-    timestamp: float
-    order_type: OrderType
+    seq: int = 0  # Arrival sequence, assigned by OrderBook (the FIFO queue links carry it in PriceLevelOrderBook)
+    # Intrusive FIFO queue links, used by PriceLevelOrderBook for O(1) unlinking
+    level: Optional["PriceLevel"] = field(default=None, repr=False)
+    prev: Optional["OrderBookEntry"] = field(default=None, repr=False)
+    next: Optional["OrderBookEntry"] = field(default=None, repr=False)
+
+def entry_bytes(count: int) -> int:
+    """Approximate bytes held by `count` entries: the fixed-size slotted object plus its order_id and user_id ints."""
+    return count * (sys.getsizeof(OrderBookEntry(0, 0, 0, 0)) + 2 * INT_BYTES)
+
+def sortedlist_bytes(sl: SortedList) -> int:
+    """Container overhead of a SortedList/SortedKeyList (not the items themselves)."""
+    total = sys.getsizeof(sl) + sys.getsizeof(sl._lists) + sys.getsizeof(sl._maxes) + sys.getsizeof(sl._index)
+    total += sum(sys.getsizeof(sub) for sub in sl._lists)
+    keys = getattr(sl, "_keys", None)
+    if keys is not None:
+        total += sys.getsizeof(keys) + sum(sys.getsizeof(sub) for sub in keys)
+    return total
+
+# A fill produced by OrderBook.match: (maker_order_id, price, quantity)
+Fill = Tuple[int, int, int]
+
+class DepthDeltaTracker(ABC):
+    """
+    Incremental L2 publishing shared by both book implementations.
+
+    Books call _mark_level() whenever the aggregate quantity at a price
+    changes (add, fill, cancel). drain_deltas() then reports only those
+    levels, with their new absolute quantity (0 = level removed), under a
+    per-symbol sequence number. Because each change is absolute, a client
+    that keeps the highest seq seen per level converges even if two updates
+    are delivered out of order.
+
+    Subclasses provide level_quantity() and depth(); instantiating a book
+    that lacks either fails at construction.
+    """
+
+    def _init_depth_tracking(self):
+        self.depth_seq = 0
+        self._dirty_levels: dict = {} # (side, price) -> None, insertion ordered
+
+    def _mark_level(self, side: OrderSide, price: int):
+        self._dirty_levels[(side, price)] = None
+
+    @abstractmethod
+    def level_quantity(self, side: OrderSide, price: int) -> int:
+        """Aggregate resting quantity at a price in ticks (0 if the level is empty)."""
+
+    @abstractmethod
+    def depth(self, depth: int = 10) -> dict:
+        """Top `depth` levels per side: {"bids": [...], "asks": [...]}."""
+
+    def drain_deltas(self) -> Optional[dict]:
+        if not self._dirty_levels:
+            return None
+        self.depth_seq += 1
+        tick_size = self.tick_size
+        changes = [
+            {
+                "side": "bid" if side == OrderSide.BUY else "ask",
+                "price": float(price * tick_size),
+                "qty": self.level_quantity(side, price)
+            }
+            for side, price in self._dirty_levels
+        ]
+        self._dirty_levels.clear()
+        return {"seq": self.depth_seq, "changes": changes}
+
+    def snapshot(self, depth: int = 10) -> dict:
+        # Levels changed since the last drain are already included here and
+        # will be re-sent with a higher seq; applying them twice is harmless.
+        return {"seq": self.depth_seq, **self.depth(depth)}
 
-    def __eq__(self, other):
-        return self.order_id == other.order_id
+def merge_depth_updates(pending: Optional[dict], update: Optional[dict]) -> Optional[dict]:
+    # Changes are absolute per level, so the later update simply wins
+    if pending is None:
+        return update
+    if update is None:
+        return pending
+    changes = {(c["side"], c["price"]): c for c in pending["changes"]}
+    for change in update["changes"]:
+        changes[(change["side"], change["price"])] = change
+    return {"seq": update["seq"], "changes": list(changes.values())}
 
-class OrderBook:
-    def __init__(self, symbol: str):
+class OrderBook(DepthDeltaTracker):
+    def __init__(self, symbol: str, tick_size: Decimal = DEFAULT_TICK_SIZE):
         self.symbol = symbol
+        self.tick_size = tick_size
         # Asks: Sell orders, sorted by Price ASC, then Time ASC
-        self.asks = SortedList(key=lambda x: (x.price, x.timestamp))
+        self.asks = SortedList(key=lambda x: (x.price, x.seq))
         # Bids: Buy orders, sorted by Price DESC, then Time ASC
-        # key: (-price, timestamp) ensures highest price comes first
-        self.bids = SortedList(key=lambda x: (-x.price, x.timestamp))
-        
+        # key: (-price, seq) ensures highest price comes first
+        self.bids = SortedList(key=lambda x: (-x.price, x.seq))
+        self._seq = 0
+
         # Fast lookup by order_id to support cancellation
         self.orders = {} # order_id -> OrderBookEntry
+        self._sides = {} # order_id -> OrderSide, so removal searches only one side
+
+        # Aggregate quantity per price, maintained incrementally for L2 depth
+        self.bid_qty = {} # price -> qty
+        self.ask_qty = {} # price -> qty
+        self._init_depth_tracking()
 
     def add_order(self, order: OrderBookEntry, side: OrderSide):
+        self._seq += 1
+        order.seq = self._seq
         self.orders[order.order_id] = order
+        self._sides[order.order_id] = side
         if side == OrderSide.BUY:
             self.bids.add(order)
+            self.bid_qty[order.price] = self.bid_qty.get(order.price, 0) + order.quantity
         else:
             self.asks.add(order)
+            self.ask_qty[order.price] = self.ask_qty.get(order.price, 0) + order.quantity
+        self._mark_level(side, order.price)
+
+    def load_sorted(self, side: OrderSide, rows: Iterable[Tuple[int, int, int, int]]):
+        """
+        Bulk-load (order_id, user_id, price, quantity) rows that are already in
+        priority order, behind anything resting, with one SortedList update
+        instead of an insort per order. Levels are not marked for depth deltas.
+        """
+        level_qty = self.bid_qty if side == OrderSide.BUY else self.ask_qty
+        entries = []
+        for order_id, user_id, price, quantity in rows:
+            self._seq += 1
+            entry = OrderBookEntry(order_id, user_id, price, quantity, self._seq)
+            entries.append(entry)
+            self.orders[order_id] = entry
+            self._sides[order_id] = side
+            level_qty[price] = level_qty.get(price, 0) + quantity
+        (self.bids if side == OrderSide.BUY else self.asks).update(entries)
 
     def remove_order(self, order_id: int) -> Optional[OrderBookEntry]:
         if order_id in self.orders:
             order = self.orders.pop(order_id)
-            # Try removing from both, though we should know the side. 
-            # Optimization: could store side in map.
-            try:
+            side = self._sides.pop(order_id)
+            if side == OrderSide.BUY:
                 self.bids.remove(order)
-            except ValueError:
+                self._reduce_level(self.bid_qty, order.price, order.quantity)
+            else:
                 self.asks.remove(order)
+                self._reduce_level(self.ask_qty, order.price, order.quantity)
+            self._mark_level(side, order.price)
             return order
         return None
 
+    def level_quantity(self, side: OrderSide, price: int) -> int:
+        return (self.bid_qty if side == OrderSide.BUY else self.ask_qty).get(price, 0)
+
+    def level_count(self) -> int:
+        return len(self.bid_qty) + len(self.ask_qty)
+
+    def _reduce_level(self, level_qty: dict, price: int, quantity: int):
+        remaining = level_qty[price] - quantity
+        if remaining:
+            level_qty[price] = remaining
+        else:
+            del level_qty[price]
+
     def get_best_bid(self) -> Optional[OrderBookEntry]:
         return self.bids[0] if self.bids else None
 
     def get_best_ask(self) -> Optional[OrderBookEntry]:
         return self.asks[0] if self.asks else None
-        
+
+    def match(self, side: OrderSide, quantity: int, limit_price: Optional[int] = None) -> List[Fill]:
+        """
+        Sweep the opposite side of the book for an incoming order of `side`.
+        Makers are filled in price-time priority and removed once exhausted.
+        Prices are in ticks. A limit_price of None means the order takes any price (MARKET).
+        """
+        fills = []
+        remaining = quantity
+        if side == OrderSide.BUY:
+            # Match against Asks (Sells), lowest price first
+            while remaining > 0 and self.asks:
+                best_ask = self.asks[0]
+                if limit_price is not None and best_ask.price > limit_price:
+                    break
+                match_qty = min(remaining, best_ask.quantity)
+                fills.append((best_ask.order_id, best_ask.price, match_qty))
+                remaining -= match_qty
+                best_ask.quantity -= match_qty
+                self._reduce_level(self.ask_qty, best_ask.price, match_qty)
+                self._mark_level(OrderSide.SELL, best_ask.price)
+                if best_ask.quantity == 0:
+                    self.asks.remove(best_ask)
+                    del self.orders[best_ask.order_id]
+                    del self._sides[best_ask.order_id]
+        else:
+            # Match against Bids (Buys), highest price first
+            while remaining > 0 and self.bids:
+                best_bid = self.bids[0]
+                if limit_price is not None and best_bid.price < limit_price:
+                    break
+                match_qty = min(remaining, best_bid.quantity)
+                fills.append((best_bid.order_id, best_bid.price, match_qty))
+                remaining -= match_qty
+                best_bid.quantity -= match_qty
+                self._reduce_level(self.bid_qty, best_bid.price, match_qty)
+                self._mark_level(OrderSide.BUY, best_bid.price)
+                if best_bid.quantity == 0:
+                    self.bids.remove(best_bid)
+                    del self.orders[best_bid.order_id]
+                    del self._sides[best_bid.order_id]
+        return fills
+
     def depth(self, depth: int = 10) -> dict:
         return {
-            "bids": [{"price": b.price, "qty": b.quantity} for b in self.bids[:depth]],
-            "asks": [{"price": a.price, "qty": a.quantity} for a in self.asks[:depth]]
+            "bids": self._side_depth(self.bids, self.bid_qty, depth),
+            "asks": self._side_depth(self.asks, self.ask_qty, depth)
         }
+
+    def resting_orders(self, side: OrderSide) -> Iterator[OrderBookEntry]:
+        """Resting orders of one side in priority order (best price, then earliest)."""
+        return iter(self.bids if side == OrderSide.BUY else self.asks)
+
+    def _side_depth(self, entries: SortedList, level_qty: dict, depth: int) -> list:
+        # Walk entries in priority order until `depth` distinct prices are seen
+        tick_size = self.tick_size
+        levels = []
+        last_price = None
+        for entry in entries:
+            if entry.price != last_price:
+                if len(levels) == depth:
+                    break
+                last_price = entry.price
+                levels.append({"price": float(last_price * tick_size), "qty": level_qty[last_price]})
+        return levels
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by this book's resting orders and indexes."""
+        n = len(self.orders)
+        # Each SortedKeyList item also carries a (price, seq) key tuple, and its seq int
+        key_bytes = n * (sys.getsizeof((0, 0)) + 2 * INT_BYTES)
+        return (
+            entry_bytes(n) + key_bytes
+            + sys.getsizeof(self.orders) + sys.getsizeof(self._sides)
+            + sys.getsizeof(self.bid_qty) + sys.getsizeof(self.ask_qty)
+            + sortedlist_bytes(self.bids) + sortedlist_bytes(self.asks)
+        )
@@ -0,0 +1,235 @@
+import sys
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from sortedcontainers import SortedList
+from app.engine.orderbook import DepthDeltaTracker, OrderBookEntry, Fill, INT_BYTES, entry_bytes, sortedlist_bytes
+from app.engine.ticks import DEFAULT_TICK_SIZE
+from app.models.order import OrderSide
+
+class PriceLevel:
+    """
+    All resting orders at one price, in arrival (FIFO) order.
+    The queue is an intrusive doubly linked list through the entries'
+    prev/next fields, so any order can be unlinked in O(1).
+    """
+    __slots__ = ("price", "side", "head", "tail", "total_qty")
+
+    def __init__(self, price: int, side: OrderSide):
+        self.price = price
+        self.side = side
+        self.head: Optional[OrderBookEntry] = None
+        self.tail: Optional[OrderBookEntry] = None
+        self.total_qty = 0
+
+    def append(self, order: OrderBookEntry):
+        order.level = self
+        order.prev = self.tail
+        order.next = None
+        if self.tail is None:
+            self.head = order
+        else:
+            self.tail.next = order
+        self.tail = order
+        self.total_qty += order.quantity
+
+    def unlink(self, order: OrderBookEntry):
+        if order.prev is None:
+            self.head = order.next
+        else:
+            order.prev.next = order.next
+        if order.next is None:
+            self.tail = order.prev
+        else:
+            order.next.prev = order.prev
+        order.level = order.prev = order.next = None
+        self.total_qty -= order.quantity
+
+class PriceLevelOrderBook(DepthDeltaTracker):
+    """
+    Order book organised as price levels instead of individual orders.
+
+    Each side keeps a dict of price -> PriceLevel plus a SortedList of the
+    bare tick prices, so sorting compares plain ints and only happens once per
+    level rather than once per order. The best level of each side is cached,
+    matching sweeps whole levels, and depth() reads the level aggregates.
+    Drop-in replacement for OrderBook as far as MatchingEngine is concerned.
+
+    `orders` maps order_id to the entry, which links back to its level (and
+    therefore side) and its queue neighbours, so cancellation never searches.
+    """
+
+    def __init__(self, symbol: str, tick_size: Decimal = DEFAULT_TICK_SIZE):
+        self.symbol = symbol
+        self.tick_size = tick_size
+        self.bid_levels: Dict[int, PriceLevel] = {}
+        self.ask_levels: Dict[int, PriceLevel] = {}
+        # Both ascending: best bid is the last price, best ask the first.
+        self.bid_prices = SortedList()
+        self.ask_prices = SortedList()
+        self._best_bid: Optional[PriceLevel] = None
+        self._best_ask: Optional[PriceLevel] = None
+
+        # Fast lookup by order_id to support cancellation
+        self.orders: Dict[int, OrderBookEntry] = {}
+        self._init_depth_tracking()
+
+    def add_order(self, order: OrderBookEntry, side: OrderSide):
+        self.orders[order.order_id] = order
+        levels = self.bid_levels if side == OrderSide.BUY else self.ask_levels
+        level = levels.get(order.price)
+        if level is None:
+            level = self._new_level(order.price, side)
+        level.append(order)
+        self._mark_level(side, order.price)
+
+    def load_sorted(self, side: OrderSide, rows: Iterable[Tuple[int, int, int, int]]):
+        """
+        Bulk-load (order_id, user_id, price, quantity) rows that are already in
+        priority order, behind anything resting. New prices go into the index
+        in one update, and levels are not marked for depth deltas (subscribers
+        start from a snapshot).
+        """
+        levels = self.bid_levels if side == OrderSide.BUY else self.ask_levels
+        orders = self.orders
+        new_prices = []
+        level = None
+        for order_id, user_id, price, quantity in rows:
+            if level is None or level.price != price:
+                level = levels.get(price)
+                if level is None:
+                    level = levels[price] = PriceLevel(price, side)
+                    new_prices.append(price)
+            entry = OrderBookEntry(order_id, user_id, price, quantity)
+            orders[order_id] = entry
+            level.append(entry)
+        if side == OrderSide.BUY:
+            self.bid_prices.update(new_prices)
+            self._best_bid = levels[self.bid_prices[-1]] if self.bid_prices else None
+        else:
+            self.ask_prices.update(new_prices)
+            self._best_ask = levels[self.ask_prices[0]] if self.ask_prices else None
+
+    def remove_order(self, order_id: int) -> Optional[OrderBookEntry]:
+        """O(1) unless this empties the level, which also drops its price from the index."""
+        order = self.orders.pop(order_id, None)
+        if order is None:
+            return None
+        level = order.level
+        level.unlink(order)
+        self._mark_level(level.side, level.price)
+        if level.head is None:
+            self._drop_level(level)
+        return order
+
+    def level_quantity(self, side: OrderSide, price: int) -> int:
+        level = (self.bid_levels if side == OrderSide.BUY else self.ask_levels).get(price)
+        return level.total_qty if level else 0
+
+    def level_count(self) -> int:
+        return len(self.bid_levels) + len(self.ask_levels)
+
+    def get_best_bid(self) -> Optional[OrderBookEntry]:
+        return self._best_bid.head if self._best_bid else None
+
+    def get_best_ask(self) -> Optional[OrderBookEntry]:
+        return self._best_ask.head if self._best_ask else None
+
+    def match(self, side: OrderSide, quantity: int, limit_price: Optional[int] = None) -> List[Fill]:
+        fills = []
+        remaining = quantity
+        if side == OrderSide.BUY:
+            while remaining > 0:
+                level = self._best_ask
+                if level is None or (limit_price is not None and level.price > limit_price):
+                    break
+                remaining = self._sweep_level(level, remaining, fills)
+                if level.head is None:
+                    self._drop_level(level)
+        else:
+            while remaining > 0:
+                level = self._best_bid
+                if level is None or (limit_price is not None and level.price < limit_price):
+                    break
+                remaining = self._sweep_level(level, remaining, fills)
+                if level.head is None:
+                    self._drop_level(level)
+        return fills
+
+    def depth(self, depth: int = 10) -> dict:
+        bid_levels = self.bid_levels
+        ask_levels = self.ask_levels
+        tick_size = self.tick_size
+        n_bids = len(self.bid_prices)
+        return {
+            "bids": [
+                {"price": float(p * tick_size), "qty": bid_levels[p].total_qty}
+                for p in self.bid_prices.islice(max(n_bids - depth, 0), reverse=True)
+            ],
+            "asks": [
+                {"price": float(p * tick_size), "qty": ask_levels[p].total_qty}
+                for p in self.ask_prices.islice(0, depth)
+            ]
+        }
+
+    def resting_orders(self, side: OrderSide) -> Iterator[OrderBookEntry]:
+        """Resting orders of one side in priority order (best price, then earliest)."""
+        if side == OrderSide.BUY:
+            levels, prices = self.bid_levels, reversed(self.bid_prices)
+        else:
+            levels, prices = self.ask_levels, iter(self.ask_prices)
+        for price in prices:
+            order = levels[price].head
+            while order is not None:
+                yield order
+                order = order.next
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by this book's resting orders, levels and indexes."""
+        n_levels = len(self.bid_levels) + len(self.ask_levels)
+        level_bytes = n_levels * (sys.getsizeof(PriceLevel(0, OrderSide.BUY)) + INT_BYTES)
+        return (
+            entry_bytes(len(self.orders)) + level_bytes
+            + sys.getsizeof(self.orders) + sys.getsizeof(self.bid_levels) + sys.getsizeof(self.ask_levels)
+            + sortedlist_bytes(self.bid_prices) + sortedlist_bytes(self.ask_prices)
+        )
+
+    def _sweep_level(self, level: PriceLevel, remaining: int, fills: List[Fill]) -> int:
+        price = level.price
+        self._mark_level(level.side, price)
+        while remaining > 0 and level.head is not None:
+            maker = level.head
+            match_qty = min(remaining, maker.quantity)
+            fills.append((maker.order_id, price, match_qty))
+            remaining -= match_qty
+            maker.quantity -= match_qty
+            level.total_qty -= match_qty
+            if maker.quantity == 0:
+                level.unlink(maker)
+                del self.orders[maker.order_id]
+        return remaining
+
+    def _new_level(self, price: int, side: OrderSide) -> PriceLevel:
+        level = PriceLevel(price, side)
+        if side == OrderSide.BUY:
+            self.bid_levels[price] = level
+            self.bid_prices.add(price)
+            if self._best_bid is None or price > self._best_bid.price:
+                self._best_bid = level
+        else:
+            self.ask_levels[price] = level
+            self.ask_prices.add(price)
+            if self._best_ask is None or price < self._best_ask.price:
+                self._best_ask = level
+        return level
+
+    def _drop_level(self, level: PriceLevel):
+        if level.side == OrderSide.BUY:
+            del self.bid_levels[level.price]
+            self.bid_prices.remove(level.price)
+            if level is self._best_bid:
+                self._best_bid = self.bid_levels[self.bid_prices[-1]] if self.bid_prices else None
+        else:
+            del self.ask_levels[level.price]
+            self.ask_prices.remove(level.price)
+            if level is self._best_ask:
+                self._best_ask = self.ask_levels[self.ask_prices[0]] if self.ask_prices else None
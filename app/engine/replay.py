@@ -0,0 +1,29 @@
+"""
+Rebuild the order books from an engine journal and report replay speed.
+
+    python -m app.engine.replay /var/lib/trading/journal
+    python -m app.engine.replay /var/lib/trading/journal/shard-0 --book-impl sortedlist
+"""
+import argparse
+from app.engine.execution import ORDERBOOK_IMPLEMENTATIONS
+from app.engine.journal import replay
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a matching engine journal")
+    parser.add_argument("journal_dir")
+    parser.add_argument("--book-impl", default="price_level", choices=sorted(ORDERBOOK_IMPLEMENTATIONS))
+    parser.add_argument("--depth", type=int, default=0, help="Print this many L2 levels per book")
+    args = parser.parse_args()
+
+    result = replay(args.journal_dir, ORDERBOOK_IMPLEMENTATIONS[args.book_impl])
+    rate = result.events / result.seconds if result.seconds else 0
+    print(f"Snapshot seq:    {result.snapshot_seq} ({result.snapshot_orders} resting orders)")
+    print(f"Events replayed: {result.events} (last seq {result.last_seq})")
+    print(f"Elapsed:         {result.seconds:.3f}s ({rate:,.0f} events/s)")
+    for symbol, book in sorted(result.books.items()):
+        print(f"{symbol}: {len(book.orders)} resting orders")
+        if args.depth:
+            print(f"  {book.depth(args.depth)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""
+Matching engine shard workers.
+
+Each worker process owns a hash partition of the symbols and serves engine
+commands over a Unix socket. API processes talk to them through
+app.services.sharded_engine.ShardedMatchingEngine, so every uvicorn worker
+sees the same books and matching scales across cores.
+
+Run alongside the API (with the same ENGINE_SHARDS / ENGINE_SOCKET_DIR):
+
+    python -m app.engine.shard
+
+Anyone who can connect to a shard's socket can drive its books, so the
+socket directory must be private to the user running the engine: it is
+created with mode 0700, and an existing one owned by someone else or open
+to other users is refused. Frames carry plain msgpack values (engine
+commands and entries as fixed-layout ext types), never pickles.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import stat
+import struct
+import zlib
+from decimal import Decimal
+from typing import Dict, Optional
+import msgpack
+from app.engine.commands import CancelOrder, NewOrder
+from app.engine.execution import ORDERBOOK_IMPLEMENTATIONS, execute_command, load_sorted_rows
+from app.engine.journal import NO_PRICE, SIDE_CODES, SIDES, TYPE_CODES, TYPES, Journal, recover
+from app.engine.orderbook import OrderBook, OrderBookEntry
+from app.engine.ticks import DEFAULT_TICK_SIZE
+from app.logging_config import logger
+from app.models.order import OrderSide
+
+# Frames are a 4-byte big-endian length followed by a msgpack body.
+# Requests: (request_id, op, args). Responses: (request_id, ok, result), where
+# the result of a failed request is its error message.
+FRAME_HEADER = struct.Struct("!I")
+WRITE_BUFFER_HIGH_WATER = 1 << 20
+
+# msgpack ext types for the engine values that cross the socket
+EXT_DECIMAL = 1 # str(value)
+EXT_NEW_ORDER = 2
+EXT_CANCEL_ORDER = 3
+EXT_ENTRY = 4
+NEW_ORDER_BODY = struct.Struct("!qqqBBqq") # order, user, instrument, side, type, price_ticks (NO_PRICE), quantity
+CANCEL_ORDER_BODY = struct.Struct("!q")
+ENTRY_BODY = struct.Struct("!qqqq") # order_id, user_id, price, quantity
+
+class ShardError(RuntimeError):
+    """An engine op failed inside the shard worker."""
+
+def _encode_ext(obj):
+    cls = type(obj)
+    if cls is NewOrder:
+        return msgpack.ExtType(EXT_NEW_ORDER, NEW_ORDER_BODY.pack(
+            obj.order_id, obj.user_id, obj.instrument_id, SIDE_CODES[obj.side], TYPE_CODES[obj.type],
+            NO_PRICE if obj.price_ticks is None else obj.price_ticks, obj.quantity
+        ))
+    if cls is CancelOrder:
+        return msgpack.ExtType(EXT_CANCEL_ORDER, CANCEL_ORDER_BODY.pack(obj.order_id))
+    if cls is OrderBookEntry:
+        return msgpack.ExtType(EXT_ENTRY, ENTRY_BODY.pack(obj.order_id, obj.user_id, obj.price, obj.quantity))
+    if cls is Decimal:
+        return msgpack.ExtType(EXT_DECIMAL, str(obj).encode())
+    raise TypeError(f"Cannot send {cls.__name__} to an engine shard")
+
+def _decode_ext(code: int, data: bytes):
+    if code == EXT_NEW_ORDER:
+        order_id, user_id, instrument_id, side, type_, price_ticks, quantity = NEW_ORDER_BODY.unpack(data)
+        return NewOrder(
+            order_id, user_id, instrument_id, SIDES[side], TYPES[type_],
+            None if price_ticks == NO_PRICE else price_ticks, quantity
+        )
+    if code == EXT_CANCEL_ORDER:
+        return CancelOrder(*CANCEL_ORDER_BODY.unpack(data))
+    if code == EXT_ENTRY:
+        return OrderBookEntry(*ENTRY_BODY.unpack(data))
+    if code == EXT_DECIMAL:
+        return Decimal(data.decode())
+    return msgpack.ExtType(code, data)
+
+def shard_for(symbol: str, num_shards: int) -> int:
+    # crc32 rather than hash(): it must agree across processes
+    return zlib.crc32(symbol.encode()) % num_shards
+
+def shard_socket_path(socket_dir: str, shard_id: int) -> str:
+    return os.path.join(socket_dir, f"shard-{shard_id}.sock")
+
+def prepare_socket_dir(socket_dir: str):
+    """Create the socket directory private to this user, or check that an existing one is."""
+    os.makedirs(socket_dir, mode=0o700, exist_ok=True)
+    check_socket_dir(socket_dir)
+
+def check_socket_dir(socket_dir: str):
+    info = os.lstat(socket_dir)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise PermissionError(f"Engine socket directory {socket_dir} must be a directory owned by uid {os.getuid()}")
+    if info.st_mode & 0o077:
+        raise PermissionError(
+            f"Engine socket directory {socket_dir} is open to other users "
+            f"(mode {stat.S_IMODE(info.st_mode):o}); it must be 700"
+        )
+
+async def read_frame(reader: asyncio.StreamReader):
+    header = await reader.readexactly(FRAME_HEADER.size)
+    (length,) = FRAME_HEADER.unpack(header)
+    return msgpack.unpackb(await reader.readexactly(length), ext_hook=_decode_ext, strict_map_key=False)
+
+def write_frame(writer: asyncio.StreamWriter, obj):
+    payload = msgpack.packb(obj, default=_encode_ext)
+    writer.write(FRAME_HEADER.pack(len(payload)) + payload)
+
+class ShardWorker:
+    def __init__(self, shard_id: int, book_impl: str):
+        self.shard_id = shard_id
+        self.book_factory = ORDERBOOK_IMPLEMENTATIONS[book_impl]
+        self.orderbooks: Dict[str, OrderBook] = {}
+        self.journal: Optional[Journal] = None
+        self._warm_started: set = set()
+
+    def open_journal(self, journal_dir: str, segment_bytes: int, sync_every: int):
+        self.journal, result = recover(journal_dir, self.book_factory, segment_bytes, sync_every)
+        self.orderbooks.update(result.books)
+        logger.info("engine_journal_recovered", extra={"fields": {
+            "shard": self.shard_id, "books": len(result.books), "snapshot_seq": result.snapshot_seq,
+            "events": result.events, "seconds": round(result.seconds, 3)
+        }})
+
+    def get_book(self, symbol: str, tick_size: Optional[Decimal]) -> OrderBook:
+        # Every op that can create a book carries the instrument's tick; the
+        # default is only for symbols the API process has no instrument for
+        book = self.orderbooks.get(symbol)
+        if book is None:
+            book = self.orderbooks[symbol] = self.book_factory(symbol, tick_size or DEFAULT_TICK_SIZE)
+        return book
+
+    def handle(self, op: str, args: tuple):
+        # All ops are synchronous, so requests from every connection are
+        # applied one at a time on this process's event loop.
+        if op == "new":
+            symbol, tick_size, command = args
+            book = self.get_book(symbol, tick_size)
+            if self.journal is not None:
+                self.journal.append(symbol, book.tick_size, command)
+            return execute_command(book, command), book.drain_deltas()
+        if op == "cancel":
+            symbol, tick_size, order_id = args
+            book = self.get_book(symbol, tick_size)
+            command = CancelOrder(order_id=order_id)
+            if self.journal is not None:
+                self.journal.append(symbol, book.tick_size, command)
+            return execute_command(book, command), book.drain_deltas()
+        if op == "batch":
+            symbol, tick_size, commands = args
+            book = self.get_book(symbol, tick_size)
+            results = []
+            for command in commands:
+                if self.journal is not None:
+                    self.journal.append(symbol, book.tick_size, command)
+                results.append(execute_command(book, command))
+            return results, book.drain_deltas()
+        if op == "view":
+            symbol, tick_size, depth = args
+            book = self.get_book(symbol, tick_size)
+            return (
+                book.tick_size,
+                book.get_best_bid(),
+                book.get_best_ask(),
+                book.snapshot(depth)
+            )
+        if op == "snapshot":
+            symbol, tick_size, depth = args
+            return self.get_book(symbol, tick_size).snapshot(depth)
+        if op == "tick":
+            symbol, tick_size = args
+            return self.get_book(symbol, tick_size).tick_size
+        if op == "claim":
+            symbol, tick_size = args
+            book = self.get_book(symbol, tick_size)
+            if symbol in self._warm_started or book.orders:
+                return False
+            self._warm_started.add(symbol)
+            return True
+        if op == "load":
+            symbol, tick_size, side, rows = args
+            load_sorted_rows(self.get_book(symbol, tick_size), OrderSide(side), rows)
+            return None
+        if op == "checkpoint":
+            if self.journal is not None:
+                self.journal.write_snapshot(self.orderbooks)
+            return None
+        if op == "memory":
+            return {symbol: book.memory_usage() for symbol, book in self.orderbooks.items()}
+        raise ValueError(f"Unknown engine op: {op}")
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_id, op, args = await read_frame(reader)
+                try:
+                    response = (request_id, True, self.handle(op, args))
+                except Exception as e:
+                    response = (request_id, False, f"{type(e).__name__}: {e}")
+                write_frame(writer, response)
+                if writer.transport.get_write_buffer_size() > WRITE_BUFFER_HIGH_WATER:
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, path: str, sync_interval: float = 0.01, snapshot_interval: float = 0):
+        # A stale socket from a previous run; anything else at the path is not ours to remove
+        try:
+            if not stat.S_ISSOCK(os.lstat(path).st_mode):
+                raise FileExistsError(f"{path} exists and is not a socket")
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        if self.journal is not None:
+            self._journal_task = asyncio.create_task(
+                self.journal.run_background(sync_interval, snapshot_interval, lambda: self.orderbooks)
+            )
+        server = await asyncio.start_unix_server(self.serve_connection, path=path)
+        logger.info("engine_shard_listening", extra={"fields": {"shard": self.shard_id, "path": path}})
+        async with server:
+            await server.serve_forever()
+
+def run_worker(shard_id: int, socket_dir: str, book_impl: str, journal_dir: Optional[str] = None):
+    from app.config import settings
+
+    # The parent handles Ctrl+C and terminates us. Journal writes already in the
+    # shared mapping survive the process being killed; only an OS crash can lose
+    # records written since the last msync.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    worker = ShardWorker(shard_id, book_impl)
+    if journal_dir:
+        worker.open_journal(
+            os.path.join(journal_dir, f"shard-{shard_id}"),
+            settings.JOURNAL_SEGMENT_MB << 20,
+            settings.JOURNAL_SYNC_EVERY
+        )
+    asyncio.run(worker.serve(
+        shard_socket_path(socket_dir, shard_id),
+        settings.JOURNAL_SYNC_INTERVAL_MS / 1000,
+        settings.JOURNAL_SNAPSHOT_INTERVAL_S
+    ))
+
+def main():
+    from app.config import settings
+
+    parser = argparse.ArgumentParser(description="Run matching engine shard workers")
+    # Must match the API's ENGINE_SHARDS, since it decides which shard owns a symbol
+    parser.add_argument("--shards", type=int, default=settings.ENGINE_SHARDS)
+    parser.add_argument("--socket-dir", default=settings.ENGINE_SOCKET_DIR)
+    parser.add_argument("--book-impl", default=settings.ORDERBOOK_IMPL, choices=sorted(ORDERBOOK_IMPLEMENTATIONS))
+    parser.add_argument("--journal-dir", default=settings.JOURNAL_DIR)
+    args = parser.parse_args()
+    if args.shards < 1:
+        parser.error("--shards must be at least 1 (or set ENGINE_SHARDS)")
+
+    try:
+        prepare_socket_dir(args.socket_dir)
+    except PermissionError as e:
+        parser.error(str(e))
+    processes = [
+        multiprocessing.Process(
+            target=run_worker,
+            args=(shard_id, args.socket_dir, args.book_impl, args.journal_dir),
+            name=f"engine-shard-{shard_id}",
+        )
+        for shard_id in range(args.shards)
+    ]
+    for process in processes:
+        process.start()
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+from decimal import Decimal
+
+# Used for instruments created before tick sizes existed, and for books
+# that are created before their instrument is known (e.g. WebSocket snapshots)
+DEFAULT_TICK_SIZE = Decimal("0.01")
+
+# The engine only ever sees integer ticks (and integer notional in ticks * qty).
+# Conversion to/from Numeric(18, 4) happens at the DB and API boundary.
+
+def price_to_ticks(price: Decimal, tick_size: Decimal) -> int:
+    ticks, remainder = divmod(Decimal(price), tick_size)
+    if remainder:
+        raise ValueError(f"Price {price} is not a multiple of tick size {tick_size}")
+    return int(ticks)
+
+def ticks_to_price(ticks: int, tick_size: Decimal) -> Decimal:
+    return ticks * tick_size
@@ -19,3 +19,15 @@ class InstrumentNotFoundError(AppError):
 class OrderNotFoundError(AppError):
     def __init__(self, message="Order not found"):
         super().__init__(message, status_code=404)
+
+class OrderNotCancellableError(AppError):
+    def __init__(self, message="Order cannot be cancelled"):
+        super().__init__(message, status_code=400)
+
+class InvalidCursorError(AppError):
+    def __init__(self, message="Invalid pagination cursor"):
+        super().__init__(message, status_code=400)
+
+class ProfilerBusyError(AppError):
+    def __init__(self, message="A profile is already running"):
+        super().__init__(message, status_code=409)
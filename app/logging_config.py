@@ -1,18 +1,38 @@
 import logging
 import sys
+import orjson
+
+class StructuredFormatter(logging.Formatter):
+    """
+    Plain lines as before, except for records logged with extra={"fields": {...}}:
+    those become one JSON object per line (time, level, logger, event and the fields),
+    so slow-request traces and the like can be parsed without regexes.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, "fields", None)
+        if fields is None:
+            return super().format(record)
+        return orjson.dumps({
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+            **fields
+        }, default=str).decode()
 
 def setup_logging():
     logger = logging.getLogger("app")
     logger.setLevel(logging.INFO)
-    
+
     handler = logging.StreamHandler(sys.stdout)
     handler.setLevel(logging.INFO)
-    
-    formatter = logging.Formatter(
+
+    formatter = StructuredFormatter(
         '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
     handler.setFormatter(formatter)
-    
+
     logger.addHandler(handler)
     return logger
 
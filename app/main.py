@@ -1,22 +1,60 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.config import settings
 from app.exceptions import AppError
 from app.redis import init_redis, close_redis
-from app.routers import auth, accounts, instruments, orders, ws
+from app.routers import admin, auth, accounts, instruments, orders, trades, ws
 from app.services.market_feed import market_simulation_task # Import if we use it
+from app.services.matching_engine import matching_engine
+from app.services.warm_start import warm_start
+from app.services.persistence import persistence_pipeline
+from app.services.market_data import market_data_hub
+from app.services.event import background_publisher
+from app.services.instrument_cache import instrument_cache
+from app.services.principal_cache import principal_cache
+from app.services.risk_ledger import risk_ledger
+from app.services.candles import candle_aggregator
+from app.services.loop_monitor import loop_monitor
+from app.metrics import REGISTRY
+from app.security import shutdown_hash_pool
 import asyncio
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
+    if settings.PERSISTENCE_MODE == "write_behind":
+        persistence_pipeline.check_config()
+    loop_monitor.start()
     await init_redis()
+    await instrument_cache.start()
+    principal_cache.start()
+    await matching_engine.start()
+    if settings.PERSISTENCE_MODE == "write_behind":
+        # Orders acked before a crash that never reached Postgres go first
+        await persistence_pipeline.start(matching_engine.take_recovered())
+    if settings.WARM_START_ON_BOOT:
+        await warm_start(matching_engine)
+    risk_ledger.start()
+    await candle_aggregator.start()
+    if settings.EVENT_PUBLISH_MODE == "background":
+        background_publisher.start()
     task = asyncio.create_task(market_simulation_task())
     yield
     # Shutdown
+    # Commit whatever the pipeline still holds before the engine goes away
+    await persistence_pipeline.stop()
+    await risk_ledger.stop()
+    await candle_aggregator.stop()
+    await background_publisher.stop()
+    await instrument_cache.stop()
+    await principal_cache.stop()
+    await market_data_hub.stop()
+    await matching_engine.shutdown()
     await close_redis()
+    shutdown_hash_pool()
+    await loop_monitor.stop()
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
@@ -46,8 +84,16 @@ app.include_router(auth.router, prefix="/api/v1")
 app.include_router(accounts.router, prefix="/api/v1")
 app.include_router(instruments.router, prefix="/api/v1")
 app.include_router(orders.router, prefix="/api/v1")
+app.include_router(trades.router, prefix="/api/v1")
 app.include_router(ws.router, prefix="/api/v1")
+app.include_router(admin.router, prefix="/api/v1")
 
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
+
+@app.get("/metrics")
+async def metrics(format: str = "prometheus"):
+    if format == "json":
+        return REGISTRY.snapshot()
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
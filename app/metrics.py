@@ -0,0 +1,223 @@
+"""
+Minimal in-process metrics: counters, gauges and histograms with optional
+labels, collected in a single registry and exposed by the /metrics endpoint
+in the Prometheus text format (or as JSON with ?format=json).
+
+Recording is a few attribute updates and nothing is computed until a scrape,
+so hot paths resolve their labelled children once, at import time.
+"""
+import math
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Seconds; covers sub-millisecond engine work up to slow database commits
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, "Metric"] = {}
+
+    def register(self, metric: "Metric"):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    def snapshot(self) -> dict:
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format (0.0.4)."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {_escape_help(metric.help)}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            children = metric.children() or ([({}, metric._new_child())] if not metric.labelnames else [])
+            for labels, child in children:
+                metric.render_child(lines, labels, child)
+        lines.append("")
+        return "\n".join(lines)
+
+REGISTRY = Registry()
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), registry: Registry = REGISTRY):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        registry.register(self)
+
+    def labels(self, *values: str):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def children(self) -> List[Tuple[Dict[str, str], object]]:
+        return [(dict(zip(self.labelnames, values)), child) for values, child in self._children.items()]
+
+    def snapshot(self):
+        if not self.labelnames:
+            return self.labels().value() if self._children else self._new_child().value()
+        return [{"labels": labels, "value": child.value()} for labels, child in self.children()]
+
+    def render_child(self, lines: List[str], labels: Dict[str, str], child):
+        lines.append(f"{self.name}{_format_labels(labels)} {_format_value(child.value())}")
+
+    def _new_child(self):
+        raise NotImplementedError
+
+def _escape_help(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(str(value))}"' for name, value in labels.items()) + "}"
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        return repr(value)
+    return str(value)
+
+class _CounterChild:
+    __slots__ = ("count",)
+
+    def __init__(self):
+        self.count = 0
+
+    def inc(self, amount: float = 1):
+        self.count += amount
+
+    def value(self):
+        return self.count
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def _new_child(self):
+        return _CounterChild()
+
+class _GaugeChild:
+    __slots__ = ("current", "function")
+
+    def __init__(self):
+        self.current = 0
+        self.function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float):
+        self.current = value
+
+    def inc(self, amount: float = 1):
+        self.current += amount
+
+    def dec(self, amount: float = 1):
+        self.current -= amount
+
+    def set_function(self, function: Callable[[], float]):
+        # Read on collection, e.g. a queue's qsize
+        self.function = function
+
+    def value(self):
+        return self.function() if self.function is not None else self.current
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def inc(self, amount: float = 1):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1):
+        self.labels().dec(amount)
+
+    def set_function(self, function: Callable[[], float]):
+        self.labels().set_function(function)
+
+    def _new_child(self):
+        return _GaugeChild()
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+    def cumulative_counts(self) -> List[int]:
+        total = 0
+        cumulative = []
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+    def value(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": dict(zip([*map(str, self.buckets), "+Inf"], self.cumulative_counts()))
+        }
+
+class _Timer:
+    """Context manager observing its duration; cheaper than a generator-based one."""
+    __slots__ = ("child", "started")
+
+    def __init__(self, child: _HistogramChild):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.started)
+        return False
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS, registry: Registry = REGISTRY):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, registry)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def render_child(self, lines: List[str], labels: Dict[str, str], child: _HistogramChild):
+        for bound, count in zip([*map(_format_value, map(float, self.buckets)), "+Inf"], child.cumulative_counts()):
+            lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': bound})} {count}")
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {child.count}")
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
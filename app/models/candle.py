@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, BigInteger, Numeric, DateTime, ForeignKey
+from app.database import Base
+
+class Candle(Base):
+    """One closed OHLCV bar, written in batches by the candle aggregator."""
+    __tablename__ = "candles"
+
+    instrument_id = Column(Integer, ForeignKey("instruments.id"), primary_key=True)
+    interval_s = Column(Integer, primary_key=True) # Bar length in seconds
+    start_time = Column(DateTime(timezone=True), primary_key=True)
+
+    open = Column(Numeric(18, 4), nullable=False)
+    high = Column(Numeric(18, 4), nullable=False)
+    low = Column(Numeric(18, 4), nullable=False)
+    close = Column(Numeric(18, 4), nullable=False)
+    volume = Column(BigInteger, nullable=False)
+    trades = Column(Integer, nullable=False)
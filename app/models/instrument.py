@@ -1,3 +1,4 @@
+from decimal import Decimal
 from sqlalchemy import Column, Integer, String, Boolean, Numeric, DateTime
 from sqlalchemy.sql import func
 from app.database import Base
@@ -9,6 +10,8 @@ class Instrument(Base):
     symbol = Column(String, unique=True, index=True, nullable=False)
     name = Column(String, nullable=False)
     current_price = Column(Numeric(18, 4), nullable=False)
+    # Minimum price increment; the matching engine works in integer multiples of it
+    tick_size = Column(Numeric(18, 4), nullable=False, default=Decimal("0.01"), server_default="0.01")
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -44,4 +44,6 @@ class Order(Base):
 
     __table_args__ = (
         Index('idx_orders_instrument_side_status', 'instrument_id', 'side', 'status'),
+        # Order history: keyset pagination per user on (created_at, id)
+        Index('idx_orders_user_created', 'user_id', 'created_at', 'id'),
     )
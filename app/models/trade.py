@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Numeric, DateTime, ForeignKey, UniqueConstraint
+from sqlalchemy import Column, Integer, Numeric, DateTime, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -10,6 +10,9 @@ class Trade(Base):
     buy_order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
     sell_order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
     instrument_id = Column(Integer, ForeignKey("instruments.id"), nullable=False)
+    # Owners of the two orders, denormalized so trade history needs no join
+    buyer_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    seller_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     
     price = Column(Numeric(18, 4), nullable=False)
     quantity = Column(Integer, nullable=False)
@@ -20,6 +23,12 @@ class Trade(Base):
     sell_order = relationship("Order", foreign_keys=[sell_order_id])
     instrument = relationship("Instrument")
 
+    __table_args__ = (
+        # Trade history: keyset pagination per user on (created_at, id), one index per side
+        Index('idx_trades_buyer_created', 'buyer_id', 'created_at', 'id'),
+        Index('idx_trades_seller_created', 'seller_id', 'created_at', 'id'),
+    )
+
 class Holding(Base):
     __tablename__ = "holdings"
 
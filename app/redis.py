@@ -1,23 +1,28 @@
 import redis.asyncio as redis
 from app.config import settings
 
-# Global Redis pool
+# Global Redis pool, and one client on top of it shared by the whole process
 redis_pool = None
+redis_client = None
 
 async def init_redis():
-    global redis_pool
+    global redis_pool, redis_client
     redis_pool = redis.ConnectionPool.from_url(
         settings.REDIS_URL,
         encoding="utf-8",
         decode_responses=True
     )
+    redis_client = redis.Redis(connection_pool=redis_pool)
 
 async def close_redis():
-    global redis_pool
+    global redis_pool, redis_client
+    if redis_client:
+        await redis_client.aclose(close_connection_pool=False)
+        redis_client = None
     if redis_pool:
         await redis_pool.disconnect()
 
 async def get_redis() -> redis.Redis:
-    if redis_pool is None:
+    if redis_client is None:
         await init_redis()
-    return redis.Redis(connection_pool=redis_pool)
+    return redis_client
@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import PlainTextResponse
+from app.config import settings
+from app.deps import get_admin_user
+from app.services.principal_cache import Principal
+from app.services.profiler import profiler
+
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+@router.post("/profile")
+async def profile(
+    seconds: float = Query(10, gt=0, le=settings.PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(5, ge=1, le=1000),
+    format: str = Query("collapsed", pattern="^(collapsed|json)$"),
+    current_user: Principal = Depends(get_admin_user)
+):
+    # Samples this process's event loop; behind a load balancer, each worker is profiled separately
+    result = await profiler.run(seconds, interval_ms / 1000)
+    if format == "json":
+        return result.to_dict()
+    return PlainTextResponse(result.collapsed())
@@ -1,11 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import time
+from fastapi import APIRouter, Depends, HTTPException, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
+from jose import jwt
 from app.database import get_db
-from app.schemas.auth import UserCreate, UserRead, Token
+from app.deps import get_current_user, oauth2_scheme
+from app.schemas.auth import PasswordChange, UserCreate, UserRead, Token
 from app.services import auth as auth_service
 from app.security import create_access_token
+from app.services.principal_cache import Principal, principal_cache, token_key
 from app.config import settings
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -35,3 +39,24 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
         data={"sub": user.email}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(token: str = Depends(oauth2_scheme), current_user: Principal = Depends(get_current_user)):
+    # get_current_user has validated the token, so its claims can be trusted here
+    claims = jwt.get_unverified_claims(token)
+    await principal_cache.revoke_token(token_key(token), claims["exp"] - time.time())
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+@router.post("/password", status_code=status.HTTP_204_NO_CONTENT)
+async def change_password(
+    password_in: PasswordChange,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    changed = await auth_service.change_password(
+        db, current_user.id, password_in.current_password, password_in.new_password
+    )
+    if not changed:
+        raise HTTPException(status_code=400, detail="Incorrect password")
+    await principal_cache.revoke_user(current_user.id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -1,11 +1,14 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db
 from app.deps import get_current_user
-from app.models.user import User
+from app.services.principal_cache import Principal
+from app.schemas.candle import CandleRead
 from app.schemas.instrument import InstrumentCreate, InstrumentRead
 from app.services import instrument as instrument_service
+from app.services import candles as candle_service
 
 # Note: In a real app, Create/Update might be restricted to admins.
 # For this simulation, we'll allow authenticated users to create instruments for testing.
@@ -15,7 +18,7 @@ router = APIRouter(prefix="/instruments", tags=["instruments"])
 @router.post("/", response_model=InstrumentRead, status_code=status.HTTP_201_CREATED)
 async def create_instrument(
     instrument_in: InstrumentCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     existing = await instrument_service.get_instrument_by_symbol(db, instrument_in.symbol)
@@ -27,7 +30,7 @@ async def create_instrument(
 @router.get("/", response_model=List[InstrumentRead])
 async def list_instruments(
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     return await instrument_service.get_all_instruments(db)
 
@@ -35,9 +38,27 @@ async def list_instruments(
 async def get_instrument(
     symbol: str, 
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     instrument = await instrument_service.get_instrument_by_symbol(db, symbol)
     if not instrument:
         raise HTTPException(status_code=404, detail="Instrument not found")
     return instrument
+
+@router.get("/{symbol}/candles", response_model=List[CandleRead])
+async def get_candles(
+    symbol: str,
+    interval: str = "1m",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(500, ge=1, le=5000),
+    db: AsyncSession = Depends(get_db),
+    current_user: Principal = Depends(get_current_user)
+):
+    seconds = candle_service.INTERVALS.get(interval)
+    if seconds is None:
+        raise HTTPException(status_code=400, detail=f"interval must be one of {', '.join(candle_service.INTERVALS)}")
+    instrument = await instrument_service.get_instrument_by_symbol(db, symbol)
+    if not instrument:
+        raise HTTPException(status_code=404, detail="Instrument not found")
+    return await candle_service.get_candles(db, instrument, seconds, start, end, limit)
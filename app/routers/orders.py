@@ -1,18 +1,22 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db
 from app.deps import get_current_user
-from app.models.user import User
-from app.schemas.order import OrderCreate, OrderRead
+from app.services.principal_cache import Principal
+from app.models.order import OrderStatus
+from app.schemas.order import OrderCreate, OrderRead, OrderCancelRequest, OrderBatchRequest, OrderBatchResult
 from app.services import order as order_service
+from app.services import history as history_service
+from app.services import order_batch as order_batch_service
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
 @router.post("/", response_model=OrderRead, status_code=status.HTTP_201_CREATED)
 async def place_order(
     order_in: OrderCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
     try:
@@ -22,9 +26,54 @@ async def place_order(
     # Custom exceptions handled by middleware or global handler if registered, 
     # but specific handling here is also fine.
 
+@router.post("/batch", response_model=List[OrderBatchResult])
+async def place_order_batch(
+    batch_in: OrderBatchRequest,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # One result per item, in order; a rejected item does not fail the rest
+    return await order_batch_service.execute_order_batch(db, batch_in.orders, current_user)
+
 @router.get("/", response_model=List[OrderRead])
 async def list_orders(
-    current_user: User = Depends(get_current_user),
+    response: Response,
+    symbol: Optional[str] = None,
+    order_status: Optional[OrderStatus] = Query(None, alias="status"),
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Newest first; pass X-Next-Cursor back as `cursor` for the next page
+    orders, next_cursor = await history_service.order_page(db, current_user.id, symbol, order_status, cursor, limit)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return orders
+
+@router.get("/export")
+async def export_orders(
+    symbol: Optional[str] = None,
+    order_status: Optional[OrderStatus] = Query(None, alias="status"),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    query = await history_service.orders_query(db, current_user.id, symbol, order_status)
+    return StreamingResponse(history_service.export_ndjson(query), media_type="application/x-ndjson")
+
+@router.delete("/{order_id}", response_model=OrderRead)
+async def cancel_order(
+    order_id: int,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    return await order_service.cancel_order(db, order_id, current_user)
+
+@router.post("/cancel", response_model=List[OrderRead])
+async def cancel_orders(
+    cancel_in: OrderCancelRequest,
+    current_user: Principal = Depends(get_current_user),
     db: AsyncSession = Depends(get_db)
 ):
-    return await order_service.get_user_orders(db, current_user.id)
+    # Bulk cancel: orders that are not cancellable are skipped, only cancelled ones are returned
+    return await order_service.cancel_orders(db, cancel_in.order_ids, current_user)
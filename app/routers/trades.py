@@ -0,0 +1,35 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db
+from app.deps import get_current_user
+from app.services.principal_cache import Principal
+from app.schemas.trade import TradeRead
+from app.services import history as history_service
+
+router = APIRouter(prefix="/trades", tags=["trades"])
+
+@router.get("/", response_model=List[TradeRead])
+async def list_trades(
+    response: Response,
+    symbol: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    # Newest first; pass X-Next-Cursor back as `cursor` for the next page
+    trades, next_cursor = await history_service.trade_page(db, current_user.id, symbol, cursor, limit)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return trades
+
+@router.get("/export")
+async def export_trades(
+    symbol: Optional[str] = None,
+    current_user: Principal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    query = await history_service.trades_query(db, current_user.id, symbol)
+    return StreamingResponse(history_service.export_ndjson(query), media_type="application/x-ndjson")
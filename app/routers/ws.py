@@ -1,43 +1,71 @@
 import asyncio
-import json
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends
-from app.redis import get_redis
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from app.config import settings
+from app.services.market_data import market_data_hub, encode_event, ENCODINGS, RESYNC, DISCONNECT
 from app.services.matching_engine import matching_engine
 
 router = APIRouter(tags=["websocket"])
 
+async def send_frame(websocket: WebSocket, frame):
+    if isinstance(frame, bytes):
+        await websocket.send_bytes(frame)
+    else:
+        await websocket.send_text(frame)
+
+async def send_snapshot(websocket: WebSocket, symbol: str, encoding: str):
+    # Everything after a snapshot is an incremental "orderbook" delta
+    snapshot = {"type": "snapshot", "data": await matching_engine.get_depth_snapshot(symbol)}
+    await send_frame(websocket, encode_event(snapshot, encoding))
+
+async def pump(websocket: WebSocket, subscriber, encoding: str):
+    """Drain this client's hub queue onto its socket."""
+    queue = subscriber.queue
+    while True:
+        item = await queue.get()
+        if item is RESYNC:
+            await send_snapshot(websocket, subscriber.symbol, encoding)
+        elif item is DISCONNECT:
+            # 1013: try again later
+            await websocket.close(code=1013, reason="Slow consumer")
+            return
+        else:
+            # Encoded by the first client that needed this encoding, reused by the rest
+            await send_frame(websocket, item.frame(encoding))
+
 @router.websocket("/ws/{symbol}")
-async def websocket_endpoint(websocket: WebSocket, symbol: str):
+async def websocket_endpoint(websocket: WebSocket, symbol: str, encoding: str = "json", conflate_ms: int = 0):
+    """
+    Live trades and order book for one symbol.
+    ?encoding=msgpack sends binary msgpack frames instead of JSON text.
+    ?conflate_ms=N delivers order book updates at most every N ms, merged
+    per level; trades are always delivered individually.
+    """
     await websocket.accept()
-    redis = await get_redis()
-    pubsub = redis.pubsub()
-    
-    # Subscribe to channels
-    await pubsub.subscribe(f"trades:{symbol}", f"orderbook:{symbol}")
-    
-    # Send initial snapshot
-    engine = matching_engine
-    book = await engine.get_orderbook(symbol)
-    snapshot = {
-        "type": "snapshot",
-        "data": book.depth()
-    }
-    await websocket.send_json(snapshot)
-    
+    if encoding not in ENCODINGS or not 0 <= conflate_ms <= settings.WS_MAX_CONFLATE_MS:
+        # 1008: policy violation
+        await websocket.close(code=1008, reason="Unsupported encoding or conflate_ms")
+        return
+
+    # Subscribe before the snapshot so no delta published in between is missed;
+    # clients drop deltas that are older than what they hold per level
+    subscriber = await market_data_hub.subscribe(symbol, conflate_ms)
+    sender = receiver = None
     try:
+        await send_snapshot(websocket, symbol, encoding)
+        sender = asyncio.create_task(pump(websocket, subscriber, encoding))
+        # Market data only flows outwards; reading is how a disconnect is noticed
         while True:
-            message = await pubsub.get_message(ignore_subscribe_messages=True)
-            if message:
-                channel = message["channel"]
-                data = json.loads(message["data"])
-                
-                msg_type = "trade" if "trades" in channel else "orderbook"
-                
-                await websocket.send_json({
-                    "type": msg_type,
-                    "data": data
-                })
-            
-            await asyncio.sleep(0.01) # Prevent tight loop CPU usage
-    except WebSocketDisconnect:
-        await pubsub.unsubscribe()
+            receiver = asyncio.create_task(websocket.receive_text())
+            done, _ = await asyncio.wait({sender, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if sender in done:
+                # Closed as a slow consumer, or the send failed because the client is gone
+                sender.exception()
+                break
+            receiver.result()
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        for task in (sender, receiver):
+            if task is not None:
+                task.cancel()
+        await market_data_hub.unsubscribe(subscriber)
@@ -0,0 +1,11 @@
+from datetime import datetime
+from pydantic import BaseModel
+
+class CandleRead(BaseModel):
+    start_time: datetime
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: int
+    trades: int
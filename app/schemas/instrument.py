@@ -1,3 +1,4 @@
+from decimal import Decimal
 from pydantic import BaseModel, Field, condecimal
 from typing import Optional
 from datetime import datetime
@@ -6,6 +7,7 @@ class InstrumentCreate(BaseModel):
     symbol: str = Field(..., min_length=1, max_length=10)
     name: str
     current_price: condecimal(max_digits=18, decimal_places=4) = Field(..., gt=0)
+    tick_size: condecimal(max_digits=18, decimal_places=4) = Field(Decimal("0.01"), gt=0)
 
 class InstrumentRead(InstrumentCreate):
     id: int
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field, condecimal
-from typing import Optional
+import enum
+from pydantic import BaseModel, Field, condecimal, model_validator
+from typing import List, Optional
 from datetime import datetime
 from app.models.order import OrderSide, OrderType, OrderStatus
 
@@ -10,6 +11,9 @@ class OrderCreate(BaseModel):
     quantity: int = Field(..., gt=0)
     price: Optional[condecimal(max_digits=18, decimal_places=4)] = None
 
+class OrderCancelRequest(BaseModel):
+    order_ids: List[int] = Field(..., min_length=1, max_length=1000)
+
 class OrderRead(BaseModel):
     id: int
     instrument_id: int
@@ -23,3 +27,42 @@ class OrderRead(BaseModel):
     
     class Config:
         from_attributes = True
+
+class BatchAction(str, enum.Enum):
+    NEW = "NEW"
+    CANCEL = "CANCEL"
+    REPLACE = "REPLACE" # Cancel order_id, then place the new order if the cancel succeeded
+
+class OrderBatchItem(BaseModel):
+    action: BatchAction = BatchAction.NEW
+    order_id: Optional[int] = None # CANCEL / REPLACE
+    # NEW / REPLACE
+    instrument_symbol: Optional[str] = None
+    side: Optional[OrderSide] = None
+    type: Optional[OrderType] = None
+    quantity: Optional[int] = Field(None, gt=0)
+    price: Optional[condecimal(max_digits=18, decimal_places=4)] = None
+
+    @model_validator(mode="after")
+    def check_fields(self):
+        if self.action != BatchAction.NEW and self.order_id is None:
+            raise ValueError("order_id is required for CANCEL and REPLACE")
+        if self.action != BatchAction.CANCEL and None in (self.instrument_symbol, self.side, self.type, self.quantity):
+            raise ValueError("instrument_symbol, side, type and quantity are required for NEW and REPLACE")
+        return self
+
+    def new_order(self) -> OrderCreate:
+        return OrderCreate(
+            instrument_symbol=self.instrument_symbol, side=self.side, type=self.type,
+            quantity=self.quantity, price=self.price
+        )
+
+class OrderBatchRequest(BaseModel):
+    orders: List[OrderBatchItem] = Field(..., min_length=1, max_length=1000)
+
+class OrderBatchResult(BaseModel):
+    action: BatchAction
+    ok: bool
+    order: Optional[OrderRead] = None # The order placed (NEW / REPLACE)
+    cancelled: Optional[OrderRead] = None # The order cancelled (CANCEL / REPLACE)
+    error: Optional[str] = None
@@ -0,0 +1,16 @@
+from pydantic import BaseModel, condecimal
+from datetime import datetime
+from app.models.order import OrderSide
+
+class TradeRead(BaseModel):
+    """One fill, from the point of view of the requesting user."""
+    id: int
+    order_id: int
+    instrument_id: int
+    side: OrderSide
+    price: condecimal(max_digits=18, decimal_places=4)
+    quantity: int
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
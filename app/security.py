@@ -1,3 +1,6 @@
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
@@ -12,12 +15,42 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+# bcrypt costs hundreds of milliseconds of CPU by design. The async variants
+# below run it in a bounded pool so logins never stall the event loop (and
+# with it matching and market data); beyond PASSWORD_HASH_WORKERS concurrent
+# hashes, callers queue for the pool instead of for the loop.
+_hash_pool: Optional[Executor] = None
+
+def _get_hash_pool() -> Executor:
+    global _hash_pool
+    if _hash_pool is None:
+        if settings.PASSWORD_HASH_POOL == "process":
+            _hash_pool = ProcessPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS)
+        else:
+            # The bcrypt backend releases the GIL while hashing
+            _hash_pool = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+    return _hash_pool
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(_get_hash_pool(), verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_get_hash_pool(), get_password_hash, password)
+
+def shutdown_hash_pool():
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(wait=False, cancel_futures=True)
+        _hash_pool = None
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
+    # iat lets a password change revoke every token issued before it. Kept to the
+    # microsecond, so a token issued in the same second as the change is ordered too
+    to_encode.update({"exp": expire, "iat": time.time()})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
     return encoded_jwt
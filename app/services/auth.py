@@ -1,15 +1,16 @@
 from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timezone
 from sqlalchemy import select
 from app.models.user import User, Account
 from app.schemas.auth import UserCreate
-from app.security import get_password_hash, verify_password
+from app.security import get_password_hash_async, verify_password_async
 
 async def get_user_by_email(db: AsyncSession, email: str):
     result = await db.execute(select(User).where(User.email == email))
     return result.scalars().first()
 
 async def create_user(db: AsyncSession, user_in: UserCreate):
-    hashed_password = get_password_hash(user_in.password)
+    hashed_password = await get_password_hash_async(user_in.password)
     db_user = User(email=user_in.email, hashed_password=hashed_password)
     db.add(db_user)
     
@@ -27,6 +28,16 @@ async def authenticate_user(db: AsyncSession, email: str, password: str):
     user = await get_user_by_email(db, email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         return False
     return user
+
+async def change_password(db: AsyncSession, user_id: int, current_password: str, new_password: str) -> bool:
+    user = await db.get(User, user_id)
+    if not user or not await verify_password_async(current_password, user.hashed_password):
+        return False
+    user.hashed_password = await get_password_hash_async(new_password)
+    # Rejects every token issued so far; the caller drops cached principals
+    user.password_changed_at = datetime.now(timezone.utc)
+    await db.commit()
+    return True
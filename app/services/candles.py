@@ -0,0 +1,300 @@
+"""
+Incremental OHLCV candles.
+
+Every process follows the trades:* channels and folds each trade into the
+open 1s/1m/5m/1h bar of its symbol, so bars cost a few comparisons per trade
+and no database work. A flush task closes bars whose period has ended and
+writes them to the candles table in one multi-row upsert per batch. Each
+process sees every trade and writes the same bars; the upsert keeps the row
+with the most trades, so a process that started mid-bar never overwrites a
+complete one.
+
+The last CANDLE_MEMORY_BARS closed bars per symbol and interval stay in
+memory. GET /instruments/{symbol}/candles serves those (and the open bar)
+from memory and anything older from the table.
+"""
+import asyncio
+import math
+import time
+from collections import deque
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+import orjson
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.database import SessionLocal
+from app.logging_config import logger
+from app.metrics import Counter, Gauge, Histogram
+from app.models.candle import Candle
+from app.redis import get_redis
+from app.services.instrument_cache import InstrumentRef, instrument_cache
+
+INTERVALS = {"1s": 1, "1m": 60, "5m": 300, "1h": 3600}
+
+# (start, open, high, low, close, volume, trades), start in epoch seconds
+Bar = Tuple[int, float, float, float, float, int, int]
+
+# Rows per INSERT, well under Postgres' bind parameter limit
+FLUSH_CHUNK = 2000
+
+CANDLE_TRADES = Counter("candle_trades_total", "Trades folded into candles")
+CANDLE_LATE_TRADES = Counter("candle_late_trades_total", "Trades older than the open bar, not folded in")
+CANDLE_BAD_TRADES = Counter("candle_bad_trades_total", "Trade messages that could not be decoded, skipped")
+CANDLE_PENDING = Gauge("candle_pending_bars", "Closed bars waiting to be written")
+CANDLE_FLUSH_SECONDS = Histogram("candle_flush_seconds", "Duration of one candle flush")
+
+class CandleSeries:
+    """Bars of one symbol at one interval: the open bar plus recent closed ones."""
+    __slots__ = ("seconds", "current", "closed", "complete_from")
+
+    def __init__(self, seconds: int, memory_bars: int, complete_from: int):
+        self.seconds = seconds
+        self.current: Optional[list] = None # Open bar, as a mutable Bar
+        self.closed: deque = deque(maxlen=memory_bars)
+        # Bars starting at or after this are complete in memory
+        self.complete_from = complete_from
+
+    def add(self, ts: float, price: float, quantity: int) -> Optional[Bar]:
+        """Fold in one trade; returns the bar this closed, if any."""
+        start = int(ts) // self.seconds * self.seconds
+        bar = self.current
+        if bar is not None and start == bar[0]:
+            if price > bar[2]:
+                bar[2] = price
+            elif price < bar[3]:
+                bar[3] = price
+            bar[4] = price
+            bar[5] += quantity
+            bar[6] += 1
+            return None
+        if bar is not None and start < bar[0]:
+            CANDLE_LATE_TRADES.inc()
+            return None
+        closed = self.close()
+        self.current = [start, price, price, price, price, quantity, 1]
+        return closed
+
+    def close(self) -> Optional[Bar]:
+        bar = self.current
+        if bar is None:
+            return None
+        self.current = None
+        closed = tuple(bar)
+        if len(self.closed) == self.closed.maxlen:
+            # The oldest bar falls out of memory; reads before it go to the table
+            self.complete_from = self.closed[1][0] if len(self.closed) > 1 else closed[0]
+        self.closed.append(closed)
+        return closed
+
+    def close_if_due(self, now: float) -> Optional[Bar]:
+        if self.current is not None and now >= self.current[0] + self.seconds:
+            return self.close()
+        return None
+
+    def bars(self, start: Optional[int], end: Optional[int]) -> List[Bar]:
+        bars = list(self.closed)
+        if self.current is not None:
+            bars.append(tuple(self.current))
+        return [
+            bar for bar in bars
+            if (start is None or bar[0] >= start) and (end is None or bar[0] < end)
+        ]
+
+class CandleAggregator:
+    def __init__(self, memory_bars: int, flush_interval: float, include_simulated: bool):
+        self.memory_bars = memory_bars
+        self.flush_interval = flush_interval
+        self.include_simulated = include_simulated
+        self.series: Dict[str, Dict[int, CandleSeries]] = {}
+        self.started_at = time.time()
+        self._pending: List[Tuple[str, int, Bar]] = [] # (symbol, seconds, bar)
+        self._reader: Optional[asyncio.Task] = None
+        self._flusher: Optional[asyncio.Task] = None
+        CANDLE_PENDING.set_function(lambda: len(self._pending))
+
+    def add_trade(self, symbol: str, price: float, quantity: int, ts: float):
+        series = self.series.get(symbol)
+        if series is None:
+            series = self.series[symbol] = {
+                seconds: CandleSeries(seconds, self.memory_bars, self.complete_from(seconds))
+                for seconds in INTERVALS.values()
+            }
+        for seconds, bars in series.items():
+            closed = bars.add(ts, price, quantity)
+            if closed is not None:
+                self._pending.append((symbol, seconds, closed))
+        CANDLE_TRADES.inc()
+
+    def complete_from(self, seconds: int) -> int:
+        """First bar start this process has seen in full (the one after it started)."""
+        return math.ceil(self.started_at / seconds) * seconds
+
+    def memory_bars_for(self, symbol: str, seconds: int, start: Optional[int], end: Optional[int]) -> Tuple[int, List[Bar]]:
+        """(complete_from, bars): bars from memory, and where memory stops being complete."""
+        series = self.series.get(symbol, {}).get(seconds)
+        if series is None:
+            return self.complete_from(seconds), []
+        lower = series.complete_from if start is None else max(start, series.complete_from)
+        return series.complete_from, series.bars(lower, end)
+
+    async def start(self):
+        self.started_at = time.time()
+        self._reader = asyncio.create_task(self._read_loop())
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        for task in (self._reader, self._flusher):
+            if task is not None:
+                task.cancel()
+        await asyncio.gather(*(t for t in (self._reader, self._flusher) if t is not None), return_exceptions=True)
+        self._reader = self._flusher = None
+        # Open bars too: whatever traded so far is all this process will see
+        for symbol, series in self.series.items():
+            for seconds, bars in series.items():
+                closed = bars.close()
+                if closed is not None:
+                    self._pending.append((symbol, seconds, closed))
+        await self.flush()
+
+    async def flush(self):
+        now = time.time()
+        for symbol, series in self.series.items():
+            for seconds, bars in series.items():
+                closed = bars.close_if_due(now)
+                if closed is not None:
+                    self._pending.append((symbol, seconds, closed))
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        try:
+            with CANDLE_FLUSH_SECONDS.time():
+                await write_bars(pending)
+        except Exception as e:
+            logger.warning("candle_flush_failed", extra={"fields": {"bars": len(pending), "error": str(e)}})
+            # Keep the newest bars if the table stays unreachable
+            self._pending = (pending + self._pending)[-settings.CANDLE_MAX_PENDING:]
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def _read_loop(self):
+        pubsub = None
+        while True:
+            try:
+                if pubsub is None:
+                    pubsub = (await get_redis()).pubsub()
+                    await pubsub.psubscribe("trades:*")
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None:
+                    continue
+                try:
+                    trade = orjson.loads(message["data"])
+                    if trade.get("is_simulation") and not self.include_simulated:
+                        continue
+                    price, quantity, timestamp = float(trade["price"]), int(trade["quantity"]), float(trade["timestamp"])
+                except (ValueError, KeyError, TypeError, AttributeError) as e:
+                    # One bad message must not stop the candles of every symbol
+                    CANDLE_BAD_TRADES.inc()
+                    logger.warning("candle_bad_trade", extra={"fields": {
+                        "channel": message["channel"], "error": repr(e)
+                    }})
+                    continue
+                symbol = message["channel"].partition(":")[2]
+                self.add_trade(symbol, price, quantity, timestamp)
+            except (RedisError, ConnectionError) as e:
+                logger.warning("candle_redis_lost", extra={"fields": {"error": str(e)}})
+                if pubsub is not None:
+                    await pubsub.aclose()
+                    pubsub = None
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                if pubsub is not None:
+                    await pubsub.aclose()
+                raise
+
+async def write_bars(pending: List[Tuple[str, int, Bar]]):
+    rows = []
+    for symbol, seconds, (start, open_, high, low, close, volume, trades) in pending:
+        instrument = instrument_cache.get(symbol)
+        if instrument is None:
+            continue
+        rows.append({
+            "instrument_id": instrument.id,
+            "interval_s": seconds,
+            "start_time": datetime.fromtimestamp(start, timezone.utc),
+            "open": Decimal(str(open_)),
+            "high": Decimal(str(high)),
+            "low": Decimal(str(low)),
+            "close": Decimal(str(close)),
+            "volume": volume,
+            "trades": trades
+        })
+    if not rows:
+        return
+    table = Candle.__table__
+    async with SessionLocal() as db:
+        for offset in range(0, len(rows), FLUSH_CHUNK):
+            statement = pg_insert(table).values(rows[offset:offset + FLUSH_CHUNK])
+            excluded = statement.excluded
+            await db.execute(statement.on_conflict_do_update(
+                index_elements=[table.c.instrument_id, table.c.interval_s, table.c.start_time],
+                set_={column: excluded[column] for column in ("open", "high", "low", "close", "volume", "trades")},
+                # Every process writes the same bars; keep the one that saw the most trades
+                where=excluded.trades > table.c.trades
+            ))
+        await db.commit()
+
+def bar_dict(bar: Bar) -> dict:
+    start, open_, high, low, close, volume, trades = bar
+    return {
+        "start_time": datetime.fromtimestamp(start, timezone.utc),
+        "open": open_, "high": high, "low": low, "close": close,
+        "volume": volume, "trades": trades
+    }
+
+async def get_candles(db: AsyncSession, instrument: InstrumentRef, seconds: int,
+                      start: Optional[datetime], end: Optional[datetime], limit: int) -> List[dict]:
+    """The last `limit` bars starting in [start, end), oldest first."""
+    start_ts = int(start.timestamp()) if start else None
+    end_ts = int(end.timestamp()) if end else None
+    complete_from, bars = candle_aggregator.memory_bars_for(instrument.symbol, seconds, start_ts, end_ts)
+    candles = [bar_dict(bar) for bar in bars[-limit:]]
+
+    if len(candles) < limit and (start_ts is None or start_ts < complete_from):
+        # Older than memory covers: read the table
+        table = Candle.__table__
+        upper = complete_from if end_ts is None else min(end_ts, complete_from)
+        query = (
+            select(table.c.start_time, table.c.open, table.c.high, table.c.low, table.c.close,
+                   table.c.volume, table.c.trades)
+            .where(
+                table.c.instrument_id == instrument.id,
+                table.c.interval_s == seconds,
+                table.c.start_time < datetime.fromtimestamp(upper, timezone.utc)
+            )
+            .order_by(table.c.start_time.desc())
+            .limit(limit - len(candles))
+        )
+        if start is not None:
+            query = query.where(table.c.start_time >= start)
+        rows = (await db.execute(query)).all()
+        candles = [
+            {
+                "start_time": row.start_time, "open": float(row.open), "high": float(row.high),
+                "low": float(row.low), "close": float(row.close), "volume": row.volume, "trades": row.trades
+            }
+            for row in reversed(rows)
+        ] + candles
+    return candles
+
+candle_aggregator = CandleAggregator(
+    memory_bars=settings.CANDLE_MEMORY_BARS,
+    flush_interval=settings.CANDLE_FLUSH_INTERVAL_S,
+    include_simulated=settings.CANDLE_INCLUDE_SIMULATED
+)
@@ -1,12 +1,113 @@
-import json
+"""
+Redis event publishing.
+
+Callers collect every event one operation produces (an order's trades and
+its book delta) and hand them over together; they go out in a single
+non-transactional pipeline, i.e. one round trip however many fills there
+were. With EVENT_PUBLISH_MODE=background the request does not wait for
+Redis at all: events are queued and a background task publishes everything
+pending in one pipeline per wakeup.
+"""
+import asyncio
+import time
+from typing import List, Optional, Tuple
+import orjson
+from app.config import settings
+from app.logging_config import logger
+from app.metrics import Counter, Histogram
 from app.redis import get_redis
 
-async def publish_trade(trade_data: dict, symbol: str):
-    redis = await get_redis()
-    channel = f"trades:{symbol}"
-    await redis.publish(channel, json.dumps(trade_data, default=str))
+# (channel, payload)
+Event = Tuple[str, dict]
+
+PUBLISH_SECONDS = Histogram("event_publish_seconds", "Duration of one pipelined PUBLISH round trip")
+PUBLISH_BATCH = Histogram(
+    "event_publish_batch_size", "Events per pipelined PUBLISH round trip",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+)
+EVENTS_PUBLISHED = Counter("events_published_total", "Events published to Redis")
+EVENTS_DROPPED = Counter("events_dropped_total", "Events discarded because Redis failed or the backlog was full")
+
+def encode(data: dict) -> bytes:
+    return orjson.dumps(data, default=str)
 
-async def publish_orderbook_update(symbol: str, depth: dict):
+def trade_event(symbol: str, trade_data: dict) -> Event:
+    return f"trades:{symbol}", trade_data
+
+def orderbook_event(symbol: str, update: dict) -> Event:
+    # update is an incremental L2 delta: {"seq": n, "changes": [{"side", "price", "qty"}]}
+    return f"orderbook:{symbol}", update
+
+async def publish_now(events: List[Event]):
     redis = await get_redis()
-    channel = f"orderbook:{symbol}"
-    await redis.publish(channel, json.dumps(depth, default=str))
+    started = time.perf_counter()
+    async with redis.pipeline(transaction=False) as pipe:
+        for channel, data in events:
+            pipe.publish(channel, encode(data))
+        await pipe.execute()
+    PUBLISH_SECONDS.observe(time.perf_counter() - started)
+    PUBLISH_BATCH.observe(len(events))
+    EVENTS_PUBLISHED.inc(len(events))
+
+class BackgroundPublisher:
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self._pending: List[Event] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        await self._flush()
+
+    def enqueue(self, events: List[Event]):
+        if len(self._pending) + len(events) > self.max_pending:
+            # Market data is only useful while fresh; shed it rather than grow without bound
+            EVENTS_DROPPED.inc(len(events))
+            return
+        self._pending.extend(events)
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            await self._flush()
+
+    async def _flush(self):
+        events, self._pending = self._pending, []
+        if not events:
+            return
+        try:
+            await publish_now(events)
+        except Exception as e:
+            EVENTS_DROPPED.inc(len(events))
+            logger.error("event_publish_failed", extra={"fields": {"events": len(events), "error": str(e)}})
+
+background_publisher = BackgroundPublisher(settings.EVENT_PUBLISH_MAX_PENDING)
+
+async def publish_events(events: List[Event]):
+    if not events:
+        return
+    if background_publisher.running:
+        background_publisher.enqueue(events)
+    else:
+        await publish_now(events)
+
+async def publish_trade(trade_data: dict, symbol: str):
+    await publish_events([trade_event(symbol, trade_data)])
+
+async def publish_orderbook_update(symbol: str, update: dict):
+    await publish_events([orderbook_event(symbol, update)])
@@ -0,0 +1,108 @@
+"""
+Order and trade history of one user.
+
+Pages are keyset-paginated on (created_at, id), newest first. The cursor is
+the position of the last row returned and the next page seeks straight past
+it on idx_orders_user_created / idx_trades_{buyer,seller}_created, so a deep
+page costs the same as the first. Exports run the same queries through a
+server-side cursor and stream them as NDJSON, EXPORT_CHUNK rows at a time,
+without materializing the history.
+"""
+import base64
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+import orjson
+from sqlalchemy import Select, literal, select, tuple_, union_all
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import SessionLocal
+from app.exceptions import InstrumentNotFoundError, InvalidCursorError
+from app.models.order import Order, OrderSide, OrderStatus
+from app.models.trade import Trade
+from app.services import instrument as instrument_service
+
+EXPORT_CHUNK = 1000
+
+ORDER_FIELDS = (
+    Order.id, Order.instrument_id, Order.side, Order.type, Order.status,
+    Order.price, Order.quantity, Order.filled_quantity, Order.created_at
+)
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    return base64.urlsafe_b64encode(orjson.dumps([created_at.isoformat(), row_id])).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, row_id = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise InvalidCursorError()
+
+async def _instrument_id(db: AsyncSession, symbol: Optional[str]) -> Optional[int]:
+    if symbol is None:
+        return None
+    instrument = await instrument_service.get_instrument_by_symbol(db, symbol)
+    if not instrument:
+        raise InstrumentNotFoundError(f"Instrument {symbol} not found")
+    return instrument.id
+
+async def orders_query(db: AsyncSession, user_id: int, symbol: Optional[str] = None,
+                       status: Optional[OrderStatus] = None, cursor: Optional[str] = None) -> Select:
+    query = select(*ORDER_FIELDS).where(Order.user_id == user_id)
+    instrument_id = await _instrument_id(db, symbol)
+    if instrument_id is not None:
+        query = query.where(Order.instrument_id == instrument_id)
+    if status is not None:
+        query = query.where(Order.status == status)
+    if cursor is not None:
+        query = query.where(tuple_(Order.created_at, Order.id) < decode_cursor(cursor))
+    return query.order_by(Order.created_at.desc(), Order.id.desc())
+
+async def trades_query(db: AsyncSession, user_id: int, symbol: Optional[str] = None,
+                       cursor: Optional[str] = None, limit: Optional[int] = None) -> Select:
+    instrument_id = await _instrument_id(db, symbol)
+    before = decode_cursor(cursor) if cursor is not None else None
+
+    def side(owner, order_id, order_side: OrderSide) -> Select:
+        query = (
+            select(Trade.id, order_id.label("order_id"), Trade.instrument_id,
+                   literal(order_side.value).label("side"), Trade.price, Trade.quantity, Trade.created_at)
+            .where(owner == user_id)
+            .order_by(Trade.created_at.desc(), Trade.id.desc())
+        )
+        if instrument_id is not None:
+            query = query.where(Trade.instrument_id == instrument_id)
+        if before is not None:
+            query = query.where(tuple_(Trade.created_at, Trade.id) < before)
+        if limit is not None:
+            # Each side seeks its own index; the newest `limit` overall are among these
+            query = query.limit(limit)
+        return query
+
+    # A self-trade is listed once, as the buy, so (created_at, id) stays unique
+    sells = side(Trade.seller_id, Trade.sell_order_id, OrderSide.SELL).where(Trade.buyer_id.is_distinct_from(user_id))
+    trades = union_all(side(Trade.buyer_id, Trade.buy_order_id, OrderSide.BUY), sells).subquery()
+    return select(trades).order_by(trades.c.created_at.desc(), trades.c.id.desc())
+
+async def page(db: AsyncSession, query: Select, limit: int) -> Tuple[List[Row], Optional[str]]:
+    """One page of a history query, and the cursor of the next (None on the last page)."""
+    rows = (await db.execute(query.limit(limit + 1))).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+
+async def export_ndjson(query: Select) -> AsyncIterator[bytes]:
+    # Its own session: the request's is closed before a streamed body is sent
+    async with SessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=EXPORT_CHUNK))
+        async for rows in result.partitions():
+            yield b"".join(orjson.dumps(row._asdict(), default=str) + b"\n" for row in rows)
+
+async def order_page(db: AsyncSession, user_id: int, symbol: Optional[str], status: Optional[OrderStatus],
+                     cursor: Optional[str], limit: int) -> Tuple[List[Row], Optional[str]]:
+    return await page(db, await orders_query(db, user_id, symbol, status, cursor), limit)
+
+async def trade_page(db: AsyncSession, user_id: int, symbol: Optional[str],
+                     cursor: Optional[str], limit: int) -> Tuple[List[Row], Optional[str]]:
+    return await page(db, await trades_query(db, user_id, symbol, cursor, limit + 1), limit)
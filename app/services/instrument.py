@@ -1,23 +1,47 @@
+from typing import List, Optional
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from app.models.instrument import Instrument
 from app.schemas.instrument import InstrumentCreate
+from app.services.instrument_cache import CACHE_MISSES, InstrumentRef, instrument_cache
 
-async def create_instrument(db: AsyncSession, instrument_in: InstrumentCreate):
+async def create_instrument(db: AsyncSession, instrument_in: InstrumentCreate) -> InstrumentRef:
     db_instrument = Instrument(
         symbol=instrument_in.symbol.upper(),
         name=instrument_in.name,
-        current_price=instrument_in.current_price
+        current_price=instrument_in.current_price,
+        tick_size=instrument_in.tick_size
     )
     db.add(db_instrument)
     await db.commit()
     await db.refresh(db_instrument)
-    return db_instrument
+    ref = InstrumentRef.from_row(db_instrument)
+    instrument_cache.put(ref)
+    await instrument_cache.announce_change(ref.symbol)
+    return ref
 
-async def get_all_instruments(db: AsyncSession):
-    result = await db.execute(select(Instrument).where(Instrument.is_active == True))
-    return result.scalars().all()
+async def get_all_instruments(db: AsyncSession) -> List[InstrumentRef]:
+    return instrument_cache.active()
 
-async def get_instrument_by_symbol(db: AsyncSession, symbol: str):
+async def get_instrument_by_symbol(db: AsyncSession, symbol: str) -> Optional[InstrumentRef]:
+    ref = instrument_cache.get(symbol)
+    if ref is not None:
+        return ref
+    # Possibly created by another process whose announcement has not arrived yet
+    CACHE_MISSES.inc()
     result = await db.execute(select(Instrument).where(Instrument.symbol == symbol.upper()))
-    return result.scalars().first()
+    return _cache_row(result.scalars().first())
+
+async def get_instrument_by_id(db: AsyncSession, instrument_id: int) -> Optional[InstrumentRef]:
+    ref = instrument_cache.by_id.get(instrument_id)
+    if ref is not None:
+        return ref
+    CACHE_MISSES.inc()
+    return _cache_row(await db.get(Instrument, instrument_id))
+
+def _cache_row(instrument: Optional[Instrument]) -> Optional[InstrumentRef]:
+    if instrument is None:
+        return None
+    ref = InstrumentRef.from_row(instrument)
+    instrument_cache.put(ref)
+    return ref
@@ -0,0 +1,132 @@
+"""
+Process-wide instrument reference data.
+
+Instruments change rarely, so each process keeps all of them in memory:
+loaded at startup, updated in place by create_instrument, and reloaded
+whenever any process announces a change on the instruments:changed Redis
+channel. Order entry, cancellation, the instruments router and the market
+feed read from here instead of querying Postgres.
+"""
+import asyncio
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional
+from redis.exceptions import RedisError
+from sqlalchemy import select
+from app.database import SessionLocal
+from app.logging_config import logger
+from app.metrics import Counter, Gauge
+from app.models.instrument import Instrument
+from app.redis import get_redis
+
+CHANGED_CHANNEL = "instruments:changed"
+
+CACHED_INSTRUMENTS = Gauge("instrument_cache_size", "Instruments held in the reference data cache")
+CACHE_MISSES = Counter("instrument_cache_misses_total", "Instrument lookups that fell through to Postgres")
+CACHE_RELOADS = Counter("instrument_cache_reloads_total", "Full reloads of the reference data cache")
+
+@dataclass(frozen=True, slots=True)
+class InstrumentRef:
+    """Immutable copy of an instruments row, safe to share between requests."""
+    id: int
+    symbol: str
+    name: str
+    current_price: Decimal
+    tick_size: Decimal
+    is_active: bool
+    created_at: datetime
+    updated_at: Optional[datetime]
+
+    @classmethod
+    def from_row(cls, instrument: Instrument) -> "InstrumentRef":
+        return cls(
+            id=instrument.id,
+            symbol=instrument.symbol,
+            name=instrument.name,
+            current_price=instrument.current_price,
+            tick_size=instrument.tick_size,
+            is_active=instrument.is_active,
+            created_at=instrument.created_at,
+            updated_at=instrument.updated_at
+        )
+
+class InstrumentCache:
+    def __init__(self):
+        self.by_symbol: Dict[str, InstrumentRef] = {}
+        self.by_id: Dict[int, InstrumentRef] = {}
+        self._listener: Optional[asyncio.Task] = None
+        CACHED_INSTRUMENTS.set_function(lambda: len(self.by_id))
+
+    def get(self, symbol: str) -> Optional[InstrumentRef]:
+        return self.by_symbol.get(symbol.upper())
+
+    def tick_size_for(self, symbol: str) -> Optional[Decimal]:
+        ref = self.get(symbol)
+        return ref.tick_size if ref else None
+
+    def symbol_for(self, instrument_id: int) -> Optional[str]:
+        ref = self.by_id.get(instrument_id)
+        return ref.symbol if ref else None
+
+    def active(self) -> List[InstrumentRef]:
+        return [ref for ref in self.by_id.values() if ref.is_active]
+
+    def put(self, ref: InstrumentRef):
+        self.by_symbol[ref.symbol] = ref
+        self.by_id[ref.id] = ref
+
+    async def load(self):
+        async with SessionLocal() as db:
+            rows = (await db.execute(select(Instrument).order_by(Instrument.id))).scalars().all()
+        refs = [InstrumentRef.from_row(row) for row in rows]
+        # Swap whole maps so readers never see a half-built cache
+        self.by_symbol = {ref.symbol: ref for ref in refs}
+        self.by_id = {ref.id: ref for ref in refs}
+        CACHE_RELOADS.inc()
+
+    async def announce_change(self, symbol: str):
+        """Tell every process (this one included) to reload."""
+        await (await get_redis()).publish(CHANGED_CHANNEL, symbol)
+
+    async def start(self):
+        await self.load()
+        logger.info("instrument_cache_loaded", extra={"fields": {"instruments": len(self.by_id)}})
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    async def _listen(self):
+        pubsub = None
+        while True:
+            try:
+                if pubsub is None:
+                    pubsub = (await get_redis()).pubsub()
+                    await pubsub.subscribe(CHANGED_CHANNEL)
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is not None:
+                    await self._reload_quietly()
+            except (RedisError, ConnectionError) as e:
+                logger.warning("instrument_cache_redis_lost", extra={"fields": {"error": str(e)}})
+                if pubsub is not None:
+                    await pubsub.aclose()
+                    pubsub = None
+                await asyncio.sleep(1)
+                # Changes announced while disconnected were missed
+                await self._reload_quietly()
+            except asyncio.CancelledError:
+                if pubsub is not None:
+                    await pubsub.aclose()
+                raise
+
+    async def _reload_quietly(self):
+        try:
+            await self.load()
+        except Exception as e:
+            logger.error("instrument_cache_reload_failed", extra={"fields": {"error": str(e)}})
+
+instrument_cache = InstrumentCache()
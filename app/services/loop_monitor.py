@@ -0,0 +1,42 @@
+"""
+Event loop lag.
+
+Every request, matching pass and WebSocket fan-out shares one event loop, so
+a coroutine that blocks it (a slow serialisation, a synchronous call) delays
+all of them. A task sleeps for a fixed interval and records how much later
+than that it actually woke up: the time the loop was busy with something else.
+"""
+import asyncio
+import time
+from typing import Optional
+from app.config import settings
+from app.metrics import Histogram
+
+LOOP_LAG = Histogram(
+    "event_loop_lag_seconds", "How late the loop monitor woke up after each sleep",
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+).labels()
+
+class LoopLagMonitor:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        interval = self.interval
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            LOOP_LAG.observe(max(time.perf_counter() - started - interval, 0.0))
+
+loop_monitor = LoopLagMonitor(settings.LOOP_LAG_INTERVAL_S)
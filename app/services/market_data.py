@@ -0,0 +1,329 @@
+"""
+Process-wide market data hub for WebSocket clients.
+
+One Redis PubSub connection per process holds a single subscription per
+symbol (its trades:<symbol> and orderbook:<symbol> channels) for as long as
+any local client watches that symbol. Each message is decoded once and
+handed to every local subscriber's bounded queue as a Broadcast, which
+encodes itself at most once per wire format however many clients send it.
+Each WebSocket drains its own queue, so one slow client never delays the others.
+
+Clients may ask for conflation: order book deltas are then merged per
+level (latest quantity wins) and delivered at most once per conflate_ms,
+while trades are still delivered individually. Clients with the same
+interval share one ConflationGroup, so the merged delta is also encoded once.
+
+A subscriber whose queue fills up is a slow consumer, handled per
+WS_SLOW_CONSUMER_POLICY:
+  "drop"        discard its queued order book deltas and resync it with a
+                fresh snapshot instead (deltas cannot be dropped one by one);
+                trades are kept, and if they alone fill the queue it is
+                disconnected
+  "disconnect"  close its WebSocket
+
+The Redis reader skips (and logs) messages it cannot decode, and is
+restarted by its supervisor if it fails outright; subscribers are resynced
+after a restart, as after a lost connection.
+"""
+import asyncio
+from typing import Dict, Optional, Set, Union
+import msgpack
+import orjson
+from redis.exceptions import RedisError
+from app.config import settings
+from app.logging_config import logger
+from app.metrics import Counter, Gauge
+from app.redis import get_redis
+
+SLOW_CONSUMER_POLICIES = ("drop", "disconnect")
+ENCODINGS = ("json", "msgpack")
+
+# Queue markers, handled by the WebSocket sender rather than sent as is
+RESYNC = "resync"
+DISCONNECT = "disconnect"
+
+WS_CONNECTIONS = Gauge("ws_connections", "WebSocket subscribers connected to this process")
+WS_SYMBOLS = Gauge("ws_subscribed_symbols", "Symbols this process holds a Redis subscription for")
+WS_MESSAGES = Counter("ws_messages_total", "Market data messages received from Redis")
+WS_BAD_MESSAGES = Counter("ws_bad_messages_total", "Market data messages from Redis that could not be decoded")
+WS_READER_RESTARTS = Counter("ws_reader_restarts_total", "Times the Redis reader failed and was restarted")
+WS_SLOW_CONSUMERS = Counter("ws_slow_consumers_total", "Subscribers whose queue overflowed", ["policy"])
+WS_DELIVERIES = Counter("ws_deliveries_total", "Broadcasts offered to subscriber queues")
+WS_CONFLATED = Counter("ws_conflated_updates_total", "Order book deltas merged into a later conflated update")
+
+def encode_event(event: dict, encoding: str) -> Union[str, bytes]:
+    """JSON text frame or msgpack binary frame."""
+    if encoding == "msgpack":
+        return msgpack.packb(event)
+    return orjson.dumps(event).decode()
+
+class Broadcast:
+    """One event on its way to many clients, encoded lazily and only once per encoding."""
+    __slots__ = ("event", "_frames")
+
+    def __init__(self, event: dict):
+        self.event = event
+        self._frames: Dict[str, Union[str, bytes]] = {}
+
+    def frame(self, encoding: str) -> Union[str, bytes]:
+        frame = self._frames.get(encoding)
+        if frame is None:
+            frame = self._frames[encoding] = encode_event(self.event, encoding)
+        return frame
+
+def is_depth(item) -> bool:
+    """Order book deltas and resync markers: both are superseded by the next snapshot."""
+    return item is RESYNC or (type(item) is Broadcast and item.event["type"] == "orderbook")
+
+class Subscriber:
+    """One WebSocket's view of the hub: a bounded queue of outbound broadcasts."""
+    __slots__ = ("symbol", "queue", "policy", "conflate_ms", "overflows")
+
+    def __init__(self, symbol: str, queue_size: int, policy: str, conflate_ms: int = 0):
+        self.symbol = symbol
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.policy = policy
+        self.conflate_ms = conflate_ms
+        self.overflows = 0
+
+    def offer(self, item):
+        try:
+            self.queue.put_nowait(item)
+            return
+        except asyncio.QueueFull:
+            pass
+        self.overflows += 1
+        WS_SLOW_CONSUMERS.labels(self.policy).inc()
+        queue = self.queue
+        backlog = []
+        while not queue.empty():
+            backlog.append(queue.get_nowait())
+        if self.policy == "drop":
+            # The snapshot replaces the deltas; trades cannot be recovered, so they stay
+            kept = [queued for queued in backlog if not is_depth(queued)]
+            if not is_depth(item):
+                kept.append(item)
+            if len(kept) < queue.maxsize:
+                for queued in kept:
+                    queue.put_nowait(queued)
+                queue.put_nowait(RESYNC)
+                return
+        queue.put_nowait(DISCONNECT)
+
+class ConflationGroup:
+    """
+    Subscribers of one symbol sharing a conflation interval. Deltas are
+    merged per level as they arrive and flushed as one update per interval;
+    levels are absolute, so the merged delta leaves clients in the same state.
+    """
+
+    def __init__(self, interval_ms: int):
+        self.interval = interval_ms / 1000
+        self.subscribers: Set[Subscriber] = set()
+        self._changes: dict = {} # (side, price) -> change
+        self._seq = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def add(self, update: dict):
+        changes = self._changes
+        if changes:
+            WS_CONFLATED.inc()
+        for change in update["changes"]:
+            changes[(change["side"], change["price"])] = change
+        self._seq = update["seq"]
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if not self._changes:
+                continue
+            broadcast = Broadcast({
+                "type": "orderbook",
+                "data": {"seq": self._seq, "changes": list(self._changes.values())}
+            })
+            self._changes = {}
+            for subscriber in self.subscribers:
+                subscriber.offer(broadcast)
+            WS_DELIVERIES.inc(len(self.subscribers))
+
+class SymbolFeed:
+    """Local subscribers of one symbol: those taking every delta, and the conflation groups."""
+
+    def __init__(self):
+        self.direct: Set[Subscriber] = set()
+        self.groups: Dict[int, ConflationGroup] = {}
+
+    def __len__(self):
+        return len(self.direct) + sum(len(group.subscribers) for group in self.groups.values())
+
+    def subscribers(self):
+        yield from self.direct
+        for group in self.groups.values():
+            yield from group.subscribers
+
+    def add(self, subscriber: Subscriber):
+        if not subscriber.conflate_ms:
+            self.direct.add(subscriber)
+            return
+        group = self.groups.get(subscriber.conflate_ms)
+        if group is None:
+            group = self.groups[subscriber.conflate_ms] = ConflationGroup(subscriber.conflate_ms)
+            group.start()
+        group.subscribers.add(subscriber)
+
+    def remove(self, subscriber: Subscriber):
+        if not subscriber.conflate_ms:
+            self.direct.discard(subscriber)
+            return
+        group = self.groups.get(subscriber.conflate_ms)
+        if group is None:
+            return
+        group.subscribers.discard(subscriber)
+        if not group.subscribers:
+            group.stop()
+            del self.groups[subscriber.conflate_ms]
+
+    def close(self):
+        for group in self.groups.values():
+            group.stop()
+
+class MarketDataHub:
+    def __init__(self, queue_size: int = 1000, policy: str = "drop"):
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {policy}")
+        self.queue_size = queue_size
+        self.policy = policy
+        self.feeds: Dict[str, SymbolFeed] = {}
+        self._pubsub = None
+        self._reader: Optional[asyncio.Task] = None
+        self._lock = asyncio.Lock() # Serialises Redis subscribe/unsubscribe
+        WS_CONNECTIONS.set_function(lambda: sum(len(feed) for feed in self.feeds.values()))
+        WS_SYMBOLS.set_function(lambda: len(self.feeds))
+
+    async def subscribe(self, symbol: str, conflate_ms: int = 0) -> Subscriber:
+        subscriber = Subscriber(symbol, self.queue_size, self.policy, conflate_ms)
+        async with self._lock:
+            feed = self.feeds.get(symbol)
+            if feed is None:
+                feed = self.feeds[symbol] = SymbolFeed()
+                await self._redis_subscribe(symbol)
+            feed.add(subscriber)
+        return subscriber
+
+    async def unsubscribe(self, subscriber: Subscriber):
+        async with self._lock:
+            feed = self.feeds.get(subscriber.symbol)
+            if feed is None:
+                return
+            feed.remove(subscriber)
+            if not len(feed):
+                feed.close()
+                del self.feeds[subscriber.symbol]
+                await self._redis_unsubscribe(subscriber.symbol)
+
+    def publish_local(self, symbol: str, event: dict):
+        """Fan an already decoded event out to this process's subscribers of symbol."""
+        feed = self.feeds.get(symbol)
+        if feed is None:
+            return
+        broadcast = Broadcast(event)
+        if event["type"] == "orderbook":
+            for subscriber in feed.direct:
+                subscriber.offer(broadcast)
+            WS_DELIVERIES.inc(len(feed.direct))
+            for group in feed.groups.values():
+                group.add(event["data"])
+        else:
+            # Trades are never conflated
+            for subscriber in feed.subscribers():
+                subscriber.offer(broadcast)
+            WS_DELIVERIES.inc(len(feed))
+
+    async def stop(self):
+        if self._reader is not None:
+            self._reader.cancel()
+            await asyncio.gather(self._reader, return_exceptions=True)
+            self._reader = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+
+    async def _redis_subscribe(self, symbol: str):
+        if self._pubsub is None:
+            self._pubsub = (await get_redis()).pubsub()
+        await self._pubsub.subscribe(f"trades:{symbol}", f"orderbook:{symbol}")
+        if self._reader is None:
+            self._reader = asyncio.create_task(self._supervise())
+
+    async def _redis_unsubscribe(self, symbol: str):
+        if not self.feeds:
+            # Last local client gone: drop the connection rather than idle-read it
+            await self.stop()
+        elif self._pubsub is not None:
+            await self._pubsub.unsubscribe(f"trades:{symbol}", f"orderbook:{symbol}")
+
+    async def _supervise(self):
+        while True:
+            try:
+                await self._read_loop()
+            except Exception as e:
+                WS_READER_RESTARTS.inc()
+                logger.error("market_data_reader_failed", extra={"fields": {"error": repr(e)}})
+                await asyncio.sleep(1)
+                # Whatever arrived while the reader was down is lost
+                self._resync_all()
+
+    async def _read_loop(self):
+        # Blocks in get_message until a message arrives, instead of polling
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except (RedisError, ConnectionError) as e:
+                logger.warning("market_data_redis_lost", extra={"fields": {"error": str(e)}})
+                await self._reconnect()
+                continue
+            if message is None:
+                continue
+            WS_MESSAGES.inc()
+            kind, _, symbol = message["channel"].partition(":")
+            try:
+                event = {
+                    "type": "trade" if kind == "trades" else "orderbook",
+                    "data": orjson.loads(message["data"])
+                }
+                self.publish_local(symbol, event)
+            except (orjson.JSONDecodeError, KeyError, TypeError) as e:
+                WS_BAD_MESSAGES.inc()
+                logger.warning("market_data_bad_message", extra={"fields": {
+                    "channel": message["channel"], "error": repr(e)
+                }})
+
+    def _resync_all(self):
+        for feed in self.feeds.values():
+            for subscriber in feed.subscribers():
+                subscriber.offer(RESYNC)
+
+    async def _reconnect(self):
+        async with self._lock:
+            while True:
+                await asyncio.sleep(1)
+                try:
+                    await self._pubsub.aclose()
+                    self._pubsub = (await get_redis()).pubsub()
+                    for symbol in self.feeds:
+                        await self._pubsub.subscribe(f"trades:{symbol}", f"orderbook:{symbol}")
+                    break
+                except (RedisError, ConnectionError) as e:
+                    logger.warning("market_data_resubscribe_failed", extra={"fields": {"error": str(e)}})
+            # Anything published while disconnected is lost; have everyone resync
+            self._resync_all()
+
+market_data_hub = MarketDataHub(settings.WS_CLIENT_QUEUE_SIZE, settings.WS_SLOW_CONSUMER_POLICY)
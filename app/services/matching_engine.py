@@ -1,124 +1,241 @@
 import asyncio
-from typing import Dict, List, Tuple, Optional
+import time
+from collections import OrderedDict
+from decimal import Decimal
+from typing import Dict, Iterable, List, Tuple, Optional
+from app.config import settings
+from app.engine.commands import CancelOrder
+from app.engine.execution import (
+    ORDERBOOK_IMPLEMENTATIONS, Command, execute_command, load_sorted_rows, new_order_command
+)
+from app.engine.journal import Journal, ReplayedOrder, recover
 from app.engine.orderbook import OrderBook, OrderBookEntry
-from app.models.order import Order, OrderSide, OrderType, OrderStatus
-from app.models.trade import Trade
-from app.schemas.order import OrderCreate
+from app.engine.ticks import DEFAULT_TICK_SIZE
+from app.logging_config import logger
+from app.metrics import Gauge, Histogram
+from app.models.order import Order, OrderSide
+from app.services.instrument_cache import instrument_cache
+
+# Per-symbol book gauges are read from the local books at scrape time; with
+# ENGINE_SHARDS > 0 the books live in the shard processes and are not reported
+BOOK_ORDERS = Gauge("engine_book_orders", "Orders resting in the book", ["symbol"])
+BOOK_LEVELS = Gauge("engine_book_levels", "Price levels in the book, both sides", ["symbol"])
+LOCK_WAIT = Histogram(
+    "engine_lock_wait_seconds", "Time spent waiting for a book lock",
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
+).labels()
 
 class MatchingEngine:
-    def __init__(self):
+    """
+    In-process matching engine.
+
+    Each request coroutine matches under a per-symbol asyncio.Lock.
+
+    With JOURNAL_DIR set, every command is journaled just before it is
+    applied, and start() rebuilds the books by replaying the journal.
+    With PERSISTENCE_MODE=write_behind it also tracks which journaled orders
+    the persistence pipeline has not committed yet (see persisted()), and
+    start() hands those back as `recovered` for the pipeline to commit.
+    """
+
+    def __init__(self, book_impl: Optional[str] = None, journal_dir: Optional[str] = None):
+        book_impl = book_impl or settings.ORDERBOOK_IMPL
+        if book_impl not in ORDERBOOK_IMPLEMENTATIONS:
+            raise ValueError(f"Unknown order book implementation: {book_impl}")
+        self.book_factory = ORDERBOOK_IMPLEMENTATIONS[book_impl]
         self.orderbooks: Dict[str, OrderBook] = {}
         self.locks: Dict[str, asyncio.Lock] = {}
         self._global_lock = asyncio.Lock() # For creating new books safely
+        self.journal_dir = journal_dir or settings.JOURNAL_DIR
+        self.journal: Optional[Journal] = None
+        self._journal_task: Optional[asyncio.Task] = None
+        self._warm_started: set = set()
+        self.track_persistence = settings.PERSISTENCE_MODE == "write_behind"
+        # order_id -> journal seq of orders applied but not yet committed, oldest first
+        self.unpersisted: "OrderedDict[int, int]" = OrderedDict()
+        # Acked before a crash but never committed; taken by the persistence pipeline
+        self.recovered: List[ReplayedOrder] = []
+
+    async def start(self):
+        if not self.journal_dir:
+            return
+        self.journal, result = recover(
+            self.journal_dir, self.book_factory,
+            segment_bytes=settings.JOURNAL_SEGMENT_MB << 20,
+            sync_every=settings.JOURNAL_SYNC_EVERY,
+            track_persisted=self.track_persistence
+        )
+        for symbol, book in result.books.items():
+            self._install_book(symbol, book)
+        # A restored book is authoritative even when empty: Postgres may still
+        # show makers that unpersisted fills took out of it
+        self._warm_started.update(result.books)
+        for order in result.unpersisted:
+            self.unpersisted[order.command.order_id] = order.seq
+        self.recovered = result.unpersisted
+        logger.info("engine_journal_recovered", extra={"fields": {
+            "books": len(result.books), "snapshot_seq": result.snapshot_seq,
+            "events": result.events, "seconds": round(result.seconds, 3),
+            "unpersisted_orders": len(result.unpersisted)
+        }})
+        self._journal_task = asyncio.create_task(self.journal.run_background(
+            settings.JOURNAL_SYNC_INTERVAL_MS / 1000,
+            settings.JOURNAL_SNAPSHOT_INTERVAL_S,
+            lambda: self.orderbooks
+        ))
 
-    async def get_orderbook(self, symbol: str) -> OrderBook:
+    async def get_orderbook(self, symbol: str, tick_size: Optional[Decimal] = None) -> OrderBook:
         if symbol not in self.orderbooks:
             async with self._global_lock:
                 if symbol not in self.orderbooks:
-                    self.orderbooks[symbol] = OrderBook(symbol)
-                    self.locks[symbol] = asyncio.Lock()
+                    # Whoever touches the symbol first (a snapshot, a cancel) may have no
+                    # tick, so a known instrument's own tick always wins; the default is
+                    # only for symbols without an instrument, e.g. in benchmarks
+                    tick_size = instrument_cache.tick_size_for(symbol) or tick_size or DEFAULT_TICK_SIZE
+                    self._install_book(symbol, self.book_factory(symbol, tick_size))
         return self.orderbooks[symbol]
 
-    async def process_order(self, order: Order) -> Tuple[List[dict], int]:
+    async def book_tick_size(self, instrument) -> Decimal:
+        """
+        Tick size the instrument's book matches in. Prices in its fills and
+        entries are integer ticks of this, so settlement converts with it.
+        """
+        return (await self.get_orderbook(instrument.symbol, instrument.tick_size)).tick_size
+
+    def _install_book(self, symbol: str, book: OrderBook):
+        self.locks[symbol] = asyncio.Lock()
+        self.orderbooks[symbol] = book
+        BOOK_ORDERS.labels(symbol).set_function(lambda: len(book.orders))
+        BOOK_LEVELS.labels(symbol).set_function(book.level_count)
+
+    def _apply(self, book: OrderBook, command: Command):
+        if self.journal is None:
+            return execute_command(book, command)
+        seq = self.journal.append(book.symbol, book.tick_size, command)
+        result = execute_command(book, command)
+        if self.track_persistence and type(command) is not CancelOrder:
+            self.unpersisted[command.order_id] = seq
+        return result
+
+    def persisted(self, order_ids: Iterable[int]):
         """
-        Process an order against the order book.
+        The persistence pipeline committed (or dead-lettered) these orders.
+        Journals the new watermark: every order before the oldest one still
+        outstanding is in Postgres, so recovery need not replay it.
+        """
+        if self.journal is None:
+            return
+        unpersisted = self.unpersisted
+        for order_id in order_ids:
+            unpersisted.pop(order_id, None)
+        watermark = next(iter(unpersisted.values())) - 1 if unpersisted else self.journal.seq
+        if watermark > self.journal.persisted_seq:
+            self.journal.mark_persisted(watermark)
+
+    def take_recovered(self) -> List[ReplayedOrder]:
+        recovered, self.recovered = self.recovered, []
+        return recovered
+
+    async def submit(self, symbol: str, command: Command):
+        """Apply one command to the symbol's book."""
+        book = self.orderbooks[symbol]
+        # We need to lock the book for this instrument
+        lock = self.locks[symbol]
+        started = time.perf_counter()
+        async with lock:
+            LOCK_WAIT.observe(time.perf_counter() - started)
+            return self._apply(book, command)
+
+    async def process_order(self, order: Order, instrument) -> Tuple[List[dict], int]:
+        """
+        Process an order against the order book of `instrument` (anything with
+        symbol and tick_size, normally a cached InstrumentRef).
         Returns a tuple of (trades_to_create, filled_quantity).
-        trades_to_create is a list of dicts with trade details.
+        trades_to_create is a list of dicts with trade details; prices are
+        integer ticks of the book's tick size (see book_tick_size).
         Does NOT update the DB. That is the caller's responsibility.
-        Does NOT update the in-memory book yet. Caller must confirm.
         """
-        symbol = order.instrument.symbol
+        symbol = instrument.symbol
+        book = await self.get_orderbook(symbol, instrument.tick_size)
+
+        command = new_order_command(order, book.tick_size)
+        matches, filled_qty = await self.submit(symbol, command)
+        return matches, order.filled_quantity + filled_qty
+
+    async def submit_batch(self, instrument, commands: List[Command]) -> list:
+        """
+        Apply several commands to one book in a single pass (one lock hold).
+        Results are in command order: (matches,
+        quantity filled) for a NewOrder, the removed entry or None for a CancelOrder.
+        """
+        symbol = instrument.symbol
+        book = await self.get_orderbook(symbol, instrument.tick_size)
+        lock = self.locks[symbol]
+        started = time.perf_counter()
+        async with lock:
+            LOCK_WAIT.observe(time.perf_counter() - started)
+            return [self._apply(book, command) for command in commands]
+
+    async def cancel_order(self, symbol: str, order_id: int) -> Optional[OrderBookEntry]:
+        """
+        Remove a resting order from the book.
+        Returns the removed entry (with its unfilled quantity), or None if the
+        order is not resting, e.g. because it was filled in the meantime.
+        """
+        await self.get_orderbook(symbol)
+        return await self.submit(symbol, CancelOrder(order_id=order_id))
+
+    async def claim_warm_start(self, symbol: str, tick_size: Decimal) -> bool:
+        """
+        True if the caller should load this symbol's resting orders from the
+        database: nobody claimed it yet and the journal did not already restore it.
+        """
+        book = await self.get_orderbook(symbol, tick_size)
+        if symbol in self._warm_started or book.orders:
+            return False
+        self._warm_started.add(symbol)
+        return True
+
+    async def load_resting(self, symbol: str, tick_size: Decimal, side: OrderSide, rows: List[Tuple[int, int, int, int]]):
+        """Append (order_id, user_id, price_ticks, quantity) rows, already in priority order, to one side."""
+        load_sorted_rows(await self.get_orderbook(symbol, tick_size), side, rows)
+
+    async def checkpoint(self):
+        # Books loaded outside the command path are only durable once snapshotted
+        if self.journal is not None:
+            self.journal.write_snapshot(self.orderbooks)
+
+    async def drain_depth_update(self, symbol: str) -> Optional[dict]:
+        """
+        Changed L2 levels since the last drain, as {"seq", "changes"}, or None.
+        No lock needed: draining never awaits, so it cannot interleave with matching.
+        """
         book = await self.get_orderbook(symbol)
-        
-        # We need to lock the book for this instrument
-        async with self.locks[symbol]:
-            matches = []
-            remaining_qty = order.quantity - order.filled_quantity
-            
-            if order.side == OrderSide.BUY:
-                # Match against Asks (Sells)
-                # Look for lowest price first
-                while remaining_qty > 0 and book.asks:
-                    best_ask = book.get_best_ask()
-                    
-                    # Check price condition
-                    if order.type == OrderType.LIMIT and best_ask.price > float(order.price):
-                        break
-                        
-                    # Match found
-                    match_qty = min(remaining_qty, best_ask.quantity)
-                    price = best_ask.price # Executed at the maker's price
-                    
-                    matches.append({
-                        "buy_order_id": order.id,
-                        "sell_order_id": best_ask.order_id,
-                        "instrument_id": order.instrument_id,
-                        "price": price,
-                        "quantity": match_qty,
-                        "maker_order_id": best_ask.order_id
-                    })
-                    
-                    remaining_qty -= match_qty
-                    
-                    # Update maker order in book (temporarily for this calculation? No, we must update book)
-                    # Use a strategy: Optimistic matching?
-                    # Since we hold the lock, we can modify the book.
-                    # If DB transaction fails later, we are in trouble.
-                    # BUT: We are inside a lock. If DB fails, we crash or raise exception.
-                    # We should probably rollback memory changes. 
-                    
-                    # Simplified for this exercise: Modify book. If DB commit fails, we might have drift.
-                    # In production, we'd replay from DB event log on restart.
-                    
-                    best_ask.quantity -= match_qty
-                    if best_ask.quantity == 0:
-                        book.asks.remove(best_ask)
-                        del book.orders[best_ask.order_id]
-            
-            else: # SELL
-                # Match against Bids (Buys)
-                # Look for highest price first
-                while remaining_qty > 0 and book.bids:
-                    best_bid = book.get_best_bid()
-                    
-                    if order.type == OrderType.LIMIT and best_bid.price < float(order.price):
-                        break
-                        
-                    match_qty = min(remaining_qty, best_bid.quantity)
-                    price = best_bid.price
-                    
-                    matches.append({
-                        "buy_order_id": best_bid.order_id,
-                        "sell_order_id": order.id,
-                        "instrument_id": order.instrument_id,
-                        "price": price,
-                        "quantity": match_qty,
-                        "maker_order_id": best_bid.order_id
-                    })
-                    
-                    remaining_qty -= match_qty
-                    
-                    best_bid.quantity -= match_qty
-                    if best_bid.quantity == 0:
-                        book.bids.remove(best_bid)
-                        del book.orders[best_bid.order_id]
-
-            # If order not fully filled, add to book
-            if remaining_qty > 0:
-                # Valid for LIMIT orders. MARKET orders that verify liquidity should shouldn't be here if no liquidity?
-                # Or just partial fill and cancel rest? 
-                # Standard NASDAQ: Market orders cancel if no liquidity. Limit orders rest.
-                if order.type == OrderType.LIMIT:
-                    entry = OrderBookEntry(
-                        order_id=order.id,
-                        user_id=order.user_id,
-                        price=float(order.price),
-                        quantity=remaining_qty,
-                        timestamp=order.created_at.timestamp(),
-                        order_type=order.type
-                    )
-                    book.add_order(entry, order.side)
-            
-            return matches, order.quantity - remaining_qty
-
-matching_engine = MatchingEngine()
+        return book.drain_deltas()
+
+    async def get_depth_snapshot(self, symbol: str, depth: Optional[int] = None) -> dict:
+        book = await self.get_orderbook(symbol)
+        return book.snapshot(depth or settings.ORDERBOOK_SNAPSHOT_DEPTH)
+
+    def memory_report(self) -> Dict[str, int]:
+        """Approximate bytes held per symbol, see OrderBook.memory_usage."""
+        return {symbol: book.memory_usage() for symbol, book in self.orderbooks.items()}
+
+    async def fetch_memory_report(self) -> Dict[str, int]:
+        # Same shape as ShardedMatchingEngine.fetch_memory_report
+        return self.memory_report()
+
+    async def shutdown(self):
+        if self._journal_task is not None:
+            self._journal_task.cancel()
+        if self.journal is not None:
+            self.journal.close()
+
+def create_matching_engine():
+    # ENGINE_SHARDS > 0: books live in separate worker processes (python -m app.engine.shard)
+    if settings.ENGINE_SHARDS > 0:
+        from app.services.sharded_engine import ShardedMatchingEngine
+        return ShardedMatchingEngine(settings.ENGINE_SHARDS, settings.ENGINE_SOCKET_DIR)
+    return MatchingEngine()
+
+matching_engine = create_matching_engine()
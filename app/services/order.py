@@ -1,62 +1,116 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import List, Optional, Tuple
+from sqlalchemy import select, update, insert, bindparam, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from app.models.order import Order, OrderSide, OrderType, OrderStatus
-from app.models.user import User, Account
-from app.models.instrument import Instrument
+from app.models.user import Account
+from app.services import instrument as instrument_service
+from app.services.instrument_cache import InstrumentRef
+from app.services.principal_cache import Principal
+from app.services.risk_ledger import Credits, Reservation, risk_ledger
 from app.models.trade import Trade, Holding
 from app.schemas.order import OrderCreate
+from app.config import settings
 from app.services.matching_engine import matching_engine
-from app.exceptions import InsufficientFundsError, InstrumentNotFoundError, InsufficientHoldingsError
+from app.services.persistence import OrderWrite, persistence_pipeline, unused_hold
+from app.engine.commands import CancelOrder
+from app.engine.ticks import price_to_ticks, ticks_to_price
+from app.exceptions import (
+    InsufficientFundsError, InstrumentNotFoundError, InsufficientHoldingsError,
+    OrderNotFoundError, OrderNotCancellableError
+)
+from app.logging_config import logger
+from app.metrics import Histogram
+from app.services.request_trace import OrderTrace, Stage
 
-async def create_order(db: AsyncSession, order_in: OrderCreate, user: User):
-    # 1. Validate Instrument
-    result = await db.execute(select(Instrument).where(Instrument.symbol == order_in.instrument_symbol.upper()))
-    instrument = result.scalars().first()
+CANCELLABLE_STATUSES = (OrderStatus.OPEN, OrderStatus.PARTIALLY_FILLED)
+
+ORDER_ENTRY_SECONDS = Histogram("order_entry_seconds", "Duration of create_order, from validation to publishing")
+ORDER_STAGE_SECONDS = Histogram("order_stage_seconds", "Duration of each create_order stage", ["stage"])
+# Children resolved once; each stage also lands in the request's slow-request trace
+STAGE_INSTRUMENT = Stage(ORDER_STAGE_SECONDS, "instrument") # instrument lookup and price validation
+STAGE_RISK = Stage(ORDER_STAGE_SECONDS, "risk")             # risk ledger reservation
+STAGE_HOLD = Stage(ORDER_STAGE_SECONDS, "hold")             # database hold of cash or holdings
+STAGE_INSERT = Stage(ORDER_STAGE_SECONDS, "insert")         # order row flush and refresh (sync)
+STAGE_MATCH = Stage(ORDER_STAGE_SECONDS, "match")           # engine, including lock wait
+STAGE_SETTLE = Stage(ORDER_STAGE_SECONDS, "settle")         # settlement statements (sync)
+STAGE_COMMIT = Stage(ORDER_STAGE_SECONDS, "commit")         # commit and refresh (sync)
+STAGE_ENQUEUE = Stage(ORDER_STAGE_SECONDS, "enqueue")       # handoff to the persistence pipeline (write-behind)
+STAGE_PUBLISH = Stage(ORDER_STAGE_SECONDS, "publish")       # Redis events
+ORDER_ENTRY = ORDER_ENTRY_SECONDS.labels()
+
+async def create_order(db: AsyncSession, order_in: OrderCreate, user: Principal):
+    trace = OrderTrace(
+        "create_order", user_id=user.id, symbol=order_in.instrument_symbol, side=order_in.side.value,
+        type=order_in.type.value, quantity=order_in.quantity, persistence=settings.PERSISTENCE_MODE
+    )
+    with trace, ORDER_ENTRY.time():
+        with STAGE_INSTRUMENT.time():
+            instrument, cost = await validate_order(db, order_in)
+
+        # In-memory pre-trade check and reservation, if the risk ledger is enabled
+        with STAGE_RISK.time():
+            reservation = await risk_ledger.reserve(user.id, instrument.id, order_in.side, cost, order_in.quantity)
+
+        if settings.PERSISTENCE_MODE == "write_behind":
+            return await create_order_write_behind(db, order_in, user, instrument, cost, reservation)
+
+        try:
+            return await create_order_sync(db, order_in, user, instrument, cost, reservation)
+        except BaseException:
+            # No-op if the order was committed before the failure
+            risk_ledger.release(reservation)
+            raise
+
+async def validate_order(db: AsyncSession, order_in: OrderCreate) -> Tuple[InstrumentRef, Optional[Decimal]]:
+    """Resolve the instrument, check the price and return (instrument, cash a BUY must hold)."""
+    # 1. Validate Instrument (reference data cache, no round trip)
+    instrument = await instrument_service.get_instrument_by_symbol(db, order_in.instrument_symbol)
     if not instrument:
         raise InstrumentNotFoundError(f"Instrument {order_in.instrument_symbol} not found")
 
     # 2. Validate Funds/Holdings & Lock Funds
-    # We need to lock the account or holding row to prevent race conditions
-    # For MVP, we'll just check and update in transaction. Serailizable isolation or row locking needed for production.
-    
+    # Prices are validated against the tick grid here, at the API boundary.
+    # From this point the engine and the cost/settlement maths use integer
+    # ticks and integer notional (ticks * qty), converted back only for the DB.
+    # The grid is the book's, which is what the engine converts prices with.
+    tick_size = await matching_engine.book_tick_size(instrument)
+    if order_in.type == OrderType.LIMIT:
+        if order_in.price is None:
+            raise ValueError("Limit orders require a price")
+        price_ticks = price_to_ticks(order_in.price, tick_size)
+
+    cost = None
     if order_in.side == OrderSide.BUY:
-        # Check cash balance
-        cost = order_in.price * order_in.quantity # Logic for MARKET orders? 
-        # Market orders need estimated price. For now, assume LIMIT or reject MARKET without price (simplified)
-        # Or take current market price + buffer. Standard practice is to reject if no funds for estimated cost.
-        
         if order_in.type == OrderType.MARKET:
-            # Simplified: Reject market orders for now or treat as Limit with high price?
-            # Let's require price for now to simplify, or fetch current price.
-            # IF using MARKET, we'd need to peek at orderbook for best price.
+            # Market orders need estimated price.
+            # Standard practice is to reject if no funds for estimated cost.
+            # IF using MARKET without a price, we peek at orderbook for best price.
             if not order_in.price:
                 # Get best ask
-                book = await matching_engine.get_orderbook(instrument.symbol)
+                book = await matching_engine.get_orderbook(instrument.symbol, instrument.tick_size)
                 best_ask = book.get_best_ask()
                 if not best_ask:
                     raise ValueError("No liquidity for market order")
-                estimated_price = best_ask.price
+                cost = ticks_to_price(best_ask.price * order_in.quantity, tick_size)
             else:
-                 estimated_price = order_in.price
-            cost = estimated_price * order_in.quantity
-
-        if user.account.cash_balance < cost:
-            raise InsufficientFundsError(f"Insufficient funds. Required: {cost}, Available: {user.account.cash_balance}")
-        
-        # Deduct cash (Hold it)
-        user.account.cash_balance -= cost
-        db.add(user.account)
-
-    else: # SELL
-        # Check holdings
-        result = await db.execute(select(Holding).where(Holding.user_id == user.id, Holding.instrument_id == instrument.id))
-        holding = result.scalars().first()
-        if not holding or holding.quantity < order_in.quantity:
-             raise InsufficientHoldingsError(f"Insufficient holdings for {instrument.symbol}")
-        
-        # Deduct holdings (Hold them)
-        holding.quantity -= order_in.quantity
-        db.add(holding)
+                cost = order_in.price * order_in.quantity
+        else:
+            cost = ticks_to_price(price_ticks * order_in.quantity, tick_size)
+    return instrument, cost
+
+async def create_order_sync(db: AsyncSession, order_in: OrderCreate, user: Principal, instrument: InstrumentRef,
+                            cost: Optional[Decimal], reservation: Optional[Reservation]) -> Order:
+    """Order entry with PERSISTENCE_MODE=sync: hold, match and settle in one transaction."""
+    # Fill prices come back in the book's ticks
+    tick_size = await matching_engine.book_tick_size(instrument)
+
+    # Hold cash or holdings; committed together with the order and its fills.
+    # Authoritative even with the risk ledger, which may lag other processes.
+    with STAGE_HOLD.time():
+        await hold_for_order(db, order_in, user, instrument, cost)
 
     # 3. Create Order
     db_order = Order(
@@ -68,84 +122,23 @@ async def create_order(db: AsyncSession, order_in: OrderCreate, user: User):
         quantity=order_in.quantity,
         status=OrderStatus.OPEN
     )
-    db_order.instrument = instrument
-    db_order.user = user
     db.add(db_order)
-    await db.flush() # Get ID
-    await db.refresh(db_order)
-    db_order.instrument = instrument
-    db_order.user = user
+    with STAGE_INSERT.time():
+        await db.flush() # Get ID
+        await db.refresh(db_order)
     
     # 4. Match Order
     # This might need to happen AFTER commit if we want to ensure order is persisted before matching?
     # But we want atomic trade execution.
     # So we match in memory, get proposed trades, and write them to DB in same transaction.
     
-    matches, filled_qty = await matching_engine.process_order(db_order)
+    with STAGE_MATCH.time():
+        matches, filled_qty = await matching_engine.process_order(db_order, instrument)
     
     # 5. Apply Matches
-    for match in matches:
-        # Create Trade
-        trade = Trade(
-            buy_order_id=match["buy_order_id"],
-            sell_order_id=match["sell_order_id"],
-            instrument_id=instrument.id,
-            price=match["price"],
-            quantity=match["quantity"]
-        )
-        db.add(trade)
-        
-        # Update Makers (Passive orders)
-        # We need to fetch the maker order from DB to update its status
-        # Since we might have multiple makers, loop them.
-        maker_order_id = match["maker_order_id"]
-        result = await db.execute(select(Order).where(Order.id == maker_order_id))
-        maker_order = result.scalars().first()
-        
-        maker_order.filled_quantity += match["quantity"]
-        if maker_order.filled_quantity == maker_order.quantity:
-            maker_order.status = OrderStatus.FILLED
-        else:
-            maker_order.status = OrderStatus.PARTIALLY_FILLED
-        db.add(maker_order)
-        
-        # Update Taker (Current Order)
-        # We update it at the end, or cumulatively
-        # Also need to settle funds for the TRADE
-        
-        # Buyer: Already paid 'cost'. If bought at better price, refund difference.
-        # Seller: Receive cash.
-        
-        buy_order = db_order if db_order.side == OrderSide.BUY else maker_order
-        sell_order = db_order if db_order.side == OrderSide.SELL else maker_order
-        
-        # Seller gets cash
-        # Need to fetch seller account. If seller is current user, we have it. If not, fetch.
-        if sell_order.user_id == user.id:
-            seller_account = user.account
-        else:
-            result = await db.execute(select(Account).where(Account.user_id == sell_order.user_id))
-            seller_account = result.scalars().first()
-        
-        trade_value = match["price"] * match["quantity"]
-        seller_account.cash_balance += trade_value
-        db.add(seller_account)
-        
-        # Buyer gets Instrument
-        # Fetch buyer holding
-        if buy_order.user_id == user.id:
-            buyer_id = user.id
-        else:
-            buyer_id = buy_order.user_id
-            
-        result = await db.execute(select(Holding).where(Holding.user_id == buyer_id, Holding.instrument_id == instrument.id))
-        buyer_holding = result.scalars().first()
-        if not buyer_holding:
-            buyer_holding = Holding(user_id=buyer_id, instrument_id=instrument.id, quantity=0)
-            db.add(buyer_holding)
-        
-        buyer_holding.quantity += match["quantity"]
-        db.add(buyer_holding)
+    with STAGE_SETTLE.time():
+        credits = await settle_matches(db, db_order, matches, instrument, tick_size) if matches else Credits()
+        await release_unused_hold(db, db_order, cost, matches, tick_size, credits)
 
     # 6. Update Taker Order Status
     db_order.filled_quantity = filled_qty
@@ -158,30 +151,394 @@ async def create_order(db: AsyncSession, order_in: OrderCreate, user: User):
     
     db.add(db_order)
     
-    await db.commit()
-    await db.refresh(db_order)
-    
-    # 7. Publish Events (Fire and forget, or background task)
-    from app.services.event import publish_trade, publish_orderbook_update
+    with STAGE_COMMIT.time():
+        async with risk_ledger.committing():
+            await db.commit()
+            risk_ledger.committed([reservation])
+            risk_ledger.credit(credits)
+        await db.refresh(db_order)
     
-    # Publish Trades
-    for match in matches:
-        trade_event = {
-            "symbol": instrument.symbol,
-            "price": float(match["price"]),
-            "quantity": match["quantity"],
-            "timestamp": db_order.created_at.timestamp()
-        }
-        await publish_trade(trade_event, instrument.symbol)
-    
-    # Publish OrderBook Update
-    # We need to get the current depth. 
-    book = await matching_engine.get_orderbook(instrument.symbol)
-    depth = book.depth()
-    await publish_orderbook_update(instrument.symbol, depth)
+    # 7. Publish Events: this order's trades and book delta in one round trip
+    with STAGE_PUBLISH.time():
+        await publish_order_events(instrument.symbol, tick_size, matches, db_order.created_at)
     
     return db_order
 
-async def get_user_orders(db: AsyncSession, user_id: int):
-    result = await db.execute(select(Order).where(Order.user_id == user_id).order_by(Order.created_at.desc()))
-    return result.scalars().all()
+async def create_order_write_behind(db: AsyncSession, order_in: OrderCreate, user: Principal, instrument: InstrumentRef,
+                                    cost: Optional[Decimal], reservation: Optional[Reservation]) -> Order:
+    """
+    Order entry with PERSISTENCE_MODE=write_behind. The request only holds
+    funds and matches; the order row, fills, trades and settlement are handed
+    to the persistence pipeline, so the client is acked once the engine has
+    applied (and journaled) the order. Funds are held with one conditional
+    UPDATE, or, with the risk ledger, by the reservation the pipeline commits.
+    Until its batch commits, the order is not yet visible in GET /orders.
+    """
+    # Fill prices come back in the book's ticks
+    tick_size = await matching_engine.book_tick_size(instrument)
+    held = False
+    try:
+        if reservation is None:
+            with STAGE_HOLD.time():
+                await hold_for_order(db, order_in, user, instrument, cost)
+                await db.commit()
+            held = True
+
+        # Transient row: the pipeline inserts it, this object only feeds the engine and the response
+        created_at = datetime.now(timezone.utc)
+        order = Order(
+            id=await persistence_pipeline.ids.next_id(),
+            user_id=user.id,
+            instrument_id=instrument.id,
+            side=order_in.side,
+            type=order_in.type,
+            price=order_in.price,
+            quantity=order_in.quantity,
+            filled_quantity=0,
+            created_at=created_at
+        )
+        with STAGE_MATCH.time():
+            matches, filled_qty = await matching_engine.process_order(order, instrument)
+    except BaseException:
+        risk_ledger.release(reservation)
+        if held:
+            # The hold is already committed and the order will never be persisted
+            await refund_hold(db, order_in, user, instrument, cost)
+        raise
+
+    order.filled_quantity = filled_qty
+    if filled_qty == order.quantity:
+        order.status = OrderStatus.FILLED
+    elif filled_qty > 0:
+        order.status = OrderStatus.PARTIALLY_FILLED
+    else:
+        order.status = OrderStatus.OPEN
+    release_cash, release_quantity = order_unused_hold(order, cost, matches, tick_size)
+
+    with STAGE_ENQUEUE.time():
+        await persistence_pipeline.submit(OrderWrite(
+            order_row=(
+                order.id, order.user_id, order.instrument_id, order.side.value, order.type.value,
+                order.status.value, order.price, order.quantity, order.filled_quantity, created_at
+            ),
+            side=order.side,
+            user_id=order.user_id,
+            instrument_id=instrument.id,
+            tick_size=tick_size,
+            matches=matches,
+            created_at=created_at,
+            reservation=reservation,
+            release_cash=release_cash,
+            release_quantity=release_quantity
+        ))
+
+    with STAGE_PUBLISH.time():
+        await publish_order_events(instrument.symbol, tick_size, matches, created_at)
+
+    return order
+
+async def publish_order_events(symbol: str, tick_size: Decimal, matches: List[dict], created_at: datetime):
+    from app.services.event import publish_events
+    await publish_events(await order_events(symbol, tick_size, matches, created_at))
+
+async def order_events(symbol: str, tick_size: Decimal, matches: List[dict], created_at: datetime) -> list:
+    from app.services.event import orderbook_event, trade_event
+    events = [
+        trade_event(symbol, {
+            "symbol": symbol,
+            "price": float(ticks_to_price(match["price_ticks"], tick_size)),
+            "quantity": match["quantity"],
+            "timestamp": created_at.timestamp()
+        })
+        for match in matches
+    ]
+    # Only the levels this order changed, not a full depth rebuild
+    depth_update = await matching_engine.drain_depth_update(symbol)
+    if depth_update:
+        events.append(orderbook_event(symbol, depth_update))
+    return events
+
+async def hold_for_order(db: AsyncSession, order_in: OrderCreate, user: Principal,
+                         instrument: InstrumentRef, cost: Optional[Decimal]):
+    """
+    Deduct what the order needs from the user's cash (BUY) or holdings (SELL).
+    Atomic: the balance check and the deduction are one conditional UPDATE,
+    so no Account or Holding row has to be loaded first.
+    """
+    if order_in.side == OrderSide.BUY:
+        result = await db.execute(
+            update(Account)
+            .where(Account.user_id == user.id, Account.cash_balance >= cost)
+            .values(cash_balance=Account.cash_balance - cost)
+            .returning(Account.cash_balance)
+        )
+        if result.first() is None:
+            await db.rollback()
+            raise InsufficientFundsError(f"Insufficient funds. Required: {cost}")
+    else:
+        result = await db.execute(
+            update(Holding)
+            .where(Holding.user_id == user.id, Holding.instrument_id == instrument.id,
+                   Holding.quantity >= order_in.quantity)
+            .values(quantity=Holding.quantity - order_in.quantity)
+            .returning(Holding.quantity)
+        )
+        if result.first() is None:
+            await db.rollback()
+            raise InsufficientHoldingsError(f"Insufficient holdings for {instrument.symbol}")
+
+def order_unused_hold(order: Order, cost: Optional[Decimal], matches: List[dict],
+                      tick_size: Decimal) -> Tuple[Decimal, int]:
+    """What hold_for_order took for this new order that its match did not use (see unused_hold)."""
+    price_ticks = price_to_ticks(order.price, tick_size) if order.type == OrderType.LIMIT else None
+    return unused_hold(order.side, price_ticks, order.quantity, cost, matches, tick_size)
+
+async def release_unused_hold(db: AsyncSession, order: Order, cost: Optional[Decimal], matches: List[dict],
+                              tick_size: Decimal, credits: Credits):
+    """Sync mode: give back, in the order's transaction, what its match did not use."""
+    cash, quantity = order_unused_hold(order, cost, matches, tick_size)
+    if cash:
+        await db.execute(
+            update(Account)
+            .where(Account.user_id == order.user_id)
+            .values(cash_balance=Account.cash_balance + cash)
+        )
+        credits.add_cash(order.user_id, cash)
+    if quantity:
+        await db.execute(
+            update(Holding)
+            .where(Holding.user_id == order.user_id, Holding.instrument_id == order.instrument_id)
+            .values(quantity=Holding.quantity + quantity)
+        )
+        credits.add_holding(order.user_id, order.instrument_id, quantity)
+
+async def refund_hold(db: AsyncSession, order_in: OrderCreate, user: Principal,
+                      instrument: InstrumentRef, cost: Optional[Decimal]):
+    """
+    Compensate a committed hold_for_order whose order failed before the engine
+    returned. If the refund itself fails the funds stay held, so say so loudly.
+    """
+    try:
+        await db.rollback()
+        if order_in.side == OrderSide.BUY:
+            await db.execute(
+                update(Account)
+                .where(Account.user_id == user.id)
+                .values(cash_balance=Account.cash_balance + cost)
+            )
+        else:
+            await db.execute(
+                update(Holding)
+                .where(Holding.user_id == user.id, Holding.instrument_id == instrument.id)
+                .values(quantity=Holding.quantity + order_in.quantity)
+            )
+        await db.commit()
+    except Exception as e:
+        logger.error("order_hold_refund_failed", extra={"fields": {
+            "user_id": user.id, "symbol": instrument.symbol, "side": order_in.side.value,
+            "cash": cost if order_in.side == OrderSide.BUY else None,
+            "quantity": order_in.quantity if order_in.side == OrderSide.SELL else None,
+            "error": repr(e)
+        }})
+
+async def settle_matches(db: AsyncSession, taker: Order, matches: List[dict], instrument: InstrumentRef,
+                         tick_size: Decimal) -> Credits:
+    """
+    Write the results of one engine pass to the DB with a fixed number of
+    statements regardless of how many makers were swept:
+      - one SELECT ... IN ... FOR UPDATE for the maker orders
+      - one executemany UPDATE for maker fill status
+      - one executemany atomic increment for seller cash
+      - one multi-row upsert for buyer holdings
+      - one multi-row INSERT for trades
+    The taker's own funds/holdings were held and flushed before matching, so the
+    atomic increments here compose with them even when a user trades with themselves.
+    The taker order row itself is left to the caller, as is the commit; the
+    returned Credits are what that commit adds to balances. Prices in `matches`
+    are ticks of `tick_size`, the book's (see MatchingEngine.book_tick_size).
+    """
+
+    # Aggregate per maker / seller / buyer first so each row is touched once
+    maker_fills = {} # maker order_id -> filled quantity
+    for match in matches:
+        maker_fills[match["maker_order_id"]] = maker_fills.get(match["maker_order_id"], 0) + match["quantity"]
+
+    order_table = Order.__table__
+    result = await db.execute(
+        select(order_table.c.id, order_table.c.user_id, order_table.c.quantity,
+               order_table.c.filled_quantity, order_table.c.status)
+        .where(order_table.c.id.in_(maker_fills.keys()))
+        .with_for_update()
+    )
+    makers = {row.id: row for row in result}
+
+    maker_updates = []
+    for maker_id, fill_qty in maker_fills.items():
+        maker = makers[maker_id]
+        filled = maker.filled_quantity + fill_qty
+        if maker.status == OrderStatus.CANCELLED:
+            # Cancelled while this fill was in flight; keep the cancel
+            status = OrderStatus.CANCELLED
+        elif filled == maker.quantity:
+            status = OrderStatus.FILLED
+        else:
+            status = OrderStatus.PARTIALLY_FILLED
+        maker_updates.append({"b_id": maker_id, "b_filled": filled, "b_status": status})
+
+    await db.execute(
+        update(order_table)
+        .where(order_table.c.id == bindparam("b_id"))
+        .values(filled_quantity=bindparam("b_filled"), status=bindparam("b_status")),
+        maker_updates
+    )
+
+    # Buyer: Already paid 'cost' at order entry. Seller: Receive cash. Buyer gets Instrument.
+    seller_notional = {} # user_id -> ticks * qty
+    buyer_quantity = {} # user_id -> qty
+    trade_rows = []
+    for match in matches:
+        maker_user_id = makers[match["maker_order_id"]].user_id
+        if taker.side == OrderSide.BUY:
+            buyer_id, seller_id = taker.user_id, maker_user_id
+        else:
+            buyer_id, seller_id = maker_user_id, taker.user_id
+        seller_notional[seller_id] = seller_notional.get(seller_id, 0) + match["price_ticks"] * match["quantity"]
+        buyer_quantity[buyer_id] = buyer_quantity.get(buyer_id, 0) + match["quantity"]
+        trade_rows.append({
+            "buy_order_id": match["buy_order_id"],
+            "sell_order_id": match["sell_order_id"],
+            "instrument_id": instrument.id,
+            "buyer_id": buyer_id,
+            "seller_id": seller_id,
+            "price": ticks_to_price(match["price_ticks"], tick_size),
+            "quantity": match["quantity"]
+        })
+
+    account_table = Account.__table__
+    await db.execute(
+        update(account_table)
+        .where(account_table.c.user_id == bindparam("b_user_id"))
+        .values(cash_balance=account_table.c.cash_balance + bindparam("b_credit")),
+        [
+            {"b_user_id": user_id, "b_credit": ticks_to_price(notional, tick_size)}
+            for user_id, notional in seller_notional.items()
+        ]
+    )
+
+    holding_insert = pg_insert(Holding.__table__).values([
+        {"user_id": user_id, "instrument_id": instrument.id, "quantity": quantity}
+        for user_id, quantity in buyer_quantity.items()
+    ])
+    await db.execute(
+        holding_insert.on_conflict_do_update(
+            constraint="uq_user_instrument_holding",
+            set_={
+                "quantity": Holding.__table__.c.quantity + holding_insert.excluded.quantity,
+                "updated_at": func.now()
+            }
+        )
+    )
+
+    await db.execute(insert(Trade.__table__), trade_rows)
+
+    credits = Credits()
+    for user_id, notional in seller_notional.items():
+        credits.add_cash(user_id, ticks_to_price(notional, tick_size))
+    for user_id, quantity in buyer_quantity.items():
+        credits.add_holding(user_id, instrument.id, quantity)
+    return credits
+
+async def cancel_orders(db: AsyncSession, order_ids: List[int], user: Principal, strict: bool = False) -> List[Order]:
+    """
+    Cancel resting orders owned by `user` and release what they held, in one transaction.
+    With strict=False (bulk cancel) orders that are unknown, not owned, or no longer
+    resting are skipped; with strict=True they raise.
+    """
+    if settings.PERSISTENCE_MODE == "write_behind":
+        # The rows (and fills) of recently placed orders may still be queued
+        await persistence_pipeline.flush()
+
+    # Lock the order rows so settlement of a concurrent fill on the same maker waits for us
+    result = await db.execute(
+        select(Order)
+        .where(Order.id.in_(order_ids), Order.user_id == user.id)
+        .with_for_update()
+    )
+    orders = result.scalars().all()
+    if strict and not orders:
+        raise OrderNotFoundError(f"Order {order_ids[0]} not found")
+
+    cancelled = []
+    symbols = set()
+    cash_released = Decimal(0)
+    holdings_released = {} # instrument_id -> quantity
+
+    by_symbol = {} # symbol -> (instrument, orders), so each book is visited once
+    for order in orders:
+        if order.status not in CANCELLABLE_STATUSES:
+            if strict:
+                raise OrderNotCancellableError(f"Order {order.id} is {order.status.value}")
+            continue
+        instrument = await instrument_service.get_instrument_by_id(db, order.instrument_id)
+        by_symbol.setdefault(instrument.symbol, (instrument, []))[1].append(order)
+
+    for symbol, (instrument, symbol_orders) in by_symbol.items():
+        # The book is authoritative for the unfilled remainder: a fill that is
+        # matched but not yet settled has already been taken off the entry.
+        # Same caveat as matching: if the commit below fails, the book drifts.
+        tick_size = await matching_engine.book_tick_size(instrument)
+        entries = await matching_engine.submit_batch(
+            instrument, [CancelOrder(order_id=order.id) for order in symbol_orders]
+        )
+        for order, entry in zip(symbol_orders, entries):
+            if entry is None:
+                if strict:
+                    raise OrderNotCancellableError(f"Order {order.id} is no longer resting in the book")
+                continue
+
+            # Release what was held for the remainder at order entry
+            if order.side == OrderSide.BUY:
+                cash_released += ticks_to_price(entry.price * entry.quantity, tick_size)
+            else:
+                holdings_released[instrument.id] = holdings_released.get(instrument.id, 0) + entry.quantity
+
+            order.status = OrderStatus.CANCELLED
+            db.add(order)
+            cancelled.append(order)
+            symbols.add(symbol)
+
+    if cash_released:
+        await db.execute(
+            update(Account)
+            .where(Account.user_id == user.id)
+            .values(cash_balance=Account.cash_balance + cash_released)
+        )
+    for instrument_id, quantity in holdings_released.items():
+        await db.execute(
+            update(Holding)
+            .where(Holding.user_id == user.id, Holding.instrument_id == instrument_id)
+            .values(quantity=Holding.quantity + quantity)
+        )
+
+    credits = Credits()
+    if cash_released:
+        credits.add_cash(user.id, cash_released)
+    for instrument_id, quantity in holdings_released.items():
+        credits.add_holding(user.id, instrument_id, quantity)
+    async with risk_ledger.committing():
+        await db.commit()
+        risk_ledger.credit(credits)
+
+    from app.services.event import orderbook_event, publish_events
+    events = []
+    for symbol in symbols:
+        depth_update = await matching_engine.drain_depth_update(symbol)
+        if depth_update:
+            events.append(orderbook_event(symbol, depth_update))
+    await publish_events(events)
+
+    return cancelled
+
+async def cancel_order(db: AsyncSession, order_id: int, user: Principal) -> Order:
+    cancelled = await cancel_orders(db, [order_id], user, strict=True)
+    return cancelled[0]
@@ -0,0 +1,310 @@
+"""
+Batch order entry (POST /orders/batch).
+
+A quoting strategy refreshing N quotes used to pay N requests, N auth and
+instrument lookups and N commits. A batch is handled in a fixed number of
+steps however many orders it carries:
+
+  1. cancels, including the cancel half of each REPLACE: one transaction,
+     one engine pass per symbol (cancel_orders)
+  2. validation and funds: every new order is priced, then held against
+     the balances released in step 1 with one locked read and one update
+     per balance row (or reserved in the risk ledger in write-behind mode)
+  3. matching: one engine pass per symbol
+  4. settlement: every order, fill and trade via the write-behind pipeline's
+     batch writer. In sync mode it runs inside the transaction that took the
+     hold, so hold and settlement commit (or fail) together, as in
+     create_order_sync; in write-behind mode the writes are queued.
+
+Each order gets its own result: one rejection does not fail the others.
+"""
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.engine.execution import new_order_command
+from app.exceptions import AppError
+from app.logging_config import logger
+from app.metrics import Histogram
+from app.models.order import Order, OrderSide, OrderStatus
+from app.models.trade import Holding
+from app.models.user import Account
+from app.schemas.order import BatchAction, OrderBatchItem, OrderCreate
+from app.services.event import publish_events
+from app.services.instrument_cache import InstrumentRef
+from app.services.matching_engine import matching_engine
+from app.services.order import cancel_orders, order_events, order_unused_hold, validate_order
+from app.services.persistence import OrderWrite, persistence_pipeline, write_batch
+from app.services.principal_cache import Principal
+from app.services.request_trace import OrderTrace, Stage
+from app.services.risk_ledger import Reservation, risk_ledger
+
+BATCH_STAGE_SECONDS = Histogram("order_batch_stage_seconds", "Duration of each POST /orders/batch step", ["stage"])
+STAGE_CANCEL = Stage(BATCH_STAGE_SECONDS, "cancel")
+STAGE_VALIDATE = Stage(BATCH_STAGE_SECONDS, "validate")
+STAGE_HOLD = Stage(BATCH_STAGE_SECONDS, "hold")
+STAGE_MATCH = Stage(BATCH_STAGE_SECONDS, "match")
+STAGE_SETTLE = Stage(BATCH_STAGE_SECONDS, "settle")
+STAGE_PUBLISH = Stage(BATCH_STAGE_SECONDS, "publish")
+
+class BatchOrder:
+    """A NEW (or the new half of a REPLACE) order while the batch is processed."""
+    __slots__ = ("index", "order_in", "instrument", "cost", "reservation", "order", "matches")
+
+    def __init__(self, index: int, order_in: OrderCreate, instrument: InstrumentRef, cost: Optional[Decimal]):
+        self.index = index
+        self.order_in = order_in
+        self.instrument = instrument
+        self.cost = cost
+        self.reservation: Optional[Reservation] = None
+        self.order: Optional[Order] = None
+        self.matches: List[dict] = []
+
+async def execute_order_batch(db: AsyncSession, items: List[OrderBatchItem], user: Principal) -> List[dict]:
+    with OrderTrace("order_batch", user_id=user.id, items=len(items), persistence=settings.PERSISTENCE_MODE):
+        return await _execute_order_batch(db, items, user)
+
+async def _execute_order_batch(db: AsyncSession, items: List[OrderBatchItem], user: Principal) -> List[dict]:
+    results = [
+        {"action": item.action, "ok": True, "order": None, "cancelled": None, "error": None}
+        for item in items
+    ]
+
+    def reject(index: int, error: str):
+        results[index]["ok"] = False
+        results[index]["error"] = error
+
+    # 1. Cancels
+    cancel_ids = [item.order_id for item in items if item.action != BatchAction.NEW]
+    if cancel_ids:
+        with STAGE_CANCEL.time():
+            cancelled = {order.id: order for order in await cancel_orders(db, cancel_ids, user)}
+        for index, item in enumerate(items):
+            if item.action == BatchAction.NEW:
+                continue
+            order = cancelled.get(item.order_id)
+            if order is None:
+                reject(index, f"Order {item.order_id} is not resting")
+            else:
+                results[index]["cancelled"] = order
+
+    # 2. Validation and funds
+    pending: List[BatchOrder] = []
+    with STAGE_VALIDATE.time():
+        for index, item in enumerate(items):
+            if item.action == BatchAction.CANCEL or not results[index]["ok"]:
+                continue
+            order_in = item.new_order()
+            try:
+                instrument, cost = await validate_order(db, order_in)
+                reservation = await risk_ledger.reserve(user.id, instrument.id, order_in.side, cost, order_in.quantity)
+            except (AppError, ValueError) as e:
+                reject(index, str(e))
+                continue
+            entry = BatchOrder(index, order_in, instrument, cost)
+            entry.reservation = reservation
+            pending.append(entry)
+
+    write_behind = settings.PERSISTENCE_MODE == "write_behind"
+    held = False # A hold committed before matching, refunded if matching fails
+    if pending and not (write_behind and risk_ledger.enabled):
+        # The database hold is authoritative; reservations become part of it
+        with STAGE_HOLD.time():
+            pending = await hold_for_batch(db, user, pending, reject)
+            if write_behind and pending:
+                async with risk_ledger.committing():
+                    await db.commit()
+                    risk_ledger.committed([entry.reservation for entry in pending])
+                held = True
+    if not pending:
+        # Nothing to match: drop the row locks of a hold that held nothing
+        await db.rollback()
+        return results
+
+    # 3. Matching
+    created_at = datetime.now(timezone.utc)
+    by_symbol: Dict[str, List[BatchOrder]] = {}
+    tick_sizes: Dict[str, Decimal] = {} # symbol -> the book's tick, which fill prices are in
+    for entry in pending:
+        by_symbol.setdefault(entry.instrument.symbol, []).append(entry)
+    with STAGE_MATCH.time():
+        try:
+            for symbol_entries in by_symbol.values():
+                instrument = symbol_entries[0].instrument
+                tick_size = tick_sizes[instrument.symbol] = await matching_engine.book_tick_size(instrument)
+                for entry in symbol_entries:
+                    # Transient row, inserted by the batch writer
+                    entry.order = Order(
+                        id=await persistence_pipeline.ids.next_id(),
+                        user_id=user.id,
+                        instrument_id=instrument.id,
+                        side=entry.order_in.side,
+                        type=entry.order_in.type,
+                        price=entry.order_in.price,
+                        quantity=entry.order_in.quantity,
+                        filled_quantity=0,
+                        created_at=created_at
+                    )
+                outcomes = await matching_engine.submit_batch(
+                    instrument, [new_order_command(entry.order, tick_size) for entry in symbol_entries]
+                )
+                for entry, (matches, filled_qty) in zip(symbol_entries, outcomes):
+                    entry.matches = matches
+                    entry.order.filled_quantity = filled_qty
+        except BaseException:
+            for entry in pending:
+                risk_ledger.release(entry.reservation)
+            if held:
+                await refund_batch_hold(db, user, pending)
+            elif not write_behind:
+                await db.rollback()
+            raise
+
+    # 4. Settlement
+    writes = []
+    for entry in pending:
+        order = entry.order
+        if order.filled_quantity == order.quantity:
+            order.status = OrderStatus.FILLED
+        elif order.filled_quantity > 0:
+            order.status = OrderStatus.PARTIALLY_FILLED
+        else:
+            order.status = OrderStatus.OPEN
+        tick_size = tick_sizes[entry.instrument.symbol]
+        release_cash, release_quantity = order_unused_hold(order, entry.cost, entry.matches, tick_size)
+        writes.append(OrderWrite(
+            order_row=(
+                order.id, order.user_id, order.instrument_id, order.side.value, order.type.value,
+                order.status.value, order.price, order.quantity, order.filled_quantity, created_at
+            ),
+            side=order.side,
+            user_id=order.user_id,
+            instrument_id=order.instrument_id,
+            tick_size=tick_size,
+            matches=entry.matches,
+            created_at=created_at,
+            # Applied by the writer only where it replaces the database hold (write-behind
+            # with the ledger); elsewhere the hold is already in the transaction or committed
+            reservation=entry.reservation if write_behind else None,
+            # Applied by the writer in every mode, like the fills
+            release_cash=release_cash,
+            release_quantity=release_quantity
+        ))
+        results[entry.index]["order"] = order
+
+    with STAGE_SETTLE.time():
+        if write_behind:
+            for write in writes:
+                await persistence_pipeline.submit(write)
+        else:
+            await settle_batch(db, pending, writes)
+
+    with STAGE_PUBLISH.time():
+        events = []
+        for symbol, symbol_entries in by_symbol.items():
+            events.extend(await order_events(
+                symbol, tick_sizes[symbol], [match for entry in symbol_entries for match in entry.matches], created_at
+            ))
+        await publish_events(events)
+
+    return results
+
+async def settle_batch(db: AsyncSession, pending: List[BatchOrder], writes: List[OrderWrite]):
+    """
+    Sync mode: settle in the transaction that holds the batch's funds and commit
+    once. Errors reach the caller with the hold rolled back; as in
+    create_order_sync, the engine has already applied the orders.
+    """
+    try:
+        raw = (await (await db.connection()).get_raw_connection()).driver_connection
+        credits = await write_batch(writes, raw)
+        async with risk_ledger.committing():
+            await db.commit()
+            risk_ledger.committed([entry.reservation for entry in pending])
+            risk_ledger.credit(credits)
+    except BaseException:
+        await db.rollback()
+        for entry in pending:
+            risk_ledger.release(entry.reservation)
+        raise
+
+def hold_amounts(entries: List[BatchOrder]) -> Tuple[Decimal, Dict[int, int]]:
+    """(cash, {instrument_id: quantity}) the entries hold."""
+    cash = Decimal(0)
+    quantities: Dict[int, int] = {}
+    for entry in entries:
+        if entry.order_in.side == OrderSide.BUY:
+            cash += entry.cost
+        else:
+            instrument_id = entry.instrument.id
+            quantities[instrument_id] = quantities.get(instrument_id, 0) + entry.order_in.quantity
+    return cash, quantities
+
+async def apply_hold(db: AsyncSession, user: Principal, cash: Decimal, quantities: Dict[int, int], sign: int):
+    """Take (sign=-1) or give back (sign=1) a batch hold: one update per balance row."""
+    if cash:
+        await db.execute(
+            update(Account)
+            .where(Account.user_id == user.id)
+            .values(cash_balance=Account.cash_balance + sign * cash)
+        )
+    if quantities:
+        holding_table = Holding.__table__
+        await db.execute(
+            update(holding_table)
+            .where(holding_table.c.user_id == user.id, holding_table.c.instrument_id == bindparam("b_instrument_id"))
+            .values(quantity=holding_table.c.quantity + bindparam("b_quantity")),
+            [{"b_instrument_id": instrument_id, "b_quantity": sign * quantity} for instrument_id, quantity in quantities.items()]
+        )
+
+async def refund_batch_hold(db: AsyncSession, user: Principal, entries: List[BatchOrder]):
+    """Compensate a committed write-behind hold whose orders never reached the book."""
+    cash, quantities = hold_amounts(entries)
+    try:
+        await db.rollback()
+        await apply_hold(db, user, cash, quantities, 1)
+        await db.commit()
+    except Exception as e:
+        logger.error("order_batch_hold_refund_failed", extra={"fields": {
+            "user_id": user.id, "cash": cash, "holdings": quantities, "error": repr(e)
+        }})
+
+async def hold_for_batch(db: AsyncSession, user: Principal, pending: List[BatchOrder],
+                         reject: Callable[[int, str], None]) -> List[BatchOrder]:
+    """
+    Hold funds for all orders of a batch, in batch order, without committing.
+    The balances are read once under FOR UPDATE, orders that no longer fit are
+    rejected, and each balance row is then written once. Returns the accepted orders.
+    """
+    instrument_ids = {entry.instrument.id for entry in pending if entry.order_in.side == OrderSide.SELL}
+    cash = await db.scalar(select(Account.cash_balance).where(Account.user_id == user.id).with_for_update())
+    holdings = dict((await db.execute(
+        select(Holding.instrument_id, Holding.quantity)
+        .where(Holding.user_id == user.id, Holding.instrument_id.in_(instrument_ids))
+        .with_for_update()
+    )).all()) if instrument_ids else {}
+
+    accepted = []
+    cash_held = Decimal(0)
+    quantity_held = {} # instrument_id -> quantity
+    for entry in pending:
+        if entry.order_in.side == OrderSide.BUY:
+            if cash is None or cash - cash_held < entry.cost:
+                risk_ledger.release(entry.reservation)
+                reject(entry.index, f"Insufficient funds. Required: {entry.cost}")
+                continue
+            cash_held += entry.cost
+        else:
+            instrument_id = entry.instrument.id
+            held = quantity_held.get(instrument_id, 0)
+            if holdings.get(instrument_id, 0) - held < entry.order_in.quantity:
+                risk_ledger.release(entry.reservation)
+                reject(entry.index, f"Insufficient holdings for {entry.instrument.symbol}")
+                continue
+            quantity_held[instrument_id] = held + entry.order_in.quantity
+        accepted.append(entry)
+
+    await apply_hold(db, user, cash_held, quantity_held, -1)
+    return accepted
@@ -0,0 +1,481 @@
+"""
+Write-behind persistence for the order path (PERSISTENCE_MODE=write_behind).
+
+create_order hands each matched order to the pipeline instead of settling
+it inside the request. A single background task groups the queued writes of
+many orders and commits them in one transaction per batch, using asyncpg
+directly: COPY for new orders and trades, executemany for maker fills, cash
+credits and holdings. A batch closes at PERSIST_MAX_BATCH orders or
+PERSIST_MAX_DELAY_MS after its first order, whichever comes first.
+
+The client is acked before the batch commits, once the engine has applied
+and journaled the order. That is why the mode requires JOURNAL_DIR and the
+in-process engine: after every commit the engine journals a persisted
+watermark, and after a crash start() is handed the journaled orders past it
+(re-matched by replay), skips the ones whose batch did commit, and commits
+the rest before taking new orders. Journal records not yet msync'ed
+(JOURNAL_SYNC_INTERVAL_MS) can still be lost to an OS crash, not to a
+process crash.
+
+The engine has already applied every queued write, so a failed batch is never
+simply dropped. Transient failures (lost connections, serialization failures,
+deadlocks, the server shutting down) are retried with backoff. Any other
+failure is deterministic for some write in the batch: the batch is split in
+halves until the offending write is alone, the rest commit, and that write is
+dead-lettered to PERSIST_DEAD_LETTER_PATH and logged as an error for an
+operator to fix and replay. Later writes that fill a dead-lettered order
+would fail on its missing row, so they are dead-lettered with it as soon as
+they reach a commit, without splitting batches over them.
+"""
+import asyncio
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import List, Optional, Set, Tuple
+import asyncpg
+import orjson
+from app.config import settings
+from app.database import engine as db_engine
+from app.engine.journal import ReplayedOrder
+from app.engine.ticks import ticks_to_price
+from app.logging_config import logger
+from app.metrics import Counter, Gauge, Histogram
+from app.models.order import OrderSide, OrderStatus
+from app.services.matching_engine import matching_engine
+from app.services.risk_ledger import Credits, Reservation, risk_ledger
+
+ORDER_COLUMNS = (
+    "id", "user_id", "instrument_id", "side", "type", "status",
+    "price", "quantity", "filled_quantity", "created_at"
+)
+TRADE_COLUMNS = ("buy_order_id", "sell_order_id", "instrument_id", "buyer_id", "seller_id", "price", "quantity", "created_at")
+
+# A fill never downgrades a concurrent cancel
+MAKER_FILL_SQL = """
+    UPDATE orders SET
+        filled_quantity = filled_quantity + $2,
+        status = CASE
+            WHEN status = 'CANCELLED' THEN status
+            WHEN filled_quantity + $2 >= quantity THEN 'FILLED'::orderstatus
+            ELSE 'PARTIALLY_FILLED'::orderstatus
+        END,
+        updated_at = now()
+    WHERE id = $1
+"""
+CASH_CREDIT_SQL = "UPDATE accounts SET cash_balance = cash_balance + $2, updated_at = now() WHERE user_id = $1"
+HOLDING_CREDIT_SQL = """
+    INSERT INTO holdings (user_id, instrument_id, quantity) VALUES ($1, $2, $3)
+    ON CONFLICT ON CONSTRAINT uq_user_instrument_holding
+    DO UPDATE SET quantity = holdings.quantity + EXCLUDED.quantity, updated_at = now()
+"""
+
+QUEUE_DEPTH = Gauge("persistence_queue_depth", "Orders waiting for the write-behind pipeline")
+BATCH_SIZE = Histogram(
+    "persistence_batch_size", "Orders per write-behind commit",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+)
+COMMIT_SECONDS = Histogram("persistence_commit_seconds", "Duration of one write-behind batch transaction")
+PERSISTED_ORDERS = Counter("persistence_orders_total", "Orders committed by the write-behind pipeline")
+COMMIT_FAILURES = Counter("persistence_commit_failures_total", "Write-behind batch transactions that failed", ["kind"])
+DEAD_LETTERS = Counter(
+    "persistence_dead_letters_total", "Orders whose write was dead-lettered: it failed, or it fills an order that did",
+    ["reason"]
+)
+RECOVERED_ORDERS = Counter("persistence_recovered_orders_total", "Journaled orders re-queued on startup because their batch never committed")
+
+# SQLSTATE classes worth retrying: connection exception, transaction rollback
+# (serialization failure, deadlock), insufficient resources, operator intervention
+TRANSIENT_SQLSTATE_CLASSES = ("08", "40", "53", "57")
+
+def is_transient(error: BaseException) -> bool:
+    """Whether retrying the same transaction may succeed; looks through SQLAlchemy wrappers and causes."""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, (ConnectionError, OSError, asyncio.TimeoutError, asyncpg.PostgresConnectionError)):
+            return True
+        sqlstate = getattr(error, "sqlstate", None)
+        if isinstance(sqlstate, str):
+            return sqlstate[:2] in TRANSIENT_SQLSTATE_CLASSES or sqlstate == "55P03" # lock_not_available
+        error = getattr(error, "orig", None) or error.__cause__
+    return False
+
+@dataclass(slots=True)
+class OrderWrite:
+    """One accepted order and the fills it produced, already applied by the engine."""
+    order_row: tuple # In ORDER_COLUMNS order, with the final filled_quantity and status
+    side: OrderSide
+    user_id: int
+    instrument_id: int
+    tick_size: Decimal
+    matches: List[dict]
+    created_at: datetime
+    # Funds held by the risk ledger rather than in the database; the batch applies it
+    reservation: Optional[Reservation] = None
+    # Part of the hold the matched order no longer needs (see unused_hold); the batch returns it
+    release_cash: Decimal = Decimal(0)
+    release_quantity: int = 0
+
+def unused_hold(side: OrderSide, price_ticks: Optional[int], quantity: int, hold: Optional[Decimal],
+                matches: List[dict], tick_size: Decimal) -> Tuple[Decimal, int]:
+    """
+    (cash, quantity) an order held at entry but no longer needs once matched.
+    A resting LIMIT remainder keeps its hold until it fills or is cancelled;
+    the rest goes back: what a BUY saved filling below its limit, and
+    whatever a MARKET order (price_ticks None) left unfilled. A MARKET BUY
+    whose fills cost more than its estimate comes out negative and pays the
+    difference.
+    """
+    filled = sum(match["quantity"] for match in matches)
+    resting = 0 if price_ticks is None else quantity - filled
+    if side == OrderSide.SELL:
+        return Decimal(0), quantity - filled - resting
+    notional = sum(match["price_ticks"] * match["quantity"] for match in matches)
+    if resting:
+        notional += price_ticks * resting
+    return hold - ticks_to_price(notional, tick_size), 0
+
+class OrderIdAllocator:
+    """
+    Hands out order ids from orders_id_seq in blocks, so a write-behind
+    order has its id (the engine's key) without inserting its row first.
+    """
+
+    def __init__(self, block_size: int):
+        self.block_size = block_size
+        self._ids: List[int] = []
+        self._lock = asyncio.Lock()
+
+    async def next_id(self) -> int:
+        if not self._ids:
+            async with self._lock:
+                if not self._ids:
+                    async with db_engine.connect() as conn:
+                        raw = (await conn.get_raw_connection()).driver_connection
+                        rows = await raw.fetch(
+                            "SELECT nextval('orders_id_seq') FROM generate_series(1, $1)", self.block_size
+                        )
+                    # Popped from the end, so keep them descending
+                    self._ids = sorted((row[0] for row in rows), reverse=True)
+        return self._ids.pop()
+
+class PersistencePipeline:
+    def __init__(self, max_batch: int, max_delay: float, queue_size: int, id_block: int):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue_size = queue_size
+        self.ids = OrderIdAllocator(id_block)
+        self.queue: Optional[asyncio.Queue] = None
+        self._batch_ready: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        # Orders whose rows will never be inserted by this pipeline
+        self.dead_lettered: Set[int] = set()
+
+    def check_config(self):
+        """Refuse configurations in which an acked order could not be recovered after a crash."""
+        if not settings.JOURNAL_DIR:
+            raise ValueError(
+                "PERSISTENCE_MODE=write_behind acks orders before Postgres has them and needs "
+                "JOURNAL_DIR to recover them after a crash"
+            )
+        if settings.ENGINE_SHARDS > 0:
+            raise ValueError(
+                "PERSISTENCE_MODE=write_behind needs the in-process engine (ENGINE_SHARDS=0): "
+                "shard journals cannot tell which acked orders this process committed"
+            )
+
+    async def start(self, recovered: List[ReplayedOrder] = ()):
+        """Start the batching task, then queue the orders recovered from the journal ahead of any new one."""
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self._batch_ready = asyncio.Event()
+        QUEUE_DEPTH.set_function(self.queue.qsize)
+        self._task = asyncio.create_task(self._run())
+        if recovered:
+            await self.resubmit(recovered)
+
+    async def resubmit(self, recovered: List[ReplayedOrder]):
+        # A batch can commit just before the crash that kept its watermark out
+        # of the journal; the order rows tell
+        async with db_engine.connect() as conn:
+            raw = (await conn.get_raw_connection()).driver_connection
+            committed = {row[0] for row in await raw.fetch(
+                "SELECT id FROM orders WHERE id = ANY($1::int[])", [order.command.order_id for order in recovered]
+            )}
+        matching_engine.persisted(committed)
+        for order in recovered:
+            if order.command.order_id not in committed:
+                await self.submit(recovered_write(order))
+        RECOVERED_ORDERS.inc(len(recovered) - len(committed))
+        logger.warning("persistence_recovered", extra={"fields": {
+            "requeued": len(recovered) - len(committed), "already_committed": len(committed)
+        }})
+
+    async def stop(self):
+        if self._task is None:
+            return
+        await self.flush()
+        self._task.cancel()
+        self._task = None
+
+    async def submit(self, write: OrderWrite):
+        # Blocks only when the queue is full, which pushes back on order entry
+        await self.queue.put(write)
+        if self.queue.qsize() >= self.max_batch:
+            self._batch_ready.set()
+
+    async def flush(self):
+        """Wait until everything submitted so far is committed."""
+        barrier = asyncio.get_running_loop().create_future()
+        await self.queue.put(barrier)
+        self._batch_ready.set()
+        await barrier
+
+    async def _run(self):
+        while True:
+            # Cleared before taking the first item, so a flush() or a full queue
+            # signalled from here on cuts the wait short
+            self._batch_ready.clear()
+            batch = [await self.queue.get()]
+            if self.queue.qsize() + 1 < self.max_batch:
+                try:
+                    await asyncio.wait_for(self._batch_ready.wait(), self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            writes = [item for item in batch if isinstance(item, OrderWrite)]
+            if writes:
+                await self.commit(writes)
+            for item in batch:
+                if isinstance(item, asyncio.Future) and not item.done():
+                    item.set_result(None)
+
+    async def commit(self, writes: List[OrderWrite]):
+        """
+        Commit a batch, retrying transient failures; writes that fail
+        deterministically are isolated by splitting the batch and dead-lettered.
+        Writes keep their order, so a maker always commits (or is dead-lettered)
+        before its fills.
+        """
+        writes = await self._divert_dependents(writes)
+        if not writes:
+            return
+        delay = 0.05
+        while True:
+            started = time.perf_counter()
+            try:
+                async with risk_ledger.committing():
+                    credits = await write_batch(writes)
+                    risk_ledger.committed([write.reservation for write in writes])
+                    risk_ledger.credit(credits)
+            except Exception as e:
+                if is_transient(e):
+                    COMMIT_FAILURES.labels("transient").inc()
+                    logger.warning("persistence_commit_retry", extra={"fields": {
+                        "orders": len(writes), "retry_in_s": delay, "error": repr(e)
+                    }})
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 5.0)
+                    continue
+                COMMIT_FAILURES.labels("deterministic").inc()
+                if len(writes) == 1:
+                    await self._dead_letter(writes[0], "failed", repr(e))
+                    return
+                middle = len(writes) // 2
+                await self.commit(writes[:middle])
+                await self.commit(writes[middle:])
+                return
+            COMMIT_SECONDS.observe(time.perf_counter() - started)
+            BATCH_SIZE.observe(len(writes))
+            PERSISTED_ORDERS.inc(len(writes))
+            matching_engine.persisted(write.order_row[0] for write in writes)
+            return
+
+    async def _divert_dependents(self, writes: List[OrderWrite]) -> List[OrderWrite]:
+        """Dead-letter the writes that fill a dead-lettered order; returns the others."""
+        dead = self.dead_lettered
+        if not dead:
+            return writes
+        kept = []
+        for write in writes:
+            maker_id = next((match["maker_order_id"] for match in write.matches if match["maker_order_id"] in dead), None)
+            if maker_id is None:
+                kept.append(write)
+            else:
+                await self._dead_letter(write, "dependency", f"fills order {maker_id}, which was dead-lettered")
+        return kept
+
+    async def _dead_letter(self, write: OrderWrite, reason: str, error: str):
+        order_id = write.order_row[0]
+        # Its own fills as a maker come later and must follow it
+        self.dead_lettered.add(order_id)
+        await dead_letter(write, reason, error)
+        # Set aside for an operator; replaying it at startup would only fail again
+        matching_engine.persisted([order_id])
+
+def recovered_write(order: ReplayedOrder) -> OrderWrite:
+    """
+    The OrderWrite create_order queued for a journaled order, rebuilt from
+    its NEW record and the fills replay re-matched. A MARKET order's price
+    is not journaled and its row gets none.
+    """
+    command = order.command
+    if order.filled == command.quantity:
+        status = OrderStatus.FILLED
+    elif order.filled > 0:
+        status = OrderStatus.PARTIALLY_FILLED
+    else:
+        status = OrderStatus.OPEN
+    price = None if command.price_ticks is None else ticks_to_price(command.price_ticks, order.tick_size)
+    created_at = datetime.fromtimestamp(order.applied_at, timezone.utc)
+
+    hold = None
+    if command.side == OrderSide.BUY:
+        if command.price_ticks is not None:
+            notional = command.price_ticks * command.quantity
+        else:
+            # The MARKET estimate is gone with the request; hold what the fills cost
+            notional = sum(match["price_ticks"] * match["quantity"] for match in order.matches)
+            if not risk_ledger.enabled:
+                # Postgres holds the estimate and only the request knew it
+                logger.warning("persistence_recovered_hold_unknown", extra={"fields": {
+                    "order_id": command.order_id, "user_id": command.user_id
+                }})
+        hold = ticks_to_price(notional, order.tick_size)
+    release_cash, release_quantity = unused_hold(
+        command.side, command.price_ticks, command.quantity, hold, order.matches, order.tick_size
+    )
+
+    reservation = None
+    if risk_ledger.enabled:
+        # The hold was a ledger reservation, so Postgres never saw it; the
+        # batch applies it. Settled: this process's ledger never held it.
+        if command.side == OrderSide.SELL:
+            reservation = Reservation(command.user_id, command.instrument_id, quantity=command.quantity, settled=True)
+        else:
+            reservation = Reservation(command.user_id, command.instrument_id, cash=hold, settled=True)
+
+    return OrderWrite(
+        order_row=(
+            command.order_id, command.user_id, command.instrument_id, command.side.value, command.type.value,
+            status.value, price, command.quantity, order.filled, created_at
+        ),
+        side=command.side,
+        user_id=command.user_id,
+        instrument_id=command.instrument_id,
+        tick_size=order.tick_size,
+        matches=order.matches,
+        created_at=created_at,
+        reservation=reservation,
+        release_cash=release_cash,
+        release_quantity=release_quantity
+    )
+
+async def dead_letter(write: OrderWrite, reason: str, error: str):
+    """
+    Set aside a write that cannot commit as it is. Its risk ledger reservation
+    stays unsettled: the engine did take the order, so the funds stay held
+    until the write is repaired and replayed.
+    """
+    DEAD_LETTERS.labels(reason).inc()
+    record = {**asdict(write), "reason": reason, "error": error, "failed_at": time.time()}
+    try:
+        with open(settings.PERSIST_DEAD_LETTER_PATH, "ab") as f:
+            f.write(orjson.dumps(record, default=str) + b"\n")
+        path = settings.PERSIST_DEAD_LETTER_PATH
+    except OSError as e:
+        # Still in the log line below, which carries the whole write
+        path = None
+        logger.error("persistence_dead_letter_file_failed", extra={"fields": {"error": repr(e)}})
+    logger.error("persistence_dead_letter", extra={"fields": {
+        "order_id": write.order_row[0], "user_id": write.user_id, "dead_letter_path": path, "write": record
+    }})
+
+async def write_batch(writes: List[OrderWrite], raw: Optional[asyncpg.Connection] = None) -> Credits:
+    """
+    Persist a batch of orders and their settlements in one transaction.
+    Fills are aggregated across the whole batch first, so each maker order,
+    seller account and buyer holding is written once per batch, together
+    with any holds reserved by the risk ledger. Returns the balance credits.
+    With `raw`, the statements run in that connection's open transaction
+    and committing is left to the caller (sync batch order entry).
+    """
+    if raw is not None:
+        return await _write_batch(raw, writes)
+    async with db_engine.connect() as conn:
+        raw = (await conn.get_raw_connection()).driver_connection
+        async with raw.transaction():
+            return await _write_batch(raw, writes)
+
+async def _write_batch(raw: asyncpg.Connection, writes: List[OrderWrite]) -> Credits:
+    maker_fills = {} # maker order_id -> quantity
+    for write in writes:
+        for match in write.matches:
+            maker_id = match["maker_order_id"]
+            maker_fills[maker_id] = maker_fills.get(maker_id, 0) + match["quantity"]
+
+    # New orders first: a maker filled later in the same batch must already exist
+    await raw.copy_records_to_table(
+        "orders", records=[write.order_row for write in writes], columns=ORDER_COLUMNS
+    )
+
+    credits = Credits()
+    trade_rows = []
+    if maker_fills:
+        maker_users = dict(await raw.fetch(
+            "SELECT id, user_id FROM orders WHERE id = ANY($1::int[]) FOR UPDATE", list(maker_fills)
+        ))
+        await raw.executemany(MAKER_FILL_SQL, list(maker_fills.items()))
+
+        for write in writes:
+            for match in write.matches:
+                maker_user_id = maker_users[match["maker_order_id"]]
+                if write.side == OrderSide.BUY:
+                    buyer_id, seller_id = write.user_id, maker_user_id
+                else:
+                    buyer_id, seller_id = maker_user_id, write.user_id
+                credits.add_cash(seller_id, ticks_to_price(match["price_ticks"] * match["quantity"], write.tick_size))
+                credits.add_holding(buyer_id, write.instrument_id, match["quantity"])
+                trade_rows.append((
+                    match["buy_order_id"], match["sell_order_id"], write.instrument_id, buyer_id, seller_id,
+                    ticks_to_price(match["price_ticks"], write.tick_size), match["quantity"], write.created_at
+                ))
+
+    for write in writes:
+        if write.release_cash:
+            credits.add_cash(write.user_id, write.release_cash)
+        if write.release_quantity:
+            credits.add_holding(write.user_id, write.instrument_id, write.release_quantity)
+
+    # Holds are negative credits, folded into the same per-row updates
+    cash_deltas = dict(credits.cash) # user_id -> cash
+    holding_deltas = dict(credits.holdings) # (user_id, instrument_id) -> quantity
+    for write in writes:
+        reservation = write.reservation
+        if reservation is None:
+            continue
+        if reservation.quantity:
+            key = (reservation.user_id, reservation.instrument_id)
+            holding_deltas[key] = holding_deltas.get(key, 0) - reservation.quantity
+        else:
+            cash_deltas[reservation.user_id] = cash_deltas.get(reservation.user_id, 0) - reservation.cash
+
+    if cash_deltas:
+        await raw.executemany(CASH_CREDIT_SQL, list(cash_deltas.items()))
+    if holding_deltas:
+        await raw.executemany(
+            HOLDING_CREDIT_SQL,
+            [(user_id, instrument_id, quantity) for (user_id, instrument_id), quantity in holding_deltas.items()]
+        )
+    if trade_rows:
+        await raw.copy_records_to_table("trades", records=trade_rows, columns=TRADE_COLUMNS)
+    return credits
+
+persistence_pipeline = PersistencePipeline(
+    max_batch=settings.PERSIST_MAX_BATCH,
+    max_delay=settings.PERSIST_MAX_DELAY_MS / 1000,
+    queue_size=settings.PERSIST_QUEUE_MAX,
+    id_block=settings.PERSIST_ID_BLOCK
+)
@@ -0,0 +1,132 @@
+"""
+Authenticated principals, cached per access token.
+
+get_current_user used to decode the JWT and load the user and account on
+every request. A validated token now maps to a small immutable Principal
+for AUTH_CACHE_TTL_S (never past the token's own expiry), in an LRU bounded
+by AUTH_CACHE_MAX_ENTRIES. Only a miss decodes the token, checks it has not
+been revoked and loads the user.
+
+Revocation has to hold across processes and outlive the cache entries:
+  logout           the token's hash is stored in Redis until the token expires
+  password change  users.password_changed_at rejects tokens issued before it
+Both also broadcast on auth:invalidate so every process drops what it has cached.
+The revocation check fails closed: while Redis is unreachable, a token that
+is not already cached gets a 503 rather than being let through unchecked.
+"""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+from redis.exceptions import RedisError
+from app.config import settings
+from app.logging_config import logger
+from app.metrics import Counter, Gauge
+from app.redis import get_redis
+
+INVALIDATE_CHANNEL = "auth:invalidate"
+REVOKED_KEY = "auth:revoked:{}"
+
+CACHED_PRINCIPALS = Gauge("auth_cache_size", "Access tokens with a cached principal")
+AUTH_CACHE_HITS = Counter("auth_cache_hits_total", "Authenticated requests served from the principal cache")
+AUTH_CACHE_MISSES = Counter("auth_cache_misses_total", "Authenticated requests that decoded the token and loaded the user")
+
+@dataclass(frozen=True, slots=True)
+class Principal:
+    """The authenticated user as far as request handling is concerned."""
+    id: int
+    email: str
+
+def token_key(token: str) -> str:
+    # Tokens are never kept (or published) in the clear
+    return hashlib.sha256(token.encode()).hexdigest()
+
+class PrincipalCache:
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Principal, float]]" = OrderedDict() # key -> (principal, expires)
+        self._listener: Optional[asyncio.Task] = None
+        CACHED_PRINCIPALS.set_function(lambda: len(self._entries))
+
+    def get(self, key: str) -> Optional[Principal]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        principal, expires = entry
+        if expires <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return principal
+
+    def put(self, key: str, principal: Principal, token_expires_in: float):
+        self._entries[key] = (principal, time.monotonic() + min(self.ttl, token_expires_in))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def drop_token(self, key: str):
+        self._entries.pop(key, None)
+
+    def drop_user(self, user_id: int):
+        # Rare (password change), so a scan beats maintaining a per-user index
+        for key in [key for key, (principal, _) in self._entries.items() if principal.id == user_id]:
+            del self._entries[key]
+
+    async def revoke_token(self, key: str, token_expires_in: float):
+        redis = await get_redis()
+        if token_expires_in > 0:
+            await redis.set(REVOKED_KEY.format(key), 1, ex=max(int(token_expires_in), 1))
+        self.drop_token(key)
+        await redis.publish(INVALIDATE_CHANNEL, f"token:{key}")
+
+    async def revoke_user(self, user_id: int):
+        self.drop_user(user_id)
+        await (await get_redis()).publish(INVALIDATE_CHANNEL, f"user:{user_id}")
+
+    async def is_revoked(self, key: str) -> bool:
+        return bool(await (await get_redis()).exists(REVOKED_KEY.format(key)))
+
+    def start(self):
+        self._listener = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+    def _apply(self, message: str):
+        kind, _, value = message.partition(":")
+        if kind == "token":
+            self.drop_token(value)
+        elif kind == "user":
+            self.drop_user(int(value))
+
+    async def _listen(self):
+        pubsub = None
+        while True:
+            try:
+                if pubsub is None:
+                    pubsub = (await get_redis()).pubsub()
+                    await pubsub.subscribe(INVALIDATE_CHANNEL)
+                message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is not None:
+                    self._apply(message["data"])
+            except (RedisError, ConnectionError) as e:
+                logger.warning("principal_cache_redis_lost", extra={"fields": {"error": str(e)}})
+                if pubsub is not None:
+                    await pubsub.aclose()
+                    pubsub = None
+                # Invalidations sent while disconnected were missed
+                self._entries.clear()
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                if pubsub is not None:
+                    await pubsub.aclose()
+                raise
+
+principal_cache = PrincipalCache(settings.AUTH_CACHE_TTL_S, settings.AUTH_CACHE_MAX_ENTRIES)
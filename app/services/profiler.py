@@ -0,0 +1,99 @@
+"""
+On-demand sampling profiler for the event loop thread (POST /admin/profile).
+
+A short-lived daemon thread wakes up every `interval` seconds, reads the loop
+thread's current frame from sys._current_frames() and counts the stack it
+walks, as module:function frames from the outermost in. Nothing is installed
+in the loop itself (no sys.setprofile), so requests run at full speed and pay
+only for the sampler holding the GIL while it walks one stack. The result is
+in the collapsed format ("frame;frame;frame count" per line) that
+flamegraph.pl, speedscope and most flame graph viewers read.
+
+Samples taken while the loop waits in select() show up under the selector
+frames: that share of the profile is idle time.
+
+The sampler needs the GIL to read the stack, and a loop busy with Python code
+only hands it over every sys.getswitchinterval() (5ms by default), so busy
+stacks would be undersampled against idle ones. The switch interval is
+therefore shortened to a fraction of the sampling interval while a profile
+runs, and restored afterwards.
+"""
+import asyncio
+import sys
+import threading
+from collections import Counter as StackCounter
+from types import CodeType, FrameType
+from typing import Dict
+from app.exceptions import ProfilerBusyError
+
+class Profile:
+    def __init__(self, seconds: float, interval: float):
+        self.seconds = seconds
+        self.interval = interval
+        self.samples = 0
+        self.stacks: StackCounter = StackCounter()
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def to_dict(self) -> dict:
+        return {
+            "seconds": self.seconds,
+            "interval_ms": self.interval * 1000,
+            "samples": self.samples,
+            "stacks": dict(self.stacks.most_common())
+        }
+
+class SamplingProfiler:
+    def __init__(self):
+        self._running = False
+        self._labels: Dict[CodeType, str] = {} # Frame labels, built once per code object
+
+    async def run(self, seconds: float, interval: float) -> Profile:
+        """Sample the calling (event loop) thread for `seconds`; one profile at a time."""
+        if self._running:
+            raise ProfilerBusyError()
+        self._running = True
+        try:
+            profile = Profile(seconds, interval)
+            stop = threading.Event()
+            sampler = threading.Thread(
+                target=self._sample, args=(threading.get_ident(), interval, stop, profile),
+                name="profiler", daemon=True
+            )
+            switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(min(switch_interval, interval / 50))
+            sampler.start()
+            try:
+                await asyncio.sleep(seconds)
+            finally:
+                stop.set()
+                await asyncio.to_thread(sampler.join)
+                sys.setswitchinterval(switch_interval)
+            return profile
+        finally:
+            self._running = False
+
+    def _sample(self, thread_id: int, interval: float, stop: threading.Event, profile: Profile):
+        stacks = profile.stacks
+        while not stop.wait(interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                return
+            stacks[self._collapse(frame)] += 1
+            profile.samples += 1
+
+    def _collapse(self, frame: FrameType) -> str:
+        labels = self._labels
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            label = labels.get(code)
+            if label is None:
+                label = labels[code] = f"{frame.f_globals.get('__name__', '?')}:{code.co_qualname}"
+            stack.append(label)
+            frame = frame.f_back
+        stack.reverse()
+        return ";".join(stack)
+
+profiler = SamplingProfiler()
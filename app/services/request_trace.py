@@ -0,0 +1,84 @@
+"""
+Slow order request traces.
+
+Order entry already times each of its stages for order_stage_seconds. While
+a request runs inside an OrderTrace, the same timers also append (stage,
+seconds) to a list held in a context variable. When the request ends, a
+trace that took longer than SLOW_ORDER_TRACE_MS is logged as one structured
+line through app.logging_config; any other trace is simply dropped, so a
+fast request pays for one context variable set/reset and a few list appends.
+"""
+import time
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+from app.config import settings
+from app.logging_config import logger
+from app.metrics import Counter, Histogram
+
+SLOW_ORDER_REQUESTS = Counter("slow_order_requests_total", "Order requests whose trace was logged as slow", ["kind"])
+
+# (stage, seconds) of the request being traced, in the order the stages finished
+_current_trace: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("order_trace", default=None)
+
+class Stage:
+    """A named stage of an order request, timed into its histogram and the current trace."""
+    __slots__ = ("name", "child")
+
+    def __init__(self, histogram: Histogram, name: str):
+        self.name = name
+        self.child = histogram.labels(name)
+
+    def time(self) -> "_StageTimer":
+        return _StageTimer(self)
+
+class _StageTimer:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage: Stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        self.stage.child.observe(elapsed)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.append((self.stage.name, elapsed))
+        return False
+
+class OrderTrace:
+    """
+    Trace one order request: `with OrderTrace("create_order", user_id=...)`.
+    The keyword fields are logged with the stages if the request turns out slow.
+    """
+    __slots__ = ("kind", "fields", "stages", "started", "_token")
+
+    def __init__(self, kind: str, **fields):
+        self.kind = kind
+        self.fields = fields
+
+    def __enter__(self):
+        self.stages: List[Tuple[str, float]] = []
+        self._token = _current_trace.set(self.stages)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started
+        _current_trace.reset(self._token)
+        threshold = settings.SLOW_ORDER_TRACE_MS
+        if threshold > 0 and elapsed * 1000 >= threshold:
+            SLOW_ORDER_REQUESTS.labels(self.kind).inc()
+            logger.warning("slow_order_request", extra={"fields": {
+                "kind": self.kind,
+                "total_ms": round(elapsed * 1000, 3),
+                "stages": [{"stage": name, "ms": round(seconds * 1000, 3)} for name, seconds in self.stages],
+                # Inside the request but in no stage, e.g. waiting for the event loop between stages
+                "untimed_ms": round((elapsed - sum(seconds for _, seconds in self.stages)) * 1000, 3),
+                "outcome": "ok" if exc_type is None else exc_type.__name__,
+                **self.fields
+            }})
+        return False
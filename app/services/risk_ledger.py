@@ -0,0 +1,301 @@
+"""
+In-memory pre-trade risk ledger (RISK_LEDGER_ENABLED).
+
+Holds each active user's available cash and per-instrument holdings,
+loaded lazily from Postgres the first time they are needed. Order entry
+reserves against it synchronously, so the check and the deduction cannot
+interleave with another order from the same user and take microseconds.
+
+The ledger equals Postgres minus this process's reservations that are not
+committed yet. To keep that exact, every transaction that changes balances
+applies its effect to the ledger inside `commit_gate.commit()`, and every
+read of balances from Postgres (lazy loads, reconciliation) happens inside
+`commit_gate.read()`, which excludes commits.
+
+  sync          the conditional UPDATE hold still runs inside the order's
+                transaction and stays authoritative; the ledger only rejects
+                early without a round trip.
+  write_behind  the reservation replaces the inline hold; the pipeline
+                applies it together with the order's fills. The ledger is then
+                authoritative, so a user's orders must all enter through one
+                process.
+
+A background task periodically re-reads the loaded balances, corrects and
+counts any drift, and evicts users that have been idle.
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select, tuple_
+from app.config import settings
+from app.database import SessionLocal
+from app.exceptions import InsufficientFundsError, InsufficientHoldingsError
+from app.logging_config import logger
+from app.metrics import Counter, Gauge
+from app.models.order import OrderSide
+from app.models.trade import Holding
+from app.models.user import Account
+
+LEDGER_USERS = Gauge("risk_ledger_users", "Users whose balances are loaded in the risk ledger")
+LEDGER_LOADS = Counter("risk_ledger_loads_total", "Balances loaded into the risk ledger from Postgres")
+LEDGER_REJECTS = Counter("risk_ledger_rejects_total", "Orders rejected by the risk ledger", ["reason"])
+LEDGER_DRIFT = Counter("risk_ledger_drift_total", "Ledger balances corrected by reconciliation", ["kind"])
+
+RECONCILE_CHUNK = 5000
+
+@dataclass(slots=True)
+class Credits:
+    """Balance increases committed by one transaction (settlement or cancel)."""
+    cash: Dict[int, Decimal] = field(default_factory=dict) # user_id -> amount
+    holdings: Dict[Tuple[int, int], int] = field(default_factory=dict) # (user_id, instrument_id) -> quantity
+
+    def add_cash(self, user_id: int, amount: Decimal):
+        self.cash[user_id] = self.cash.get(user_id, 0) + amount
+
+    def add_holding(self, user_id: int, instrument_id: int, quantity: int):
+        key = (user_id, instrument_id)
+        self.holdings[key] = self.holdings.get(key, 0) + quantity
+
+@dataclass(slots=True)
+class Reservation:
+    """Cash (BUY) or quantity of one instrument (SELL) set aside for one order."""
+    user_id: int
+    instrument_id: int
+    cash: Decimal = Decimal(0)
+    quantity: int = 0
+    settled: bool = False # Committed or released
+
+class UserBalances:
+    __slots__ = ("cash", "holdings", "reserved_cash", "reserved_holdings", "touched")
+
+    def __init__(self):
+        self.cash: Optional[Decimal] = None # Available; None until loaded
+        self.holdings: Dict[int, int] = {} # instrument_id -> available quantity, for loaded instruments
+        # Reserved here but not yet committed to Postgres
+        self.reserved_cash = Decimal(0)
+        self.reserved_holdings: Dict[int, int] = {}
+        self.touched = time.monotonic()
+
+    @property
+    def in_flight(self) -> bool:
+        return bool(self.reserved_cash) or any(self.reserved_holdings.values())
+
+class CommitGate:
+    """
+    Shared/exclusive gate between balance commits and balance reads.
+    Readers are preferred, so a waiting read is never starved by a steady
+    stream of commits; it only pauses new commits for one query.
+    """
+
+    def __init__(self):
+        self._condition = asyncio.Condition()
+        self._committing = 0
+        self._reading = False
+        self._waiting_reads = 0
+
+    @asynccontextmanager
+    async def commit(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: not self._reading and not self._waiting_reads)
+            self._committing += 1
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._committing -= 1
+                self._condition.notify_all()
+
+    @asynccontextmanager
+    async def read(self):
+        async with self._condition:
+            self._waiting_reads += 1
+            await self._condition.wait_for(lambda: not self._reading and not self._committing)
+            self._waiting_reads -= 1
+            self._reading = True
+        try:
+            yield
+        finally:
+            async with self._condition:
+                self._reading = False
+                self._condition.notify_all()
+
+class RiskLedger:
+    def __init__(self, enabled: bool, reconcile_interval: float, idle_seconds: float):
+        self.enabled = enabled
+        self.reconcile_interval = reconcile_interval
+        self.idle_seconds = idle_seconds
+        self.users: Dict[int, UserBalances] = {}
+        self.commit_gate = CommitGate()
+        self._task: Optional[asyncio.Task] = None
+        LEDGER_USERS.set_function(lambda: len(self.users))
+
+    @asynccontextmanager
+    async def committing(self):
+        """Wrap a balance-changing commit and the ledger updates that follow it."""
+        if not self.enabled:
+            yield
+            return
+        async with self.commit_gate.commit():
+            yield
+
+    async def reserve(self, user_id: int, instrument_id: int, side: OrderSide,
+                      cost: Optional[Decimal], quantity: int) -> Optional[Reservation]:
+        if not self.enabled:
+            return None
+        balances = await self._balances(user_id, instrument_id if side == OrderSide.SELL else None)
+        # No await from here on: check and deduct are atomic on the event loop
+        balances.touched = time.monotonic()
+        if side == OrderSide.BUY:
+            if balances.cash < cost:
+                LEDGER_REJECTS.labels("funds").inc()
+                raise InsufficientFundsError(f"Insufficient funds. Required: {cost}, Available: {balances.cash}")
+            balances.cash -= cost
+            balances.reserved_cash += cost
+            return Reservation(user_id, instrument_id, cash=cost)
+        available = balances.holdings.get(instrument_id, 0)
+        if available < quantity:
+            LEDGER_REJECTS.labels("holdings").inc()
+            raise InsufficientHoldingsError(f"Insufficient holdings. Required: {quantity}, Available: {available}")
+        balances.holdings[instrument_id] = available - quantity
+        balances.reserved_holdings[instrument_id] = balances.reserved_holdings.get(instrument_id, 0) + quantity
+        return Reservation(user_id, instrument_id, quantity=quantity)
+
+    def release(self, reservation: Optional[Reservation]):
+        """Undo a reservation that will never be committed (the order failed). No-op once committed."""
+        if reservation is None or reservation.settled:
+            return
+        balances = self._settle(reservation)
+        if reservation.quantity:
+            balances.holdings[reservation.instrument_id] += reservation.quantity
+        else:
+            balances.cash += reservation.cash
+
+    def committed(self, reservations: List[Optional[Reservation]]):
+        """The reservations are now part of Postgres. Call inside committing()."""
+        for reservation in reservations:
+            if reservation is not None and not reservation.settled:
+                self._settle(reservation)
+
+    def credit(self, credits: Credits):
+        """Apply committed balance increases. Call inside committing()."""
+        if not self.enabled:
+            return
+        users = self.users
+        for user_id, amount in credits.cash.items():
+            balances = users.get(user_id)
+            if balances is not None and balances.cash is not None:
+                balances.cash += amount
+        for (user_id, instrument_id), quantity in credits.holdings.items():
+            balances = users.get(user_id)
+            # Not loaded yet: the load will read the committed value
+            if balances is not None and instrument_id in balances.holdings:
+                balances.holdings[instrument_id] += quantity
+
+    def start(self):
+        if self.enabled:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _settle(self, reservation: Reservation) -> UserBalances:
+        reservation.settled = True
+        balances = self.users[reservation.user_id]
+        if reservation.quantity:
+            balances.reserved_holdings[reservation.instrument_id] -= reservation.quantity
+        else:
+            balances.reserved_cash -= reservation.cash
+        return balances
+
+    async def _balances(self, user_id: int, instrument_id: Optional[int]) -> UserBalances:
+        balances = self.users.get(user_id)
+        if balances is not None and balances.cash is not None and (instrument_id is None or instrument_id in balances.holdings):
+            return balances
+        async with self.commit_gate.read():
+            balances = self.users.get(user_id)
+            if balances is None:
+                balances = self.users[user_id] = UserBalances()
+            async with SessionLocal() as db:
+                if balances.cash is None:
+                    cash = await db.scalar(select(Account.cash_balance).where(Account.user_id == user_id))
+                    balances.cash = cash if cash is not None else Decimal(0)
+                    LEDGER_LOADS.inc()
+                if instrument_id is not None and instrument_id not in balances.holdings:
+                    quantity = await db.scalar(
+                        select(Holding.quantity).where(Holding.user_id == user_id, Holding.instrument_id == instrument_id)
+                    )
+                    balances.holdings[instrument_id] = quantity or 0
+                    LEDGER_LOADS.inc()
+        return balances
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.reconcile_interval)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error("risk_ledger_reconcile_failed", extra={"fields": {"error": str(e)}})
+
+    async def reconcile(self):
+        now = time.monotonic()
+        for user_id in [
+            user_id for user_id, balances in self.users.items()
+            if not balances.in_flight and now - balances.touched > self.idle_seconds
+        ]:
+            del self.users[user_id]
+
+        user_ids = list(self.users)
+        for start in range(0, len(user_ids), RECONCILE_CHUNK):
+            await self._reconcile_chunk(user_ids[start:start + RECONCILE_CHUNK])
+
+    async def _reconcile_chunk(self, user_ids: List[int]):
+        async with self.commit_gate.read():
+            holding_keys = [
+                (user_id, instrument_id)
+                for user_id in user_ids if user_id in self.users
+                for instrument_id in self.users[user_id].holdings
+            ]
+            async with SessionLocal() as db:
+                cash_rows = (await db.execute(
+                    select(Account.user_id, Account.cash_balance).where(Account.user_id.in_(user_ids))
+                )).all()
+                holding_rows = (await db.execute(
+                    select(Holding.user_id, Holding.instrument_id, Holding.quantity)
+                    .where(tuple_(Holding.user_id, Holding.instrument_id).in_(holding_keys))
+                )).all() if holding_keys else []
+
+            # Still inside read(): no commit has touched the ledger since the query
+            for user_id, cash in cash_rows:
+                balances = self.users.get(user_id)
+                if balances is None or balances.cash is None:
+                    continue
+                expected = cash - balances.reserved_cash
+                if balances.cash != expected:
+                    LEDGER_DRIFT.labels("cash").inc()
+                    logger.warning("risk_ledger_drift", extra={"fields": {
+                        "kind": "cash", "user_id": user_id, "ledger": balances.cash, "database": expected
+                    }})
+                    balances.cash = expected
+            db_holdings = {(user_id, instrument_id): quantity for user_id, instrument_id, quantity in holding_rows}
+            for user_id, instrument_id in holding_keys:
+                balances = self.users[user_id]
+                expected = db_holdings.get((user_id, instrument_id), 0) - balances.reserved_holdings.get(instrument_id, 0)
+                if balances.holdings[instrument_id] != expected:
+                    LEDGER_DRIFT.labels("holdings").inc()
+                    logger.warning("risk_ledger_drift", extra={"fields": {
+                        "kind": "holdings", "user_id": user_id, "instrument_id": instrument_id,
+                        "ledger": balances.holdings[instrument_id], "database": expected
+                    }})
+                    balances.holdings[instrument_id] = expected
+
+risk_ledger = RiskLedger(
+    enabled=settings.RISK_LEDGER_ENABLED,
+    reconcile_interval=settings.RISK_RECONCILE_INTERVAL_S,
+    idle_seconds=settings.RISK_LEDGER_IDLE_S
+)
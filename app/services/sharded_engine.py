@@ -0,0 +1,188 @@
+import asyncio
+import itertools
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+from app.engine.execution import Command, new_order_command
+from app.engine.orderbook import OrderBookEntry, merge_depth_updates
+from app.engine.shard import (
+    WRITE_BUFFER_HIGH_WATER, ShardError, check_socket_dir, read_frame, write_frame, shard_for, shard_socket_path
+)
+from app.config import settings
+from app.models.order import Order, OrderSide
+from app.services.instrument_cache import instrument_cache
+
+class ShardClient:
+    """One pipelined Unix socket connection to a shard worker."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.pending: Dict[int, asyncio.Future] = {}
+        self._request_ids = itertools.count()
+        self._connect_lock = asyncio.Lock()
+        self._read_task: Optional[asyncio.Task] = None
+
+    async def call(self, op: str, *args):
+        if self.writer is None:
+            await self._connect()
+        request_id = next(self._request_ids)
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        write_frame(self.writer, (request_id, op, args))
+        if self.writer.transport.get_write_buffer_size() > WRITE_BUFFER_HIGH_WATER:
+            await self.writer.drain()
+        return await future
+
+    async def close(self):
+        if self._read_task is not None:
+            self._read_task.cancel()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+    async def _connect(self):
+        async with self._connect_lock:
+            if self.writer is None:
+                self.reader, self.writer = await asyncio.open_unix_connection(self.path)
+                self._read_task = asyncio.create_task(self._read_loop(self.reader))
+
+    async def _read_loop(self, reader: asyncio.StreamReader):
+        try:
+            while True:
+                request_id, ok, result = await read_frame(reader)
+                future = self.pending.pop(request_id, None)
+                if future is None or future.done():
+                    continue
+                if ok:
+                    future.set_result(result)
+                else:
+                    future.set_exception(ShardError(result))
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            # Shard went away: fail everything in flight and reconnect on next call
+            self.writer = None
+            pending, self.pending = self.pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError(f"Engine shard at {self.path} disconnected: {e}"))
+
+class RemoteOrderBookView:
+    """
+    Read-only view of a book that lives in a shard worker, fetched in one
+    round trip. Offers the read methods callers use on a local OrderBook.
+    """
+
+    def __init__(self, symbol: str, tick_size: Decimal, best_bid: Optional[OrderBookEntry],
+                 best_ask: Optional[OrderBookEntry], snapshot: dict):
+        self.symbol = symbol
+        self.tick_size = tick_size
+        self._best_bid = best_bid
+        self._best_ask = best_ask
+        self._snapshot = snapshot
+
+    def get_best_bid(self) -> Optional[OrderBookEntry]:
+        return self._best_bid
+
+    def get_best_ask(self) -> Optional[OrderBookEntry]:
+        return self._best_ask
+
+    def depth(self, depth: int = 10) -> dict:
+        return {"bids": self._snapshot["bids"][:depth], "asks": self._snapshot["asks"][:depth]}
+
+    def snapshot(self, depth: int = 10) -> dict:
+        return {"seq": self._snapshot["seq"], **self.depth(depth)}
+
+class ShardedMatchingEngine:
+    """
+    MatchingEngine front-end for books hosted in shard worker processes.
+
+    Symbols are hash-partitioned across ENGINE_SHARDS workers; commands are
+    routed over local Unix sockets and fills come back in the response. Keeps
+    the MatchingEngine call signatures so app.services.order and the
+    WebSocket router do not care where the books live.
+    """
+
+    def __init__(self, num_shards: int, socket_dir: str):
+        self.num_shards = num_shards
+        self.socket_dir = socket_dir
+        self.clients = [ShardClient(shard_socket_path(socket_dir, i)) for i in range(num_shards)]
+        # Depth deltas returned with our own commands, until the caller drains them
+        self._pending_depth: Dict[str, dict] = {}
+        # A book's tick never changes once the shard has created it
+        self._tick_sizes: Dict[str, Decimal] = {}
+
+    def client_for(self, symbol: str) -> ShardClient:
+        return self.clients[shard_for(symbol, self.num_shards)]
+
+    async def get_orderbook(self, symbol: str, tick_size: Optional[Decimal] = None) -> RemoteOrderBookView:
+        depth = settings.ORDERBOOK_SNAPSHOT_DEPTH
+        book_tick_size, best_bid, best_ask, snapshot = await self.client_for(symbol).call(
+            "view", symbol, instrument_cache.tick_size_for(symbol) or tick_size, depth
+        )
+        return RemoteOrderBookView(symbol, book_tick_size, best_bid, best_ask, snapshot)
+
+    async def book_tick_size(self, instrument) -> Decimal:
+        symbol = instrument.symbol
+        tick_size = self._tick_sizes.get(symbol)
+        if tick_size is None:
+            tick_size = self._tick_sizes[symbol] = await self.client_for(symbol).call("tick", symbol, instrument.tick_size)
+        return tick_size
+
+    async def process_order(self, order: Order, instrument) -> Tuple[List[dict], int]:
+        symbol = instrument.symbol
+        tick_size = await self.book_tick_size(instrument)
+        command = new_order_command(order, tick_size)
+        (matches, filled_qty), depth_update = await self.client_for(symbol).call("new", symbol, tick_size, command)
+        self._stash_depth(symbol, depth_update)
+        return matches, order.filled_quantity + filled_qty
+
+    async def submit_batch(self, instrument, commands: List[Command]) -> list:
+        symbol = instrument.symbol
+        tick_size = await self.book_tick_size(instrument)
+        results, depth_update = await self.client_for(symbol).call("batch", symbol, tick_size, commands)
+        self._stash_depth(symbol, depth_update)
+        return results
+
+    async def cancel_order(self, symbol: str, order_id: int) -> Optional[OrderBookEntry]:
+        entry, depth_update = await self.client_for(symbol).call(
+            "cancel", symbol, instrument_cache.tick_size_for(symbol), order_id
+        )
+        self._stash_depth(symbol, depth_update)
+        return entry
+
+    async def claim_warm_start(self, symbol: str, tick_size: Decimal) -> bool:
+        # Decided by the owning shard, so only one API worker loads each symbol
+        return await self.client_for(symbol).call("claim", symbol, tick_size)
+
+    async def load_resting(self, symbol: str, tick_size: Decimal, side: OrderSide, rows: List[Tuple[int, int, int, int]]):
+        await self.client_for(symbol).call("load", symbol, tick_size, side, [tuple(row) for row in rows])
+
+    async def checkpoint(self):
+        await asyncio.gather(*(client.call("checkpoint") for client in self.clients))
+
+    async def drain_depth_update(self, symbol: str) -> Optional[dict]:
+        return self._pending_depth.pop(symbol, None)
+
+    async def get_depth_snapshot(self, symbol: str, depth: Optional[int] = None) -> dict:
+        return await self.client_for(symbol).call(
+            "snapshot", symbol, instrument_cache.tick_size_for(symbol), depth or settings.ORDERBOOK_SNAPSHOT_DEPTH
+        )
+
+    async def fetch_memory_report(self) -> Dict[str, int]:
+        report = {}
+        for result in await asyncio.gather(*(client.call("memory") for client in self.clients)):
+            report.update(result)
+        return report
+
+    async def start(self):
+        # Books (and their journals) live in the shard workers. Their sockets must
+        # be in a directory only we control, or another user could stand in for them.
+        check_socket_dir(self.socket_dir)
+
+    async def shutdown(self):
+        for client in self.clients:
+            await client.close()
+
+    def _stash_depth(self, symbol: str, depth_update: Optional[dict]):
+        if depth_update:
+            self._pending_depth[symbol] = merge_depth_updates(self._pending_depth.get(symbol), depth_update)
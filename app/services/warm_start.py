@@ -0,0 +1,86 @@
+import asyncio
+import gc
+import time
+from decimal import Decimal
+from typing import Dict
+from sqlalchemy import select, func, cast, BigInteger
+from app.config import settings
+from app.database import engine as db_engine
+from app.logging_config import logger
+from app.models.instrument import Instrument
+from app.models.order import Order, OrderSide, OrderStatus, OrderType
+
+RESTING_STATUSES = (OrderStatus.OPEN, OrderStatus.PARTIALLY_FILLED)
+
+def resting_orders_query(instrument: Instrument, side: OrderSide, tick_size: Decimal):
+    """
+    Resting LIMIT orders of one side in priority order, as
+    (order_id, user_id, price_ticks, remaining_quantity) rows.
+    Filters on idx_orders_instrument_side_status; ticks (of the book's
+    tick_size) and remaining quantity are computed by Postgres so no Decimal
+    is built per row.
+    """
+    price_ticks = cast(func.round(Order.price / tick_size), BigInteger)
+    best_first = Order.price.desc() if side == OrderSide.BUY else Order.price.asc()
+    return (
+        select(Order.id, Order.user_id, price_ticks, Order.quantity - Order.filled_quantity)
+        .where(
+            Order.instrument_id == instrument.id,
+            Order.side == side,
+            Order.status.in_(RESTING_STATUSES),
+            Order.type == OrderType.LIMIT
+        )
+        .order_by(best_first, Order.id)
+        .execution_options(yield_per=settings.WARM_START_BATCH)
+    )
+
+async def load_instrument(matching_engine, instrument: Instrument) -> int:
+    symbol = instrument.symbol
+    if not await matching_engine.claim_warm_start(symbol, instrument.tick_size):
+        return 0
+    tick_size = await matching_engine.book_tick_size(instrument)
+    count = 0
+    async with db_engine.connect() as conn:
+        for side in (OrderSide.BUY, OrderSide.SELL):
+            # Server-side cursor: rows arrive in WARM_START_BATCH chunks and each
+            # chunk is appended to the book before the next one is fetched
+            result = await conn.stream(resting_orders_query(instrument, side, tick_size))
+            async for rows in result.partitions():
+                await matching_engine.load_resting(symbol, tick_size, side, rows)
+                count += len(rows)
+    return count
+
+async def warm_start(matching_engine) -> Dict[str, dict]:
+    """
+    Rebuild the engine's books from the resting orders in Postgres.
+    Symbols load concurrently (WARM_START_CONCURRENCY connections at a time);
+    symbols the journal already restored, or that another API worker claimed
+    first in sharded mode, are skipped. Returns {symbol: {"orders", "seconds"}}.
+    """
+    started = time.perf_counter()
+    async with db_engine.connect() as conn:
+        instruments = (await conn.execute(select(Instrument.id, Instrument.symbol, Instrument.tick_size))).all()
+
+    semaphore = asyncio.Semaphore(settings.WARM_START_CONCURRENCY)
+    report = {}
+
+    async def load(instrument):
+        async with semaphore:
+            symbol_started = time.perf_counter()
+            count = await load_instrument(matching_engine, instrument)
+            report[instrument.symbol] = {"orders": count, "seconds": round(time.perf_counter() - symbol_started, 3)}
+
+    await asyncio.gather(*(load(instrument) for instrument in instruments))
+    # Loaded orders bypass the journal, so snapshot them
+    await matching_engine.checkpoint()
+    # Move the loaded books out of the collector's generations, once, so later
+    # collections do not rescan millions of long-lived entries
+    gc.freeze()
+
+    total = sum(entry["orders"] for entry in report.values())
+    for symbol, entry in sorted(report.items()):
+        logger.info("warm_start_book", extra={"fields": {"symbol": symbol, **entry}})
+    logger.info("warm_start_done", extra={"fields": {
+        "orders": total, "books": len(report), "seconds": round(time.perf_counter() - started, 3)
+    }})
+    return report
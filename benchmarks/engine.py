@@ -0,0 +1,351 @@
+"""
+Matching engine microbenchmarks: order books and MatchingEngine, in process.
+
+No database, Redis or HTTP: each workload is a list of engine commands from
+a seeded generator, so two runs with the same --ops and --seed replay the
+exact same command stream. Workloads:
+
+  insert_heavy   non-crossing limit orders spread over 500 ticks per side
+  cancel_heavy   cancel every order of a preloaded book, in random order
+  deep_sweep     market orders that each sweep ~50 resting orders across
+                 levels, each followed by the 50 limit orders that refill them
+  many_symbols   crossing flow with 20% cancels over 1000 symbols
+  same_price     one price level thousands deep: fills at its head, inserts
+                 at its tail, cancels from its middle
+  mixed          one symbol: near-touch limits, markets and cancels
+
+Each runs against every --impl, through every --target: "book" applies
+commands to the book directly, "lock" goes through MatchingEngine.submit
+and its per-symbol lock. Depth deltas are drained after
+every command, as the order path does. Reported per run: ops/sec, per-op
+latency percentiles and (in a separate, traced pass) peak allocated memory.
+
+    python -m benchmarks.engine
+    python -m benchmarks.engine --workload deep_sweep same_price --impl price_level --target book
+    python -m benchmarks.engine --save-baseline benchmarks/baselines/engine.json
+    python -m benchmarks.engine --check benchmarks/baselines/engine.json --threshold 0.25
+
+--check exits 1 if any run's ops/sec fell, or its p99 rose, by more than
+--threshold against the baseline. Baselines are machine-specific: record
+one on the machine that runs the check.
+
+--verify-replay times nothing: it applies each workload through an engine
+that journals to a temporary directory (snapshotting half way), replays the
+journal with app.engine.journal.replay and exits 1 if any replayed book
+differs from the live one, order by order.
+
+    python -m benchmarks.engine --verify-replay
+"""
+import argparse
+import asyncio
+import gc
+import json
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import zlib
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Tuple
+from app.engine.commands import CancelOrder, NewOrder
+from app.engine.execution import ORDERBOOK_IMPLEMENTATIONS, Command, execute_command
+from app.engine.journal import replay
+from app.engine.ticks import DEFAULT_TICK_SIZE
+from app.models.order import OrderSide, OrderType
+from app.services.matching_engine import MatchingEngine
+
+REFERENCE = 10_000 # Reference price in ticks
+TARGETS = ("book", "lock")
+
+@dataclass
+class Workload:
+    symbols: List[str]
+    setup: List[Tuple[str, Command]] = field(default_factory=list) # Applied before timing starts
+    ops: List[Tuple[str, Command]] = field(default_factory=list)
+
+class Generator:
+    def __init__(self, name: str, seed: int):
+        # crc32 rather than hash(): stable across processes
+        self.rng = random.Random(seed * 1_000_003 + zlib.crc32(name.encode()))
+        self.next_id = 1
+
+    def limit(self, side: OrderSide, price: int, quantity: int) -> NewOrder:
+        return self._new(side, OrderType.LIMIT, price, quantity)
+
+    def market(self, side: OrderSide, quantity: int) -> NewOrder:
+        return self._new(side, OrderType.MARKET, None, quantity)
+
+    def passive(self, quantity: int) -> NewOrder:
+        """A limit order that rests without crossing."""
+        if self.rng.random() < 0.5:
+            return self.limit(OrderSide.BUY, REFERENCE - self.rng.randint(1, 500), quantity)
+        return self.limit(OrderSide.SELL, REFERENCE + self.rng.randint(1, 500), quantity)
+
+    def _new(self, side: OrderSide, order_type: OrderType, price, quantity: int) -> NewOrder:
+        order_id = self.next_id
+        self.next_id += 1
+        return NewOrder(
+            order_id=order_id, user_id=self.rng.randint(1, 1000), instrument_id=1,
+            side=side, type=order_type, price_ticks=price, quantity=quantity
+        )
+
+def insert_heavy(gen: Generator, ops: int) -> Workload:
+    return Workload(["BENCH"], ops=[("BENCH", gen.passive(gen.rng.randint(1, 100))) for _ in range(ops)])
+
+def cancel_heavy(gen: Generator, ops: int) -> Workload:
+    setup = [("BENCH", gen.passive(gen.rng.randint(1, 100))) for _ in range(ops)]
+    cancels = [("BENCH", CancelOrder(order_id=command.order_id)) for _, command in setup]
+    gen.rng.shuffle(cancels)
+    return Workload(["BENCH"], setup=setup, ops=cancels)
+
+def deep_sweep(gen: Generator, ops: int) -> Workload:
+    # ~50 orders of 10 per sweep, over 1000 ask levels that are refilled as they go
+    setup = [("BENCH", gen.limit(OrderSide.SELL, REFERENCE + 1 + i % 1000, 10)) for i in range(ops)]
+    sweeps = []
+    for i in range(ops // 50):
+        sweeps.append(("BENCH", gen.market(OrderSide.BUY, 500)))
+        sweeps.extend(("BENCH", gen.limit(OrderSide.SELL, REFERENCE + 1 + gen.rng.randint(0, 999), 10)) for _ in range(50))
+    return Workload(["BENCH"], setup=setup, ops=sweeps)
+
+def many_symbols(gen: Generator, ops: int) -> Workload:
+    symbols = [f"S{i:04d}" for i in range(1000)]
+    commands, issued = [], []
+    for _ in range(ops):
+        symbol = gen.rng.choice(symbols)
+        if issued and gen.rng.random() < 0.2:
+            # A random earlier order of this run; may be filled already, as in real traffic
+            commands.append(issued.pop(gen.rng.randrange(len(issued))))
+            continue
+        side = gen.rng.choice((OrderSide.BUY, OrderSide.SELL))
+        command = gen.limit(side, REFERENCE + gen.rng.randint(-10, 10), gen.rng.randint(1, 20))
+        commands.append((symbol, command))
+        issued.append((symbol, CancelOrder(order_id=command.order_id)))
+    return Workload(symbols, ops=commands)
+
+def same_price(gen: Generator, ops: int) -> Workload:
+    setup = [("BENCH", gen.limit(OrderSide.SELL, REFERENCE, 5)) for _ in range(ops)]
+    resting = [command.order_id for _, command in setup]
+    commands = []
+    for _ in range(ops):
+        draw = gen.rng.random()
+        if draw < 0.4:
+            commands.append(("BENCH", gen.limit(OrderSide.BUY, REFERENCE, gen.rng.randint(1, 10))))
+        elif draw < 0.7:
+            command = gen.limit(OrderSide.SELL, REFERENCE, 5)
+            resting.append(command.order_id)
+            commands.append(("BENCH", command))
+        else:
+            order_id = resting.pop(gen.rng.randrange(len(resting)))
+            commands.append(("BENCH", CancelOrder(order_id=order_id)))
+    return Workload(["BENCH"], setup=setup, ops=commands)
+
+def mixed(gen: Generator, ops: int) -> Workload:
+    commands, issued = [], []
+    for _ in range(ops):
+        draw = gen.rng.random()
+        side = gen.rng.choice((OrderSide.BUY, OrderSide.SELL))
+        if draw < 0.3 and issued:
+            commands.append(("BENCH", CancelOrder(order_id=issued.pop(gen.rng.randrange(len(issued))))))
+        elif draw < 0.4:
+            commands.append(("BENCH", gen.market(side, gen.rng.randint(1, 50))))
+        else:
+            offset = gen.rng.randint(0, 20)
+            price = REFERENCE - offset if side == OrderSide.BUY else REFERENCE + offset
+            command = gen.limit(side, price + (5 if side == OrderSide.BUY else -5), gen.rng.randint(1, 50))
+            commands.append(("BENCH", command))
+            issued.append(command.order_id)
+    return Workload(["BENCH"], ops=commands)
+
+WORKLOADS: Dict[str, Callable[[Generator, int], Workload]] = {
+    "insert_heavy": insert_heavy,
+    "cancel_heavy": cancel_heavy,
+    "deep_sweep": deep_sweep,
+    "many_symbols": many_symbols,
+    "same_price": same_price,
+    "mixed": mixed,
+}
+
+async def apply_all(target: str, impl: str, workload: Workload, latencies: list = None):
+    """Set up the books, then apply the measured commands; returns the seconds spent on them."""
+    if target == "book":
+        factory = ORDERBOOK_IMPLEMENTATIONS[impl]
+        books = {symbol: factory(symbol, DEFAULT_TICK_SIZE) for symbol in workload.symbols}
+        for symbol, command in workload.setup:
+            execute_command(books[symbol], command)
+            books[symbol].drain_deltas()
+        gc.collect()
+        clock = time.perf_counter
+        started = clock()
+        for symbol, command in workload.ops:
+            before = clock()
+            book = books[symbol]
+            execute_command(book, command)
+            book.drain_deltas()
+            if latencies is not None:
+                latencies.append(clock() - before)
+        return clock() - started
+
+    engine = MatchingEngine(book_impl=impl)
+    for symbol in workload.symbols:
+        await engine.get_orderbook(symbol, DEFAULT_TICK_SIZE)
+    for symbol, command in workload.setup:
+        await engine.submit(symbol, command)
+        await engine.drain_depth_update(symbol)
+    gc.collect()
+    clock = time.perf_counter
+    started = clock()
+    for symbol, command in workload.ops:
+        before = clock()
+        await engine.submit(symbol, command)
+        await engine.drain_depth_update(symbol)
+        if latencies is not None:
+            latencies.append(clock() - before)
+    return clock() - started
+
+def percentile(values: list, fraction: float) -> float:
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+async def run(name: str, target: str, impl: str, ops: int, seed: int, repeat: int, memory: bool) -> dict:
+    workload = WORKLOADS[name](Generator(name, seed), ops)
+    best_elapsed, best_latencies = None, None
+    for _ in range(repeat):
+        latencies = []
+        elapsed = await apply_all(target, impl, workload, latencies)
+        if best_elapsed is None or elapsed < best_elapsed:
+            best_elapsed, best_latencies = elapsed, latencies
+
+    result = {
+        "workload": name,
+        "target": target,
+        "impl": impl,
+        "ops": len(workload.ops),
+        "ops_per_sec": round(len(workload.ops) / best_elapsed),
+    }
+    best_latencies.sort()
+    for label, fraction in (("p50", 0.5), ("p99", 0.99), ("p99.9", 0.999)):
+        result[f"latency_us_{label}"] = round(percentile(best_latencies, fraction) * 1e6, 2)
+    result["latency_us_max"] = round(best_latencies[-1] * 1e6, 2)
+
+    if memory:
+        # Separate pass: tracing slows every allocation down
+        tracemalloc.start()
+        await apply_all(target, impl, workload)
+        result["peak_memory_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+        tracemalloc.stop()
+    return result
+
+def book_state(book) -> tuple:
+    # Every resting order in priority order, both sides
+    return tuple(
+        tuple((entry.order_id, entry.user_id, entry.price, entry.quantity) for entry in book.resting_orders(side))
+        for side in (OrderSide.BUY, OrderSide.SELL)
+    )
+
+async def verify_replay(name: str, impl: str, ops: int, seed: int) -> List[str]:
+    """Books that differ between a journaling engine and the replay of its journal."""
+    workload = WORKLOADS[name](Generator(name, seed), ops)
+    commands = workload.setup + workload.ops
+    with tempfile.TemporaryDirectory() as journal_dir:
+        engine = MatchingEngine(book_impl=impl, journal_dir=journal_dir)
+        await engine.start()
+        for symbol in workload.symbols:
+            await engine.get_orderbook(symbol, DEFAULT_TICK_SIZE)
+        for i, (symbol, command) in enumerate(commands):
+            if i == len(commands) // 2:
+                # Replay then starts from a snapshot, as it does after a restart
+                await engine.checkpoint()
+            await engine.submit(symbol, command)
+        await engine.shutdown()
+        replayed = replay(journal_dir, ORDERBOOK_IMPLEMENTATIONS[impl]).books
+
+    mismatches = []
+    for symbol, book in engine.orderbooks.items():
+        replayed_book = replayed.get(symbol)
+        # A book nothing was applied to has no journal records to replay
+        if replayed_book is None and not book.orders:
+            continue
+        if replayed_book is None or book_state(replayed_book) != book_state(book):
+            mismatches.append(f"{name}/{impl}: {symbol} replays to a different book")
+    return mismatches
+
+def run_key(result: dict) -> str:
+    return f"{result['workload']}/{result['target']}/{result['impl']}"
+
+def check(results: List[dict], baseline_path: str, threshold: float, ops: int, seed: int) -> List[str]:
+    """Regressions against a baseline: ops/sec down or p99 up by more than threshold."""
+    with open(baseline_path) as f:
+        stored = json.load(f)
+    if (stored["ops"], stored["seed"]) != (ops, seed):
+        print(f"Warning: baseline was recorded with --ops {stored['ops']} --seed {stored['seed']}")
+    baseline = stored["results"]
+    regressions = []
+    for result in results:
+        base = baseline.get(run_key(result))
+        if base is None:
+            continue
+        if result["ops_per_sec"] < base["ops_per_sec"] * (1 - threshold):
+            regressions.append(f"{run_key(result)}: ops/sec {base['ops_per_sec']} -> {result['ops_per_sec']}")
+        if result["latency_us_p99"] > base["latency_us_p99"] * (1 + threshold):
+            regressions.append(f"{run_key(result)}: p99 {base['latency_us_p99']}us -> {result['latency_us_p99']}us")
+    return regressions
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark order books and the matching engine in process")
+    parser.add_argument("--workload", choices=list(WORKLOADS), nargs="+", default=list(WORKLOADS))
+    parser.add_argument("--impl", choices=list(ORDERBOOK_IMPLEMENTATIONS), nargs="+", default=list(ORDERBOOK_IMPLEMENTATIONS))
+    parser.add_argument("--target", choices=TARGETS, nargs="+", default=list(TARGETS))
+    parser.add_argument("--ops", type=int, default=20000, help="Commands per workload (and resting orders for the preloaded ones)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per combination; the fastest is reported")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the traced peak memory pass")
+    parser.add_argument("--save-baseline", metavar="PATH", help="Write the results as a baseline")
+    parser.add_argument("--check", metavar="PATH", help="Compare against a baseline and exit 1 on regressions")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed relative regression for --check")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--verify-replay", action="store_true",
+                        help="Check that journal replay rebuilds the live books, instead of benchmarking")
+    args = parser.parse_args()
+
+    if args.verify_replay:
+        mismatches = []
+        for name in args.workload:
+            for impl in args.impl:
+                mismatches.extend(await verify_replay(name, impl, args.ops, args.seed))
+        for mismatch in mismatches:
+            print(f"MISMATCH {mismatch}")
+        if mismatches:
+            sys.exit(1)
+        print(f"Replay matches the live books for {len(args.workload) * len(args.impl)} runs")
+        return
+
+    results = []
+    for name in args.workload:
+        for target in args.target:
+            for impl in args.impl:
+                results.append(await run(name, target, impl, args.ops, args.seed, args.repeat, not args.no_memory))
+                if not args.json:
+                    print(results[-1])
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "ops": args.ops,
+                "seed": args.seed,
+                "results": {run_key(result): result for result in results},
+            }, f, indent=2)
+    if args.check:
+        regressions = check(results, args.check, args.threshold, args.ops, args.seed)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.check}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
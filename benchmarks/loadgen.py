@@ -0,0 +1,308 @@
+"""
+Load generator for a running API: order entry, fills and market data under concurrency.
+
+Seeds its own instruments and users (with cash and holdings in every
+instrument, so both sides can trade) straight into Postgres and mints the
+users' tokens locally with SECRET_KEY, so a run needs no registration or
+login traffic. Then --clients async clients place orders for --duration
+seconds while --subscribers WebSocket clients watch the symbols, and the
+run reports throughput plus p50/p99/p99.9 latency for:
+
+  order_ack     POST /orders/ round trip
+  cancel_ack    DELETE /orders/{id} round trip
+  fill          order sent -> its first trade received on the WebSocket stream
+  ws_delivery   trade timestamp (server clock) -> frame received, per subscriber
+
+    python -m benchmarks.loadgen --clients 1000 --duration 30
+    python -m benchmarks.loadgen --symbols 20 --skew 1.2 --cancel-ratio 0.3 --market-ratio 0.1
+    python -m benchmarks.loadgen --out results/run.json
+    python -m benchmarks.loadgen --compare results/base.json results/run.json
+
+Run it with the API's settings (same DATABASE_URL and SECRET_KEY) on the
+same host, since fill and ws_delivery compare against server timestamps.
+fill needs at least one subscriber per symbol (subscribers are assigned to
+symbols round-robin).
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+import httpx
+import orjson
+import websockets
+from sqlalchemy import insert
+from app.database import SessionLocal
+from app.models.instrument import Instrument
+from app.models.trade import Holding
+from app.models.user import Account, User
+from app.security import create_access_token, get_password_hash
+
+REFERENCE_PRICE = Decimal("100.00")
+TICK_SIZE = Decimal("0.01")
+SEED_CHUNK = 5000
+
+def percentiles(values: List[float]) -> dict:
+    if not values:
+        return {"count": 0}
+    values = sorted(values)
+    at = lambda fraction: values[min(int(len(values) * fraction), len(values) - 1)]
+    return {
+        "count": len(values),
+        "p50": round(at(0.5) * 1000, 3),
+        "p99": round(at(0.99) * 1000, 3),
+        "p99.9": round(at(0.999) * 1000, 3),
+        "max": round(values[-1] * 1000, 3),
+    }
+
+async def seed(num_symbols: int, num_users: int, holding: int, cash: Decimal) -> Tuple[List[str], List[str]]:
+    """Insert this run's instruments and users; returns (symbols, access tokens)."""
+    tag = f"{int(time.time()) % 100000:05d}"
+    symbols = [f"L{tag}{i:02d}" for i in range(num_symbols)]
+    hashed = get_password_hash("loadgen") # One hash for everyone; nobody logs in
+    emails = [f"loadgen_{tag}_{i}@bench.local" for i in range(num_users)]
+
+    async with SessionLocal() as db:
+        instrument_ids = (await db.execute(
+            insert(Instrument).returning(Instrument.id),
+            [
+                {"symbol": symbol, "name": f"Load test {symbol}", "current_price": REFERENCE_PRICE,
+                 "tick_size": TICK_SIZE, "is_active": True}
+                for symbol in symbols
+            ]
+        )).scalars().all()
+        for start in range(0, num_users, SEED_CHUNK):
+            chunk = emails[start:start + SEED_CHUNK]
+            user_ids = (await db.execute(
+                insert(User).returning(User.id),
+                [{"email": email, "hashed_password": hashed} for email in chunk]
+            )).scalars().all()
+            await db.execute(insert(Account), [{"user_id": user_id, "cash_balance": cash} for user_id in user_ids])
+            await db.execute(insert(Holding), [
+                {"user_id": user_id, "instrument_id": instrument_id, "quantity": holding}
+                for user_id in user_ids for instrument_id in instrument_ids
+            ])
+        await db.commit()
+
+    tokens = [create_access_token({"sub": email}, expires_delta=timedelta(hours=12)) for email in emails]
+    return symbols, tokens
+
+class Stats:
+    def __init__(self):
+        self.order_ack: List[float] = []
+        self.cancel_ack: List[float] = []
+        self.ws_delivery: List[float] = []
+        self.rejected: Dict[str, int] = {}
+        self.sent = 0
+        self.accepted = 0
+        self.filled = 0
+        self.cancels = 0
+        self.ws_frames = 0
+        self.ws_disconnects = 0
+        # (symbol, trade timestamp) -> wall time sent, for orders acked with a fill
+        self.fill_sent: Dict[Tuple[str, float], float] = {}
+        # (symbol, trade timestamp) -> wall time its first trade frame arrived
+        self.trade_seen: Dict[Tuple[str, float], float] = {}
+
+    def reject(self, reason: str):
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+
+def order_body(rng: random.Random, symbol: str, args) -> dict:
+    side = rng.choice(("BUY", "SELL"))
+    if rng.random() < args.market_ratio:
+        body = {"instrument_symbol": symbol, "side": side, "type": "MARKET", "quantity": rng.randint(1, args.max_qty)}
+        if side == "BUY":
+            # Caps the funds held for the estimate
+            body["price"] = str(REFERENCE_PRICE + TICK_SIZE * args.spread_ticks)
+        return body
+    # Both sides quote around the reference price, so about half the orders cross
+    price = REFERENCE_PRICE + TICK_SIZE * rng.randint(-args.spread_ticks, args.spread_ticks)
+    return {"instrument_symbol": symbol, "side": side, "type": "LIMIT", "quantity": rng.randint(1, args.max_qty), "price": str(price)}
+
+async def trader(http: httpx.AsyncClient, token: str, symbols: List[str], weights: List[float],
+                 args, stats: Stats, seed_value: int, deadline: float):
+    rng = random.Random(seed_value)
+    headers = {"Authorization": f"Bearer {token}"}
+    think = args.think_ms / 1000
+    while time.perf_counter() < deadline:
+        symbol = rng.choices(symbols, weights)[0]
+        body = order_body(rng, symbol, args)
+        sent_wall = time.time()
+        started = time.perf_counter()
+        stats.sent += 1
+        try:
+            response = await http.post("/orders/", json=body, headers=headers)
+        except httpx.HTTPError as e:
+            stats.reject(type(e).__name__)
+            continue
+        stats.order_ack.append(time.perf_counter() - started)
+        if response.status_code != 201:
+            stats.reject(str(response.status_code))
+            continue
+        stats.accepted += 1
+        order = response.json()
+        if order["filled_quantity"] > 0:
+            stats.filled += 1
+            # Trade events carry the taker order's created_at as their timestamp
+            created = round(datetime.fromisoformat(order["created_at"]).timestamp(), 6)
+            stats.fill_sent[(symbol, created)] = sent_wall
+        if order["status"] in ("OPEN", "PARTIALLY_FILLED") and rng.random() < args.cancel_ratio:
+            started = time.perf_counter()
+            try:
+                response = await http.delete(f"/orders/{order['id']}", headers=headers)
+            except httpx.HTTPError as e:
+                stats.reject(f"cancel_{type(e).__name__}")
+                continue
+            stats.cancel_ack.append(time.perf_counter() - started)
+            if response.status_code == 200:
+                stats.cancels += 1
+            else:
+                stats.reject(f"cancel_{response.status_code}")
+        if think:
+            await asyncio.sleep(think)
+
+async def subscriber(url: str, symbol: str, stats: Stats, stop: asyncio.Event, ready: asyncio.Event):
+    try:
+        async with websockets.connect(url, max_queue=None) as websocket:
+            ready.set()
+            while not stop.is_set():
+                try:
+                    frame = await asyncio.wait_for(websocket.recv(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+                received = time.time()
+                event = orjson.loads(frame)
+                stats.ws_frames += 1
+                if event.get("type") != "trade":
+                    continue
+                timestamp = event["data"]["timestamp"]
+                stats.ws_delivery.append(received - timestamp)
+                stats.trade_seen.setdefault((symbol, round(timestamp, 6)), received)
+    except (OSError, websockets.ConnectionClosed):
+        stats.ws_disconnects += 1
+        ready.set()
+
+async def run(args) -> dict:
+    symbols, tokens = await seed(args.symbols, args.clients, args.holding, Decimal(args.cash))
+    # Zipf-like popularity: symbol i gets weight 1 / (i + 1) ** skew
+    weights = [1 / (i + 1) ** args.skew for i in range(len(symbols))]
+    stats = Stats()
+
+    ws_base = args.url.replace("http", "ws", 1)
+    stop = asyncio.Event()
+    subscribers = []
+    for i in range(args.subscribers):
+        ready = asyncio.Event()
+        symbol = symbols[i % len(symbols)]
+        subscribers.append(asyncio.create_task(subscriber(f"{ws_base}/ws/{symbol}", symbol, stats, stop, ready)))
+        await ready.wait()
+
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=args.timeout) as http:
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(
+            trader(http, token, symbols, weights, args, stats, args.seed + i, deadline)
+            for i, token in enumerate(tokens)
+        ))
+        elapsed = time.perf_counter() - started
+
+    await asyncio.sleep(args.drain) # Let trailing trade frames arrive
+    stop.set()
+    await asyncio.gather(*subscribers)
+
+    fill = [
+        stats.trade_seen[key] - sent
+        for key, sent in stats.fill_sent.items() if key in stats.trade_seen
+    ]
+    return {
+        "config": {
+            key: getattr(args, key) for key in (
+                "clients", "connections", "duration", "symbols", "skew", "market_ratio", "cancel_ratio",
+                "spread_ticks", "max_qty", "think_ms", "subscribers", "seed"
+            )
+        },
+        "elapsed_s": round(elapsed, 3),
+        "orders_sent": stats.sent,
+        "orders_accepted": stats.accepted,
+        "orders_filled": stats.filled,
+        "orders_per_sec": round(stats.accepted / elapsed, 1),
+        "cancels": stats.cancels,
+        "rejected": stats.rejected,
+        "ws_frames": stats.ws_frames,
+        "ws_disconnects": stats.ws_disconnects,
+        "fills_unmatched": len(stats.fill_sent) - len(fill),
+        "latency_ms": {
+            "order_ack": percentiles(stats.order_ack),
+            "cancel_ack": percentiles(stats.cancel_ack),
+            "fill": percentiles(fill),
+            "ws_delivery": percentiles(stats.ws_delivery),
+        },
+    }
+
+def compare(base_path: str, run_path: str):
+    """Print throughput and latency percentiles of two result files side by side."""
+    with open(base_path) as f:
+        base = json.load(f)
+    with open(run_path) as f:
+        current = json.load(f)
+
+    def row(name: str, before: Optional[float], after: Optional[float]):
+        if before is None or after is None:
+            return
+        change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+        print(f"{name:<24} {before:>12} {after:>12} {change:>9}")
+
+    print(f"{'metric':<24} {'base':>12} {'run':>12} {'change':>9}")
+    row("orders_per_sec", base.get("orders_per_sec"), current.get("orders_per_sec"))
+    for metric, summary in base["latency_ms"].items():
+        for stat in ("p50", "p99", "p99.9"):
+            row(f"{metric} {stat}", summary.get(stat), current["latency_ms"].get(metric, {}).get(stat))
+
+async def main():
+    parser = argparse.ArgumentParser(description="Drive a running API with concurrent traders and WebSocket subscribers")
+    parser.add_argument("--url", default="http://localhost:8000/api/v1")
+    parser.add_argument("--clients", type=int, default=200, help="Concurrent traders, one seeded user each")
+    parser.add_argument("--connections", type=int, default=200, help="HTTP connection pool size shared by the traders")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of order flow")
+    parser.add_argument("--symbols", type=int, default=10)
+    parser.add_argument("--skew", type=float, default=1.0, help="Symbol popularity exponent; 0 spreads orders evenly")
+    parser.add_argument("--market-ratio", type=float, default=0.1, help="Fraction of MARKET orders")
+    parser.add_argument("--cancel-ratio", type=float, default=0.2, help="Fraction of resting orders cancelled right away")
+    parser.add_argument("--spread-ticks", type=int, default=20, help="Limit prices are drawn from reference +/- this many ticks")
+    parser.add_argument("--max-qty", type=int, default=10)
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Pause between a trader's orders")
+    parser.add_argument("--subscribers", type=int, default=50, help="WebSocket clients, assigned to symbols round-robin")
+    parser.add_argument("--holding", type=int, default=10_000_000, help="Seeded quantity per user and symbol")
+    parser.add_argument("--cash", default="1000000000", help="Seeded cash per user")
+    parser.add_argument("--timeout", type=float, default=30.0, help="HTTP timeout in seconds")
+    parser.add_argument("--drain", type=float, default=1.0, help="Seconds to keep listening after the order flow stops")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed, for repeatable order flow")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--out", help="Also write the JSON results to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "RUN"), help="Compare two result files and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    result = await run(args)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for key, value in result.items():
+            if key != "config":
+                print(f"{key}: {value}")
+    if not result["orders_accepted"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
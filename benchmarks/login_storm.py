@@ -0,0 +1,92 @@
+"""
+Login storm benchmark: event-loop responsiveness while many logins hash passwords.
+
+Runs N concurrent password verifications (the CPU-bound part of a login)
+alongside a probe task that asks to wake up every --probe-ms, and reports
+how late the probe woke (event-loop lag) next to login latency and throughput.
+
+    python -m benchmarks.login_storm --logins 100
+    python -m benchmarks.login_storm --mode inline pool --workers 1 4
+
+"inline" verifies on the event loop, as the login handler used to; "pool"
+uses verify_password_async, i.e. the bounded hashing pool.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import app.security as security
+from app.config import settings
+
+PASSWORD = "correct horse battery staple"
+
+async def probe(interval: float, lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        expected = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        lags.append(max(time.perf_counter() - expected, 0))
+
+async def login(mode: str, hashed: str, latencies: list):
+    started = time.perf_counter()
+    if mode == "inline":
+        ok = security.verify_password(PASSWORD, hashed)
+    else:
+        ok = await security.verify_password_async(PASSWORD, hashed)
+    assert ok
+    latencies.append(time.perf_counter() - started)
+
+def percentile(values: list, fraction: float) -> float:
+    return values[max(int(len(values) * fraction) - 1, 0)]
+
+async def run(mode: str, logins: int, workers: int, probe_interval: float, hashed: str) -> dict:
+    settings.PASSWORD_HASH_WORKERS = workers
+    security.shutdown_hash_pool()
+
+    lags, latencies = [], []
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(probe_interval, lags, stop))
+    await asyncio.sleep(probe_interval * 5) # Baseline samples before the storm
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login(mode, hashed, latencies) for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await prober
+    security.shutdown_hash_pool()
+
+    lags.sort()
+    latencies.sort()
+    return {
+        "mode": mode,
+        "workers": workers if mode == "pool" else None,
+        "logins": logins,
+        "logins_per_sec": round(logins / elapsed, 1),
+        "login_ms_p50": round(statistics.median(latencies) * 1000, 1),
+        "login_ms_p99": round(percentile(latencies, 0.99) * 1000, 1),
+        "loop_lag_ms_p50": round(statistics.median(lags) * 1000, 2),
+        "loop_lag_ms_p99": round(percentile(lags, 0.99) * 1000, 2),
+        "loop_lag_ms_max": round(lags[-1] * 1000, 2),
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark event-loop lag during concurrent logins")
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--mode", choices=["inline", "pool"], nargs="+", default=["inline", "pool"])
+    parser.add_argument("--workers", type=int, nargs="+", default=[settings.PASSWORD_HASH_WORKERS])
+    parser.add_argument("--probe-ms", type=float, default=5.0, help="Probe wake-up interval")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    hashed = security.get_password_hash(PASSWORD)
+    results = []
+    for mode in args.mode:
+        for workers in (args.workers if mode == "pool" else [0]):
+            results.append(await run(mode, args.logins, workers, args.probe_ms / 1000, hashed))
+            if not args.json:
+                print(results[-1])
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
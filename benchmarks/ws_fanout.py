@@ -0,0 +1,113 @@
+"""
+Fan-out benchmark for the WebSocket market data hub.
+
+Attaches N simulated clients to one symbol (each a task draining its hub
+queue, standing in for a WebSocket sender) and broadcasts stamped events.
+Reports memory per connection and the delay from broadcast to each client
+dequeuing the event.
+
+    python -m benchmarks.ws_fanout --clients 1000 10000 --events 200
+    python -m benchmarks.ws_fanout --redis   # publish through Redis (needs a running server)
+
+Without --redis, events are handed to the hub directly (publish_local), so
+the numbers isolate the hub's fan-out from Redis and socket I/O.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import tracemalloc
+from app.services.market_data import Broadcast, MarketDataHub
+
+SYMBOL = "BENCH"
+
+class LocalHub(MarketDataHub):
+    """The hub without its Redis subscription, for in-process runs."""
+
+    async def _redis_subscribe(self, symbol: str):
+        pass
+
+    async def _redis_unsubscribe(self, symbol: str):
+        pass
+
+async def client(subscriber, latencies: list, expected: int, encoding: str):
+    queue = subscriber.queue
+    received = 0
+    while received < expected:
+        item = await queue.get()
+        if isinstance(item, Broadcast):
+            # Stands in for the socket send; encodes only for the first client
+            item.frame(encoding)
+            latencies.append(time.perf_counter() - item.event["data"]["sent"])
+        received += 1
+
+async def run(num_clients: int, events: int, interval: float, use_redis: bool, queue_size: int,
+              encoding: str = "json") -> dict:
+    hub_class = MarketDataHub if use_redis else LocalHub
+    hub = hub_class(queue_size=queue_size, policy="drop")
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    subscribers = [await hub.subscribe(SYMBOL) for _ in range(num_clients)]
+    latencies = []
+    tasks = [asyncio.create_task(client(s, latencies, events, encoding)) for s in subscribers]
+    await asyncio.sleep(0)
+    per_connection = (tracemalloc.get_traced_memory()[0] - before) / num_clients
+    tracemalloc.stop()
+
+    redis = None
+    if use_redis:
+        from app.redis import get_redis
+        redis = await get_redis()
+        await asyncio.sleep(0.2) # Let the subscription settle
+
+    started = time.perf_counter()
+    for seq in range(events):
+        data = {"seq": seq, "sent": time.perf_counter(), "changes": [{"side": "bid", "price": 100.0, "qty": seq}]}
+        if redis is not None:
+            await redis.publish(f"orderbook:{SYMBOL}", json.dumps(data))
+        else:
+            hub.publish_local(SYMBOL, {"type": "orderbook", "data": data})
+        await asyncio.sleep(interval)
+    await asyncio.wait_for(asyncio.gather(*tasks), timeout=60)
+    elapsed = time.perf_counter() - started
+
+    for subscriber in subscribers:
+        await hub.unsubscribe(subscriber)
+    await hub.stop()
+
+    latencies.sort()
+    return {
+        "clients": num_clients,
+        "encoding": encoding,
+        "events": events,
+        "deliveries_per_sec": round(len(latencies) / elapsed),
+        "bytes_per_connection": round(per_connection),
+        "latency_ms_p50": round(statistics.median(latencies) * 1000, 3),
+        "latency_ms_p99": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 3),
+        "latency_ms_max": round(latencies[-1] * 1000, 3),
+        "slow_consumers": sum(s.overflows for s in subscribers),
+    }
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark WebSocket market data fan-out")
+    parser.add_argument("--clients", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--interval-ms", type=float, default=1.0, help="Pause between broadcasts")
+    parser.add_argument("--queue-size", type=int, default=1000)
+    parser.add_argument("--encoding", choices=["json", "msgpack"], default="json")
+    parser.add_argument("--redis", action="store_true", help="Publish through Redis instead of in-process")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for num_clients in args.clients:
+        results.append(await run(num_clients, args.events, args.interval_ms / 1000, args.redis, args.queue_size, args.encoding))
+        if not args.json:
+            print(results[-1])
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    asyncio.run(main())
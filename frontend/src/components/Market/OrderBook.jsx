@@ -1,29 +1,55 @@
 import { useEffect, useRef, useState } from "react";
 import { api } from "../../services/api";
 
+const MAX_ROWS = 10;
+
+// Apply an L2 level update unless a newer one for the same level was already seen.
+// Updates carry absolute quantities, so this converges even if they arrive out of order.
+const applyLevel = (levels, price, qty, seq) => {
+    const current = levels.get(price);
+    if (current && current.seq >= seq) return;
+    levels.set(price, { qty, seq });
+};
+
+const topLevels = (levels, descending) => {
+    return [...levels.entries()]
+        .filter(([, level]) => level.qty > 0)
+        .sort(([a], [b]) => (descending ? b - a : a - b))
+        .slice(0, MAX_ROWS)
+        .map(([price, level]) => ({ price, qty: level.qty }));
+};
+
 export default function OrderBook({ symbol }) {
     const [bids, setBids] = useState([]);
     const [asks, setAsks] = useState([]);
     const ws = useRef(null);
+    const book = useRef({ bids: new Map(), asks: new Map(), seq: 0 });
 
     useEffect(() => {
-        // Initial Snapshot
-        // Ideally we fetch snapshot via API or wait for WS snapshot
-        // For simplicity, let's just use WS
+        book.current = { bids: new Map(), asks: new Map(), seq: 0 };
 
-        // Connect WS
+        // Connect WS: first message is a snapshot, then incremental deltas
         ws.current = new WebSocket(`ws://localhost:8000/api/v1/ws/${symbol}`);
 
         ws.current.onmessage = (event) => {
             const message = JSON.parse(event.data);
             if (message.type === 'snapshot') {
-                setBids(message.data.bids);
-                setAsks(message.data.asks);
+                // A snapshot is the whole book: levels it omits are gone, so start from empty maps
+                const { seq, bids, asks } = message.data;
+                book.current = { bids: new Map(), asks: new Map(), seq };
+                bids.forEach(l => applyLevel(book.current.bids, l.price, l.qty, seq));
+                asks.forEach(l => applyLevel(book.current.asks, l.price, l.qty, seq));
             } else if (message.type === 'orderbook') {
-                // Full update or delta? Backend sends full depth snapshot currently
-                setBids(message.data.bids);
-                setAsks(message.data.asks);
+                const { seq, changes } = message.data;
+                // Deltas the snapshot already includes would resurrect levels it dropped
+                if (seq <= book.current.seq) return;
+                const { bids: bidLevels, asks: askLevels } = book.current;
+                changes.forEach(c => applyLevel(c.side === 'bid' ? bidLevels : askLevels, c.price, c.qty, seq));
+            } else {
+                return;
             }
+            setBids(topLevels(book.current.bids, true));
+            setAsks(topLevels(book.current.asks, false));
         };
 
         return () => {
@@ -74,7 +74,15 @@ export const api = {
             return res.json();
         },
         cancel: async (id) => {
-            // TODO: Implement cancel endpoint in backend if verified
+            const res = await fetch(`${API_URL}/orders/${id}`, {
+                method: 'DELETE',
+                headers: getHeaders()
+            });
+            if (!res.ok) {
+                const err = await res.json();
+                throw new Error(err.detail || 'Cancel failed');
+            }
+            return res.json();
         }
     }
 };